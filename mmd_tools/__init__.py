@@ -88,6 +88,17 @@ class MMDToolsAddonPreferences(bpy.types.AddonPreferences):
             soft_max=10,
             default=1.5,
             )
+    cache_folder = bpy.props.StringProperty(
+            name='Cache Folder',
+            description='Directory for caching parsed model and motion files to speed up repeated imports (disabled if empty). The entries are pickled Python objects which are loaded without checks, so use a folder only you can write to',
+            subtype='DIR_PATH',
+            )
+    cache_size = bpy.props.IntProperty(
+            name='Cache Size (MB)',
+            description='The maximum size of the cache folder, least recently used entries are removed first',
+            min=1,
+            default=1024,
+            )
 
     def draw(self, context):
         layout = self.layout
@@ -95,6 +106,8 @@ class MMDToolsAddonPreferences(bpy.types.AddonPreferences):
         layout.prop(self, "base_texture_folder")
         layout.prop(self, "dictionary_folder")
         layout.prop(self, "non_collision_threshold")
+        layout.prop(self, "cache_folder")
+        layout.prop(self, "cache_size")
 
 
 def menu_func_import(self, context):
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import pickle
+
+_digests = {}
+
+def file_digest(path, chunk_size=1<<20):
+    """ Return the hex digest of the content of the file at ``path``.
+
+    The digests are remembered by the path, size and modification time of the files, so a file is
+    read once until it is changed.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(memo_key, None)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        digest = _digests[memo_key] = h.hexdigest()
+    return digest
+
+
+class DiskCache:
+    """ A directory of pickled objects with a size limit and LRU eviction.
+
+    Entries are stored as "<kind>-<version>-<key>.cache". Entries of another version
+    of the same kind are stale and removed on the next eviction. The modification time
+    of an entry is refreshed on every hit and used as its last access time.
+
+    The entries are unpickled as they are, which can run arbitrary code, so the directory must
+    not be writable by others.
+    """
+    SUFFIX = '.cache'
+
+    def __init__(self, directory, max_size=1024*1024*1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def __entry_path(self, kind, version, key):
+        return os.path.join(self.directory, '%s-%s-%s%s'%(kind, version, key, self.SUFFIX))
+
+    def get(self, kind, version, key):
+        """ Return the cached object or None if there is no valid entry.
+        """
+        path = self.__entry_path(kind, version, key)
+        try:
+            with open(path, 'rb') as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning('Removed unreadable cache entry "%s": %s', path, e)
+            self.__remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logging.info('Loaded from cache: %s', path)
+        return obj
+
+    def put(self, kind, version, key, obj):
+        """ Store ``obj`` and evict old entries if the cache grows over the size limit.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.__entry_path(kind, version, key)
+        temp_path = '%s.%d.tmp'%(path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logging.warning('Failed to write cache entry "%s": %s', path, e)
+            self.__remove(temp_path)
+            return
+        self.evict({kind:str(version)})
+
+    def evict(self, current_versions=None):
+        """ Remove stale entries and the least recently used entries over the size limit.
+
+        @param current_versions a dict of {kind: version}, entries of another version of these kinds are removed
+        """
+        current_versions = current_versions or {}
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            kind, version = (name.split('-') + ['', ''])[:2]
+            if kind in current_versions and version != current_versions[kind]:
+                self.__remove(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.__remove(path)
+            total_size -= size
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
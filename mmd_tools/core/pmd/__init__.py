@@ -4,6 +4,9 @@ import os
 import re
 import logging
 import collections
+import mmap
+
+from mmd_tools.core.strings import StringDecoder
 
 class InvalidFileError(Exception):
     pass
@@ -15,6 +18,7 @@ class FileStream:
         self.__path = path
         self.__file_obj = file_obj
         self.__header = None
+        self.__decoder = StringDecoder('shift_jis', b'\x00')
 
     def __enter__(self):
         return self
@@ -33,6 +37,11 @@ class FileStream:
     def setHeader(self, pmx_header):
         self.__header = pmx_header
 
+    def decodeStr(self, data):
+        """ Decode a null terminated shift_jis string, repeated strings are decoded once and shared.
+        """
+        return self.__decoder.decode(data)
+
     def close(self):
         if self.__file_obj is not None:
             logging.debug('close the file("%s")', self.__path)
@@ -67,7 +76,7 @@ class  FileReadStream(FileStream):
         buf = self.__fin.read(size)
         if buf[0] == b'\xfd':
             return ''
-        return buf.split(b'\x00')[0].decode('shift_jis', errors='replace')
+        return self.decodeStr(buf)
 
     def readFloat(self):
         v, = struct.unpack('<f', self.__fin.read(4))
@@ -87,6 +96,109 @@ class  FileReadStream(FileStream):
         v, = struct.unpack('<b', self.__fin.read(1))
         return v
 
+    def tell(self):
+        return self.__fin.tell()
+
+    def seek(self, pos):
+        self.__fin.seek(pos)
+
+    def readView(self, length):
+        return self.readBytes(length)
+
+
+class MappedFileReadStream(FileStream):
+    """ FileReadStream alternative which decodes fields from a memory mapped view of the file.
+    """
+    __INT = struct.Struct('<i')
+    __UINT = struct.Struct('<I')
+    __SHORT = struct.Struct('<h')
+    __USHORT = struct.Struct('<H')
+    __FLOAT = struct.Struct('<f')
+    __BYTE = struct.Struct('<B')
+    __SBYTE = struct.Struct('<b')
+    __VECTORS = {i:struct.Struct('<'+'f'*i) for i in range(1, 5)}
+
+    def __init__(self, path, pmx_header=None):
+        with open(path, 'rb') as fin:
+            if os.fstat(fin.fileno()).st_size > 0:
+                self.__data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.__data = b''
+        self.__view = memoryview(self.__data)
+        self.__size = len(self.__data)
+        self.__pos = 0
+        FileStream.__init__(self, path, None)
+
+    def close(self):
+        if self.__view is not None:
+            logging.debug('close the file("%s")', self.path())
+            self.__view.release()
+            self.__view = None
+            if isinstance(self.__data, mmap.mmap):
+                try:
+                    self.__data.close()
+                except BufferError:
+                    pass # still referenced by decoded arrays, released on garbage collection
+            self.__data = None
+        FileStream.close(self)
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, pos):
+        self.__pos = pos
+
+    def __unpack(self, fmt):
+        v, = fmt.unpack_from(self.__view, self.__pos)
+        self.__pos += fmt.size
+        return v
+
+    # READ methods for general types
+    def readInt(self):
+        return self.__unpack(self.__INT)
+
+    def readUnsignedInt(self):
+        return self.__unpack(self.__UINT)
+
+    def readShort(self):
+        return self.__unpack(self.__SHORT)
+
+    def readUnsignedShort(self):
+        return self.__unpack(self.__USHORT)
+
+    def readStr(self, size):
+        buf = self.readBytes(size)
+        if buf[0] == b'\xfd':
+            return ''
+        return self.decodeStr(buf)
+
+    def readFloat(self):
+        return self.__unpack(self.__FLOAT)
+
+    def readVector(self, size):
+        fmt = self.__VECTORS.get(size) or struct.Struct('<'+'f'*size)
+        v = fmt.unpack_from(self.__view, self.__pos)
+        self.__pos += fmt.size
+        return v
+
+    def readByte(self):
+        return self.__unpack(self.__BYTE)
+
+    def readBytes(self, length):
+        pos = self.__pos
+        self.__pos = min(pos + length, self.__size)
+        return self.__data[pos:self.__pos]
+
+    def readView(self, length):
+        """ Same as readBytes() but returns a memoryview of the mapped file without copying.
+        """
+        pos = self.__pos
+        self.__pos = min(pos + length, self.__size)
+        return self.__view[pos:self.__pos]
+
+    def readSignedByte(self):
+        return self.__unpack(self.__SBYTE)
+
 
 class Header:
     PMD_SIGN = b'Pmd'
@@ -110,6 +222,7 @@ class Header:
         self.comment = fs.readStr(256)
 
 class Vertex:
+    __slots__ = ('position', 'normal', 'uv', 'bones', 'weight', 'enable_edge')
     def __init__(self):
         self.position = [0.0, 0.0, 0.0]
         self.normal = [1.0, 0.0, 0.0]
@@ -212,6 +325,7 @@ class IK:
             self.ik_child_bones.append(fs.readUnsignedShort())
 
 class MorphData:
+    __slots__ = ('index', 'offset')
     def __init__(self):
         self.index = 0
         self.offset = []
@@ -354,12 +468,8 @@ class Model:
         logging.info('------------------------------')
         logging.info('Load Vertices')
         logging.info('------------------------------')
-        self.vertices = []
         vert_count = fs.readUnsignedInt()
-        for i in range(vert_count):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
+        self._loadVertices(fs, vert_count)
         logging.info('the number of vetices: %d', len(self.vertices))
         logging.info('finished importing vertices.')
 
@@ -367,13 +477,8 @@ class Model:
         logging.info('------------------------------')
         logging.info(' Load Faces')
         logging.info('------------------------------')
-        self.faces = []
         face_vert_count = fs.readUnsignedInt()
-        for i in range(int(face_vert_count/3)):
-            f1 = fs.readUnsignedShort()
-            f2 = fs.readUnsignedShort()
-            f3 = fs.readUnsignedShort()
-            self.faces.append((f3, f2, f1))
+        self._loadFaces(fs, face_vert_count)
         logging.info('the number of faces: %d', len(self.faces))
         logging.info('finished importing faces.')
 
@@ -451,8 +556,7 @@ class Model:
         self.morphs = []
         morph_count = fs.readUnsignedShort()
         for i in range(morph_count):
-            morph = VertexMorph()
-            morph.load(fs)
+            morph = self._loadMorph(fs)
             self.morphs.append(morph)
             logging.info('Vertex Morph %d: %s', i, morph.name)
         logging.info('----- Loaded %d morphs', len(self.morphs))
@@ -593,8 +697,22 @@ class Model:
 
         logging.info('finished importing the model.')
 
+    def _loadVertices(self, fs, num_vertices):
+        from mmd_tools.core.pmd import bulk
+        self.vertices = bulk.read_vertices(fs, num_vertices).to_vertices()
+
+    def _loadFaces(self, fs, num_indices):
+        from mmd_tools.core.pmd import bulk
+        self.faces = list(map(tuple, bulk.read_faces(fs, num_indices).tolist()))
+
+    def _loadMorph(self, fs):
+        from mmd_tools.core.pmd import bulk
+        morph = bulk.read_morph(fs)
+        morph.data = morph.data.to_offsets(MorphData)
+        return morph
+
 def load(path):
-    with FileReadStream(path) as fs:
+    with MappedFileReadStream(path) as fs:
         logging.info('****************************************')
         logging.info(' mmd_tools.pmd module')
         logging.info('----------------------------------------')
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import logging
+import struct
+
+import numpy as np
+
+from mmd_tools.core import pmd
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx import bulk as pmx_bulk
+
+VERTEX_DTYPE = np.dtype([
+    ('position', '<f4', (3,)),
+    ('normal', '<f4', (3,)),
+    ('uv', '<f4', (2,)),
+    ('bones', '<u2', (2,)),
+    ('weight', 'u1'),
+    ('enable_edge', 'u1'),
+    ])
+
+MORPH_DATA_DTYPE = np.dtype([('index', '<u4'), ('offset', '<f4', (3,))])
+
+
+def _read_array(fs, dtype, count, what):
+    size = count * dtype.itemsize
+    buf = fs.readView(size)
+    if len(buf) < size:
+        raise struct.error('truncated %s data'%what)
+    return np.frombuffer(buf, dtype=dtype, count=count).copy()
+
+
+class VertexArrays:
+    """ Column storage of the PMD vertex section.
+    """
+    def __init__(self, data):
+        self.position = data['position']
+        self.normal = data['normal']
+        self.uv = data['uv']
+        self.bones = data['bones'].astype(np.int32)
+        self.weight = data['weight']
+        self.enable_edge = data['enable_edge']
+
+    def __len__(self):
+        return len(self.position)
+
+    def __repr__(self):
+        return '<VertexArrays count %d>'%len(self)
+
+    def to_vertices(self):
+        """ Build the equivalent list of pmd.Vertex objects.
+        """
+        Vertex = pmd.Vertex
+        vertices = []
+        with pmx_bulk._gc_paused():
+            columns = zip(map(tuple, self.position.tolist()), map(tuple, self.normal.tolist()), map(tuple, self.uv.tolist()),
+                          self.bones.tolist(), self.weight.tolist(), self.enable_edge.tolist())
+            for position, normal, uv, bones, weight, enable_edge in columns:
+                v = Vertex()
+                v.position = position
+                v.normal = normal
+                v.uv = uv
+                v.bones = bones
+                v.weight = weight
+                v.enable_edge = enable_edge
+                vertices.append(v)
+        return vertices
+
+    def to_pmx(self):
+        """ Convert to pmx vertex arrays the same way as pmd.importer converts the vertex objects.
+
+        Vertices of two different bones are BDEF2, the others are BDEF1.
+        """
+        count = len(self)
+        ret = pmx_bulk.VertexArrays(count, 0)
+        ret.co[:] = self.position
+        ret.normal[:] = self.normal
+        ret.uv[:] = self.uv
+        ret.edge_scale[:] = (self.enable_edge == 0)
+        bdef2 = self.bones[:, 0] != self.bones[:, 1]
+        ret.weight_type[:] = np.where(bdef2, pmx.BoneWeight.BDEF2, pmx.BoneWeight.BDEF1)
+        ret.bones[:, 0] = self.bones[:, 0]
+        ret.bones[:, 1] = np.where(bdef2, self.bones[:, 1], -1)
+        weight = self.weight / 100.0 # in float64 as the vertex objects were converted
+        ret.weights[:, 0] = np.where(bdef2, weight, 1.0)
+        ret.weights[:, 1] = np.where(bdef2, 1.0 - weight, 0.0)
+        return ret
+
+
+def read_vertices(fs, count):
+    return VertexArrays(_read_array(fs, VERTEX_DTYPE, count, 'vertex'))
+
+
+def read_faces(fs, count):
+    """ Decode the face section holding ``count`` vertex indices.
+
+    @return an array of shape (count//3, 3) in the same vertex order as pmd.Model.faces
+    """
+    num_faces = count // 3
+    faces = _read_array(fs, np.dtype('<u2'), num_faces*3, 'face').reshape(num_faces, 3)
+    return faces[:, ::-1].astype(np.uint32)
+
+
+def read_morph(fs):
+    """ Same as pmd.VertexMorph.load() but the data is a pmx MorphOffsetArrays.
+    """
+    morph = pmd.VertexMorph()
+    morph.name = fs.readStr(20)
+    count = fs.readUnsignedInt()
+    morph.type = fs.readByte()
+    data = _read_array(fs, MORPH_DATA_DTYPE, count, 'morph')
+    morph.data = pmx_bulk.MorphOffsetArrays(count, 3)
+    morph.data.index[:] = data['index']
+    morph.data.offset[:] = data['offset']
+    return morph
+
+
+class ColumnarModel(pmd.Model):
+    """ pmd.Model variant which keeps the bulk data in numpy arrays.
+
+    vertices is a VertexArrays, faces is an array of shape (N, 3) and the data of
+    vertex morphs are pmx MorphOffsetArrays. The other sections are the usual pmd objects.
+    """
+    def __init__(self):
+        pmd.Model.__init__(self)
+        self.vertices = VertexArrays(np.zeros(0, dtype=VERTEX_DTYPE))
+        self.faces = np.zeros((0, 3), dtype=np.uint32)
+
+    def _loadVertices(self, fs, num_vertices):
+        self.vertices = read_vertices(fs, num_vertices)
+
+    def _loadFaces(self, fs, num_indices):
+        self.faces = read_faces(fs, num_indices)
+
+    def _loadMorph(self, fs):
+        return read_morph(fs)
+
+
+def load(path):
+    """ Same as pmd.load() but returns a ColumnarModel.
+    """
+    with pmd.MappedFileReadStream(path) as fs:
+        model = ColumnarModel()
+        try:
+            model.load(fs)
+        except struct.error as e:
+            logging.error(' * Corrupted file: %s', e)
+        return model
@@ -11,6 +11,8 @@ import mathutils
 import mmd_tools.core.pmx.importer as import_pmx
 import mmd_tools.core.pmd as pmd
 import mmd_tools.core.pmx as pmx
+from mmd_tools.core.pmd import bulk as pmd_bulk
+from mmd_tools.core.pmx import bulk as pmx_bulk
 
 from math import radians
 
@@ -22,9 +24,13 @@ class PMDImporter:
 
 def import_pmd_to_pmx(filepath):
     """ Import pmd file
+
+    The vertex, face and vertex morph data are converted as arrays. PMXImporter works on
+    pmx objects, so the result is still converted with ColumnarModel.to_model(), which
+    takes most of the time of the conversion.
     """
     target_path = filepath
-    pmd_model = pmd.load(target_path)
+    pmd_model = pmd_bulk.load(target_path)
 
 
     logging.info('')
@@ -35,7 +41,7 @@ def import_pmd_to_pmx(filepath):
     logging.info('              by the mmd_tools.pmd modlue.')
     logging.info('')
 
-    pmx_model = pmx.Model()
+    pmx_model = pmx_bulk.ColumnarModel()
     pmx_model.filepath = filepath
 
     pmx_model.name = pmd_model.name
@@ -43,42 +49,19 @@ def import_pmd_to_pmx(filepath):
     pmx_model.comment = pmd_model.comment
     pmx_model.comment_e = pmd_model.comment_e
 
-    pmx_model.vertices = []
-
     # convert vertices
     logging.info('')
     logging.info('------------------------------')
     logging.info(' Convert Vertices')
     logging.info('------------------------------')
-    for v in pmd_model.vertices:
-        pmx_v = pmx.Vertex()
-        pmx_v.co = v.position
-        pmx_v.normal = v.normal
-        pmx_v.uv = v.uv
-        pmx_v.additional_uvs= []
-        pmx_v.edge_scale = 1 if v.enable_edge == 0 else 0
-
-        weight = pmx.BoneWeight()
-        if v.bones[0] != v.bones[1]:
-            weight.type = pmx.BoneWeight.BDEF2
-            weight.bones = v.bones
-            weight.weights = [float(v.weight)/100.0]
-        else:
-            weight.type = pmx.BoneWeight.BDEF1
-            weight.bones = [v.bones[0]]
-            weight.weights = [float(v.weight)/100.0]
-
-        pmx_v.weight = weight
-
-        pmx_model.vertices.append(pmx_v)
+    pmx_model.vertices = pmd_model.vertices.to_pmx()
     logging.info('----- Converted %d vertices', len(pmx_model.vertices))
 
     logging.info('')
     logging.info('------------------------------')
     logging.info(' Convert Faces')
     logging.info('------------------------------')
-    for f in pmd_model.faces:
-        pmx_model.faces.append(f)
+    pmx_model.faces = pmd_model.faces
     logging.info('----- Converted %d faces', len(pmx_model.faces))
 
     knee_bones = []
@@ -252,9 +235,7 @@ def import_pmd_to_pmx(filepath):
     else:
         if len(t) > 1:
             logging.warning('Found two or more base morphs.')
-        vertex_map = []
-        for i in t[0].data:
-            vertex_map.append(i.index)
+        vertex_map = t[0].data.index
 
         for morph in pmd_model.morphs:
             logging.debug('Vertex Morph: %s', morph.name)
@@ -262,11 +243,9 @@ def import_pmd_to_pmx(filepath):
                 morph_index_map.append(-1)
                 continue
             pmx_morph = pmx.VertexMorph(morph.name, morph.name_e, morph.type)
-            for i in morph.data:
-                mo = pmx.VertexMorphOffset()
-                mo.index = vertex_map[i.index]
-                mo.offset = i.offset
-                pmx_morph.offsets.append(mo)
+            pmx_morph.offsets = pmx_bulk.MorphOffsetArrays(len(morph.data), 3)
+            pmx_morph.offsets.index[:] = vertex_map[morph.data.index]
+            pmx_morph.offsets.offset[:] = morph.data.offset
             morph_index_map.append(len(pmx_model.morphs))
             pmx_model.morphs.append(pmx_morph)
     logging.info('----- Converted %d morphs', len(pmx_model.morphs))
@@ -359,4 +338,4 @@ def import_pmd_to_pmx(filepath):
     logging.info(' mmd_tools.import_pmd module')
     logging.info('****************************************')
 
-    return pmx_model
+    return pmx_model.to_model()
@@ -2,6 +2,10 @@
 import struct
 import os
 import logging
+import mmap
+import collections
+
+from mmd_tools.core.strings import StringDecoder
 
 class InvalidFileError(Exception):
     pass
@@ -13,6 +17,7 @@ class FileStream:
         self.__path = path
         self.__file_obj = file_obj
         self.__header = pmx_header
+        self.__decoder = None
 
     def __enter__(self):
         return self
@@ -31,6 +36,14 @@ class FileStream:
     def setHeader(self, pmx_header):
         self.__header = pmx_header
 
+    def decodeStr(self, data):
+        """ Decode a byte string by the encoding of the header, repeated strings are decoded once and shared.
+        """
+        charset = self.header().encoding.charset
+        if self.__decoder is None or self.__decoder.encoding != charset:
+            self.__decoder = StringDecoder(charset)
+        return self.__decoder.decode(data)
+
     def close(self):
         if self.__file_obj is not None:
             logging.debug('close the file("%s")', self.__path)
@@ -42,6 +55,15 @@ class FileReadStream(FileStream):
         self.__fin = open(path, 'rb')
         FileStream.__init__(self, path, self.__fin, pmx_header)
 
+    def tell(self):
+        return self.__fin.tell()
+
+    def seek(self, pos):
+        self.__fin.seek(pos)
+
+    def skip(self, length):
+        self.__fin.seek(length, os.SEEK_CUR)
+
     def __readIndex(self, size, typedict):
         index = None
         if size in typedict :
@@ -92,7 +114,7 @@ class FileReadStream(FileStream):
     def readStr(self):
         length = self.readInt()
         buf, = struct.unpack('<%ds'%length, self.__fin.read(length))
-        return str(buf, self.header().encoding.charset, errors='replace')
+        return self.decodeStr(buf)
 
     def readFloat(self):
         v, = struct.unpack('<f', self.__fin.read(4))
@@ -112,23 +134,194 @@ class FileReadStream(FileStream):
         v, = struct.unpack('<b', self.__fin.read(1))
         return v
 
+    def readView(self, length):
+        return self.readBytes(length)
+
+class MappedFileReadStream(FileStream):
+    """ FileReadStream alternative which decodes fields from a memory mapped view of the file.
+    """
+    __INT = struct.Struct('<i')
+    __SHORT = struct.Struct('<h')
+    __USHORT = struct.Struct('<H')
+    __FLOAT = struct.Struct('<f')
+    __BYTE = struct.Struct('<B')
+    __SBYTE = struct.Struct('<b')
+    __SIGNED_INDEX = {1:struct.Struct('<b'), 2:struct.Struct('<h'), 4:struct.Struct('<i')}
+    __UNSIGNED_INDEX = {1:struct.Struct('<B'), 2:struct.Struct('<H'), 4:struct.Struct('<I')}
+    __VECTORS = {i:struct.Struct('<'+'f'*i) for i in range(1, 5)}
+
+    def __init__(self, path, pmx_header=None):
+        with open(path, 'rb') as fin:
+            if os.fstat(fin.fileno()).st_size > 0:
+                self.__data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.__data = b''
+        self.__view = memoryview(self.__data)
+        self.__size = len(self.__data)
+        self.__pos = 0
+        self.__vertex_index = self.__bone_index = self.__texture_index = None
+        self.__morph_index = self.__rigid_index = self.__material_index = None
+        FileStream.__init__(self, path, None, None)
+        if pmx_header is not None:
+            self.setHeader(pmx_header)
+
+    def close(self):
+        if self.__view is not None:
+            logging.debug('close the file("%s")', self.path())
+            self.__view.release()
+            self.__view = None
+            if isinstance(self.__data, mmap.mmap):
+                try:
+                    self.__data.close()
+                except BufferError:
+                    pass # still referenced by decoded arrays, released on garbage collection
+            self.__data = None
+        FileStream.close(self)
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, pos):
+        self.__pos = pos
+
+    def skip(self, length):
+        self.__pos += length
+
+    def __unpack(self, fmt):
+        v, = fmt.unpack_from(self.__view, self.__pos)
+        self.__pos += fmt.size
+        return v
+
+    def setHeader(self, pmx_header):
+        FileStream.setHeader(self, pmx_header)
+        signed, unsigned = self.__SIGNED_INDEX, self.__UNSIGNED_INDEX
+        self.__vertex_index = unsigned.get(pmx_header.vertex_index_size)
+        self.__bone_index = signed.get(pmx_header.bone_index_size)
+        self.__texture_index = signed.get(pmx_header.texture_index_size)
+        self.__morph_index = signed.get(pmx_header.morph_index_size)
+        self.__rigid_index = signed.get(pmx_header.rigid_index_size)
+        self.__material_index = signed.get(pmx_header.material_index_size)
+
+    def __invalidIndex(self, size_attr):
+        raise ValueError('invalid data size %s'%str(getattr(self.header(), size_attr)))
+
+    # READ methods for indexes
+    def readVertexIndex(self):
+        return self.__unpack(self.__vertex_index or self.__invalidIndex('vertex_index_size'))
+
+    def readBoneIndex(self):
+        return self.__unpack(self.__bone_index or self.__invalidIndex('bone_index_size'))
+
+    def readTextureIndex(self):
+        return self.__unpack(self.__texture_index or self.__invalidIndex('texture_index_size'))
+
+    def readMorphIndex(self):
+        return self.__unpack(self.__morph_index or self.__invalidIndex('morph_index_size'))
+
+    def readRigidIndex(self):
+        return self.__unpack(self.__rigid_index or self.__invalidIndex('rigid_index_size'))
+
+    def readMaterialIndex(self):
+        return self.__unpack(self.__material_index or self.__invalidIndex('material_index_size'))
+
+    # READ methods for general types
+    def readInt(self):
+        return self.__unpack(self.__INT)
+
+    def readShort(self):
+        return self.__unpack(self.__SHORT)
+
+    def readUnsignedShort(self):
+        return self.__unpack(self.__USHORT)
+
+    def readStr(self):
+        length = self.readInt()
+        if length < 0 or self.__pos + length > self.__size:
+            raise struct.error('unpack requires a buffer of %d bytes'%length)
+        return self.decodeStr(self.readBytes(length))
+
+    def readFloat(self):
+        return self.__unpack(self.__FLOAT)
+
+    def readVector(self, size):
+        fmt = self.__VECTORS.get(size) or struct.Struct('<'+'f'*size)
+        v = fmt.unpack_from(self.__view, self.__pos)
+        self.__pos += fmt.size
+        return v
+
+    def readByte(self):
+        return self.__unpack(self.__BYTE)
+
+    def readBytes(self, length):
+        pos = self.__pos
+        self.__pos = min(pos + length, self.__size)
+        return self.__data[pos:self.__pos]
+
+    def readView(self, length):
+        """ Same as readBytes() but returns a memoryview of the mapped file without copying.
+        """
+        pos = self.__pos
+        self.__pos = min(pos + length, self.__size)
+        return self.__view[pos:self.__pos]
+
+    def readSignedByte(self):
+        return self.__unpack(self.__SBYTE)
+
 class FileWriteStream(FileStream):
+    """ Write stream for a pmx file.
+
+    The data is written to a temporary file next to ``path`` which replaces ``path`` when the
+    stream is closed, so an interrupted export never leaves a truncated file behind.
+    """
+    __INT = struct.Struct('<i')
+    __SHORT = struct.Struct('<h')
+    __USHORT = struct.Struct('<H')
+    __FLOAT = struct.Struct('<f')
+    __BYTE = struct.Struct('<B')
+    __SBYTE = struct.Struct('<b')
+    __SIGNED_INDEX = {1:struct.Struct('<b'), 2:struct.Struct('<h'), 4:struct.Struct('<i')}
+    __UNSIGNED_INDEX = {1:struct.Struct('<B'), 2:struct.Struct('<H'), 4:struct.Struct('<I')}
+    __VECTORS = {i:struct.Struct('<'+'f'*i) for i in range(1, 5)}
+
     def __init__(self, path, pmx_header=None):
-        self.__fout = open(path, 'wb')
+        self.__temp_path = '%s.%d.tmp'%(path, os.getpid())
+        self.__fout = open(self.__temp_path, 'wb')
         FileStream.__init__(self, path, self.__fout, pmx_header)
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def close(self):
+        """ Finish writing and move the written file to the target path.
+        """
+        if self.__fout is not None:
+            FileStream.close(self)
+            self.__fout = None
+            os.replace(self.__temp_path, self.path())
+
+    def discard(self):
+        """ Stop writing and remove the temporary file. The target path is left untouched.
+        """
+        if self.__fout is not None:
+            FileStream.close(self)
+            self.__fout = None
+            os.remove(self.__temp_path)
+
     def __writeIndex(self, index, size, typedict):
         if size in typedict :
-            self.__fout.write(struct.pack(typedict[size], int(index)))
+            self.__fout.write(typedict[size].pack(int(index)))
         else:
             raise ValueError('invalid data size %s'%str(size))
         return
 
     def __writeSignedIndex(self, index, size):
-        return self.__writeIndex(index, size, { 1 :"<b", 2 :"<h", 4 :"<i"})
+        return self.__writeIndex(index, size, self.__SIGNED_INDEX)
 
     def __writeUnsignedIndex(self, index, size):
-        return self.__writeIndex(index, size, { 1 :"<B", 2 :"<H", 4 :"<I"})
+        return self.__writeIndex(index, size, self.__UNSIGNED_INDEX)
 
     # WRITE methods for indexes
     def writeVertexIndex(self, index):
@@ -151,13 +344,13 @@ class FileWriteStream(FileStream):
 
 
     def writeInt(self, v):
-        self.__fout.write(struct.pack('<i', int(v)))
+        self.__fout.write(self.__INT.pack(int(v)))
 
     def writeShort(self, v):
-        self.__fout.write(struct.pack('<h', int(v)))
+        self.__fout.write(self.__SHORT.pack(int(v)))
 
     def writeUnsignedShort(self, v):
-        self.__fout.write(struct.pack('<H', int(v)))
+        self.__fout.write(self.__USHORT.pack(int(v)))
 
     def writeStr(self, v):
         data = v.encode(self.header().encoding.charset)
@@ -165,19 +358,20 @@ class FileWriteStream(FileStream):
         self.__fout.write(data)
 
     def writeFloat(self, v):
-        self.__fout.write(struct.pack('<f', float(v)))
+        self.__fout.write(self.__FLOAT.pack(float(v)))
 
     def writeVector(self, v):
-        self.__fout.write(struct.pack('<'+'f'*len(v), *v))
+        fmt = self.__VECTORS.get(len(v)) or struct.Struct('<'+'f'*len(v))
+        self.__fout.write(fmt.pack(*v))
 
     def writeByte(self, v):
-        self.__fout.write(struct.pack('<B', int(v)))
+        self.__fout.write(self.__BYTE.pack(int(v)))
 
     def writeBytes(self, v):
         self.__fout.write(v)
 
     def writeSignedByte(self, v):
-        self.__fout.write(struct.pack('<b', int(v)))
+        self.__fout.write(self.__SBYTE.pack(int(v)))
 
 class Encoding:
     _MAP = [
@@ -315,6 +509,12 @@ class Header:
             self.rigid_index_size,
             )
 
+# the data sections of a pmx file in the stored order
+SECTIONS = ('vertices', 'faces', 'textures', 'materials', 'bones', 'morphs', 'display', 'rigids', 'joints')
+
+# byte offset of the first element and the number of elements of a data section
+Section = collections.namedtuple('Section', 'name offset count')
+
 class Model:
     def __init__(self):
         self.filepath = ''
@@ -347,7 +547,13 @@ class Model:
         self.rigids = []
         self.joints = []
 
-    def load(self, fs):
+    def load(self, fs, sections=None):
+        if sections is None:
+            sections = SECTIONS
+        remaining = set(sections)
+        if not remaining.issubset(SECTIONS):
+            raise ValueError('unknown sections %s'%str(sorted(remaining.difference(SECTIONS))))
+
         self.filepath = fs.path()
         self.header = fs.header()
 
@@ -362,23 +568,46 @@ class Model:
         logging.info('Comment:%s', self.comment)
         logging.info('Comment(english):%s', self.comment_e)
 
+        loaders = {
+            'vertices': self._loadVertices,
+            'faces': self._loadFaces,
+            'textures': self._loadTextures,
+            'materials': self._loadMaterials,
+            'bones': self._loadBones,
+            'morphs': self._loadMorphs,
+            'display': self._loadDisplay,
+            'rigids': self._loadRigids,
+            'joints': self._loadJoints,
+            }
+        num_textures = 0
+        for name in SECTIONS:
+            if not remaining:
+                break
+            count = fs.readInt()
+            if name == 'textures':
+                num_textures = count
+            if name not in remaining:
+                _skipSection(fs, name, count)
+            elif name == 'materials':
+                loaders[name](fs, count, num_textures)
+            else:
+                loaders[name](fs, count)
+            remaining.discard(name)
+
+    def _loadVertices(self, fs, num_vertices):
+        from mmd_tools.core.pmx import bulk
         logging.info('')
         logging.info('------------------------------')
         logging.info('Load Vertices')
         logging.info('------------------------------')
-        num_vertices = fs.readInt()
-        self.vertices = []
-        for i in range(num_vertices):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
+        self.vertices = bulk.read_vertices(fs, num_vertices).to_vertices()
         logging.info('----- Loaded %d vertices', len(self.vertices))
 
+    def _loadFaces(self, fs, num_faces):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Faces')
         logging.info('------------------------------')
-        num_faces = fs.readInt()
         self.faces = []
         for i in range(int(num_faces/3)):
             f1 = fs.readVertexIndex()
@@ -387,11 +616,11 @@ class Model:
             self.faces.append((f3, f2, f1))
         logging.info(' Load %d faces', len(self.faces))
 
+    def _loadTextures(self, fs, num_textures):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Textures')
         logging.info('------------------------------')
-        num_textures = fs.readInt()
         self.textures = []
         for i in range(num_textures):
             t = Texture()
@@ -400,11 +629,11 @@ class Model:
             logging.info('Texture %d: %s', i, t.path)
         logging.info(' ----- Loaded %d textures', len(self.textures))
 
+    def _loadMaterials(self, fs, num_materials, num_textures):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Materials')
         logging.info('------------------------------')
-        num_materials = fs.readInt()
         self.materials = []
         for i in range(num_materials):
             m = Material()
@@ -439,11 +668,11 @@ class Model:
 
         logging.info('----- Loaded %d  materials.', len(self.materials))
 
+    def _loadBones(self, fs, num_bones):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Bones')
         logging.info('------------------------------')
-        num_bones = fs.readInt()
         self.bones = []
         for i in range(num_bones):
             b = Bone()
@@ -473,28 +702,26 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d bones.', len(self.bones))
 
+    def _loadMorphs(self, fs, num_morph):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Morphs')
         logging.info('------------------------------')
-        num_morph = fs.readInt()
-        self.morphs = []
+        from mmd_tools.core.pmx import bulk
+        self.morphs = bulk.read_morphs(fs, num_morph, as_objects=True)
         display_categories = {0: 'System', 1: 'Eyebrow', 2: 'Eye', 3: 'Mouth', 4: 'Other'}
-        for i in range(num_morph):
-            m = Morph.create(fs)
-            self.morphs.append(m)
-
+        for i, m in enumerate(self.morphs):
             logging.info('%s %d: %s', m.__class__.__name__, i, m.name)
             logging.debug('  Name(english): %s', m.name_e)
             logging.debug('  Category: %s (%d)', display_categories.get(m.category, '#Invalid'), m.category)
             logging.debug('')
         logging.info('----- Loaded %d morphs.', len(self.morphs))
 
+    def _loadDisplay(self, fs, num_disp):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Display Items')
         logging.info('------------------------------')
-        num_disp = fs.readInt()
         self.display = []
         for i in range(num_disp):
             d = Display()
@@ -506,11 +733,11 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d display items.', len(self.display))
 
+    def _loadRigids(self, fs, num_rigid):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Rigid Bodies')
         logging.info('------------------------------')
-        num_rigid = fs.readInt()
         self.rigids = []
         rigid_types = {0: 'Sphere', 1: 'Box', 2: 'Capsule'}
         rigid_modes = {0: 'Static', 1: 'Dynamic', 2: 'Dynamic(track to bone)'}
@@ -535,11 +762,11 @@ class Model:
 
         logging.info('----- Loaded %d rigid bodies.', len(self.rigids))
 
+    def _loadJoints(self, fs, num_joints):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Joints')
         logging.info('------------------------------')
-        num_joints = fs.readInt()
         self.joints = []
         for i in range(num_joints):
             j = Joint()
@@ -561,6 +788,7 @@ class Model:
         logging.info('----- Loaded %d joints.', len(self.joints))
 
     def save(self, fs):
+        from mmd_tools.core.pmx import bulk
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
@@ -577,17 +805,11 @@ comment(english):
 ''', self.name, self.name_e, self.comment, self.comment_e)
 
         logging.info('exporting vertices... %d', len(self.vertices))
-        fs.writeInt(len(self.vertices))
-        for i in self.vertices:
-            i.save(fs)
+        bulk.write_vertices(fs, self.vertices)
         logging.info('finished exporting vertices.')
 
         logging.info('exporting faces... %d', len(self.faces))
-        fs.writeInt(len(self.faces)*3)
-        for f3, f2, f1 in self.faces:
-            fs.writeVertexIndex(f1)
-            fs.writeVertexIndex(f2)
-            fs.writeVertexIndex(f3)
+        bulk.write_faces(fs, self.faces)
         logging.info('finished exporting faces.')
 
         logging.info('exporting textures... %d', len(self.textures))
@@ -611,7 +833,7 @@ comment(english):
         logging.info('exporting morphs... %d', len(self.morphs))
         fs.writeInt(len(self.morphs))
         for i in self.morphs:
-            i.save(fs)
+            bulk.write_morph(fs, i)
         logging.info('finished exporting morphs.')
 
         logging.info('exporting display items... %d', len(self.display))
@@ -644,6 +866,7 @@ comment(english):
             )
 
 class Vertex:
+    __slots__ = ('co', 'normal', 'uv', 'additional_uvs', 'weight', 'edge_scale')
     def __init__(self):
         self.co = [0.0, 0.0, 0.0]
         self.normal = [0.0, 0.0, 0.0]
@@ -685,6 +908,7 @@ class Vertex:
         fs.writeFloat(self.edge_scale)
 
 class BoneWeightSDEF:
+    __slots__ = ('weight', 'c', 'r0', 'r1')
     def __init__(self, weight=0, c=None, r0=None, r1=None):
         self.weight = weight
         self.c = c
@@ -692,6 +916,7 @@ class BoneWeightSDEF:
         self.r1 = r1
 
 class BoneWeight:
+    __slots__ = ('bones', 'weights', 'type')
     BDEF1 = 0
     BDEF2 = 1
     BDEF4 = 2
@@ -805,6 +1030,10 @@ class SharedTexture(Texture):
         self.prefix = ''
 
 class Material:
+    __slots__ = ('name', 'name_e', 'diffuse', 'specular', 'shininess', 'ambient', 'is_double_sided',
+                 'enabled_drop_shadow', 'enabled_self_shadow_map', 'enabled_self_shadow', 'enabled_toon_edge',
+                 'edge_color', 'edge_size', 'texture', 'sphere_texture', 'sphere_texture_mode',
+                 'is_shared_toon_texture', 'toon_texture', 'comment', 'vertex_count')
     SPHERE_MODE_OFF = 0
     SPHERE_MODE_MULT = 1
     SPHERE_MODE_ADD = 2
@@ -929,6 +1158,10 @@ class Material:
 
 
 class Bone:
+    __slots__ = ('name', 'name_e', 'location', 'parent', 'transform_order', 'displayConnection',
+                 'isRotatable', 'isMovable', 'visible', 'isControllable', 'isIK', 'hasAdditionalRotate',
+                 'hasAdditionalLocation', 'additionalTransform', 'axis', 'localCoordinate', 'transAfterPhis',
+                 'externalTransKey', 'target', 'loopCount', 'rotationConstraint', 'ik_links')
     def __init__(self):
         self.name = ''
         self.name_e = ''
@@ -1101,6 +1334,7 @@ class Bone:
 
 
 class IKLink:
+    __slots__ = ('target', 'minimumAngle', 'maximumAngle')
     def __init__(self):
         self.target = None
         self.maximumAngle = None
@@ -1199,6 +1433,7 @@ class VertexMorph(Morph):
             self.offsets.append(t)
 
 class VertexMorphOffset:
+    __slots__ = ('index', 'offset')
     def __init__(self):
         self.index = 0
         self.offset = []
@@ -1228,6 +1463,7 @@ class UVMorph(Morph):
             self.offsets.append(t)
 
 class UVMorphOffset:
+    __slots__ = ('index', 'offset')
     def __init__(self):
         self.index = 0
         self.offset = []
@@ -1256,6 +1492,7 @@ class BoneMorph(Morph):
             self.offsets.append(t)
 
 class BoneMorphOffset:
+    __slots__ = ('index', 'location_offset', 'rotation_offset')
     def __init__(self):
         self.index = None
         self.location_offset = []
@@ -1289,6 +1526,9 @@ class MaterialMorph(Morph):
             self.offsets.append(t)
 
 class MaterialMorphOffset:
+    __slots__ = ('index', 'offset_type', 'diffuse_offset', 'specular_offset', 'shininess_offset',
+                 'ambient_offset', 'edge_color_offset', 'edge_size_offset', 'texture_factor',
+                 'sphere_texture_factor', 'toon_texture_factor')
     TYPE_MULT = 0
     TYPE_ADD = 1
 
@@ -1347,6 +1587,7 @@ class GroupMorph(Morph):
             self.offsets.append(t)
 
 class GroupMorphOffset:
+    __slots__ = ('morph', 'factor')
     def __init__(self):
         self.morph = None
         self.factor = 0.0
@@ -1411,6 +1652,9 @@ class Display:
                 raise Exception('invalid value.')
 
 class Rigid:
+    __slots__ = ('name', 'name_e', 'bone', 'collision_group_number', 'collision_group_mask', 'type', 'size',
+                 'location', 'rotation', 'mass', 'velocity_attenuation', 'rotation_attenuation', 'bounce',
+                 'friction', 'mode')
     TYPE_SPHERE = 0
     TYPE_BOX = 1
     TYPE_CAPSULE = 2
@@ -1500,6 +1744,9 @@ class Rigid:
         fs.writeSignedByte(self.mode)
 
 class Joint:
+    __slots__ = ('name', 'name_e', 'mode', 'src_rigid', 'dest_rigid', 'location', 'rotation',
+                 'maximum_location', 'minimum_location', 'maximum_rotation', 'minimum_rotation',
+                 'spring_constant', 'spring_rotation_constant')
     MODE_SPRING6DOF = 0
     def __init__(self):
         self.name = ''
@@ -1586,8 +1833,131 @@ class Joint:
 
 
 
-def load(path):
-    with FileReadStream(path) as fs:
+def _skipStr(fs):
+    fs.skip(fs.readInt())
+
+def _skipMaterial(fs):
+    header = fs.header()
+    _skipStr(fs)
+    _skipStr(fs)
+    fs.skip(65 + 2*header.texture_index_size + 1)
+    is_shared_toon_texture = fs.readSignedByte()
+    fs.skip(1 if is_shared_toon_texture else header.texture_index_size)
+    _skipStr(fs)
+    fs.skip(4)
+
+def _skipBone(fs):
+    bi = fs.header().bone_index_size
+    _skipStr(fs)
+    _skipStr(fs)
+    fs.skip(12 + bi + 4)
+    flags = fs.readShort()
+    size = bi if flags & 0x0001 else 12
+    if flags & 0x0300:
+        size += bi + 4
+    if flags & 0x0400:
+        size += 12
+    if flags & 0x0800:
+        size += 24
+    if flags & 0x2000:
+        size += 4
+    fs.skip(size)
+    if flags & 0x0020:
+        fs.skip(bi + 8)
+        for i in range(fs.readInt()):
+            fs.skip(bi)
+            if fs.readByte() == 1:
+                fs.skip(24)
+
+def _skipMorph(fs):
+    header = fs.header()
+    vi, bi = header.vertex_index_size, header.bone_index_size
+    offset_sizes = {
+        0: header.morph_index_size + 4,
+        1: vi + 12,
+        2: bi + 28,
+        3: vi + 16,
+        4: vi + 16,
+        5: vi + 16,
+        6: vi + 16,
+        7: vi + 16,
+        8: header.material_index_size + 113,
+        }
+    _skipStr(fs)
+    _skipStr(fs)
+    fs.skip(1)
+    type_index = fs.readSignedByte()
+    if type_index not in offset_sizes:
+        raise ValueError('invalid morph type %s'%str(type_index))
+    fs.skip(fs.readInt() * offset_sizes[type_index])
+
+def _skipDisplay(fs):
+    header = fs.header()
+    _skipStr(fs)
+    _skipStr(fs)
+    fs.skip(1)
+    for i in range(fs.readInt()):
+        disp_type = fs.readByte()
+        if disp_type == 0:
+            fs.skip(header.bone_index_size)
+        elif disp_type == 1:
+            fs.skip(header.morph_index_size)
+        else:
+            raise Exception('invalid value.')
+
+def _skipRigid(fs):
+    _skipStr(fs)
+    _skipStr(fs)
+    fs.skip(fs.header().bone_index_size + 61)
+
+def _skipJoint(fs):
+    _skipStr(fs)
+    _skipStr(fs)
+    fs.skip(1 + 2*fs.header().rigid_index_size + 96)
+
+def _skipSection(fs, name, count):
+    """ Move past the elements of a data section. The element count has been read already.
+    """
+    if name == 'vertices':
+        from mmd_tools.core.pmx import bulk
+        bulk.skip_vertices(fs, count)
+    elif name == 'faces':
+        fs.skip(count * fs.header().vertex_index_size)
+    else:
+        skip_element = {
+            'textures': _skipStr,
+            'materials': _skipMaterial,
+            'bones': _skipBone,
+            'morphs': _skipMorph,
+            'display': _skipDisplay,
+            'rigids': _skipRigid,
+            'joints': _skipJoint,
+            }[name]
+        for i in range(count):
+            skip_element(fs)
+
+def scan(path):
+    """ Build the table of contents of a pmx file without decoding its elements.
+
+    @return (Header, list of Section). The count of 'faces' is the number of triangles.
+    """
+    with MappedFileReadStream(path) as fs:
+        header = Header()
+        header.load(fs)
+        fs.setHeader(header)
+        for i in range(4): # model name, english name, comment, english comment
+            _skipStr(fs)
+        sections = []
+        for name in SECTIONS:
+            count = fs.readInt()
+            sections.append(Section(name, fs.tell(), count//3 if name == 'faces' else count))
+            _skipSection(fs, name, count)
+        return header, sections
+
+def load(path, sections=None):
+    """ Load a pmx file. Only the data sections listed in ``sections`` are decoded if specified.
+    """
+    with MappedFileReadStream(path) as fs:
         logging.info('****************************************')
         logging.info(' mmd_tools.pmx module')
         logging.info('----------------------------------------')
@@ -1599,7 +1969,7 @@ def load(path):
         fs.setHeader(header)
         model = Model()
         try:
-            model.load(fs)
+            model.load(fs, sections)
         except struct.error as e:
             logging.error(' * Corrupted file: %s', e)
             #raise
@@ -0,0 +1,766 @@
+# -*- coding: utf-8 -*-
+import gc
+import logging
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
+
+import numpy as np
+
+from mmd_tools.core import pmx
+
+_SIGNED_INDEX = {1:'<i1', 2:'<i2', 4:'<i4'}
+_UNSIGNED_INDEX = {1:'<u1', 2:'<u2', 4:'<u4'}
+
+def _gather(buf, starts, dtype, width):
+    """ Gather ``width`` items of ``dtype`` located at each byte offset of ``starts``.
+    """
+    dtype = np.dtype(dtype)
+    size = dtype.itemsize
+    out = np.empty((len(starts), width), dtype=dtype)
+    if len(starts) < 1:
+        return out
+    cols = np.arange(width)
+    align = starts % size
+    alignments = np.unique(align)
+    for a in alignments:
+        view = np.frombuffer(buf, dtype, count=(len(buf)-a)//size, offset=a)
+        if len(alignments) == 1:
+            out[:] = view[((starts - a)//size)[:, None] + cols]
+        else:
+            sel = np.flatnonzero(align == a)
+            out[sel] = view[((starts[sel] - a)//size)[:, None] + cols]
+    return out
+
+
+def _fill(out, rows):
+    """ Fill ``out`` with the values of an iterable of equally sized rows.
+    """
+    out[:] = np.fromiter(chain.from_iterable(rows), dtype=out.dtype, count=out.size).reshape(out.shape)
+
+
+@contextmanager
+def _gc_paused():
+    """ Pause the cyclic garbage collector while building large amounts of records.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class VertexArrays:
+    """ Column storage of the PMX vertex section.
+
+    weights are stored per bone, so BDEF2/SDEF vertices keep (w, 1-w) and
+    BDEF1 vertices keep (1, 0, 0, 0). Unused bone slots are -1.
+    """
+    def __init__(self, count=0, additional_uvs=0):
+        self.co = np.zeros((count, 3), dtype=np.float32)
+        self.normal = np.zeros((count, 3), dtype=np.float32)
+        self.uv = np.zeros((count, 2), dtype=np.float32)
+        self.additional_uvs = np.zeros((count, additional_uvs, 4), dtype=np.float32)
+        self.weight_type = np.zeros(count, dtype=np.uint8)
+        self.bones = np.full((count, 4), -1, dtype=np.int32)
+        self.weights = np.zeros((count, 4), dtype=np.float32)
+        self.sdef_c = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r0 = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r1 = np.zeros((count, 3), dtype=np.float32)
+        self.edge_scale = np.ones(count, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.co)
+
+    def __repr__(self):
+        return '<VertexArrays count %d, additional_uvs %d>'%(len(self), self.additional_uvs.shape[1])
+
+    @classmethod
+    def from_vertices(cls, vertices, additional_uvs=None):
+        if additional_uvs is None:
+            additional_uvs = max((len(v.additional_uvs) for v in vertices), default=0)
+        count = len(vertices)
+        ret = cls(count, additional_uvs)
+        if count < 1:
+            return ret
+        _fill(ret.co, (v.co for v in vertices))
+        _fill(ret.normal, (v.normal for v in vertices))
+        _fill(ret.uv, (v.uv for v in vertices))
+        ret.edge_scale[:] = [v.edge_scale for v in vertices]
+        if additional_uvs > 0:
+            zeros = [(0, 0, 0, 0)] * additional_uvs
+            _fill(ret.additional_uvs, (chain.from_iterable((v.additional_uvs[:additional_uvs] + zeros)[:additional_uvs]) for v in vertices))
+
+        BoneWeight = pmx.BoneWeight
+        types, bones, weights, sdef_index, sdef = [], [], [], [], []
+        with _gc_paused():
+            for i, v in enumerate(vertices):
+                w = v.weight
+                t = w.type
+                if t == BoneWeight.BDEF1:
+                    bones.append((w.bones[0], -1, -1, -1))
+                    weights.append((1.0, 0.0, 0.0, 0.0))
+                elif t == BoneWeight.BDEF2:
+                    bones.append((w.bones[0], w.bones[1], -1, -1))
+                    weights.append((w.weights[0], 1.0-w.weights[0], 0.0, 0.0))
+                elif t == BoneWeight.BDEF4:
+                    bones.append(tuple(w.bones[:4]))
+                    weights.append(tuple(w.weights[:4]))
+                elif t == BoneWeight.SDEF:
+                    s = w.weights
+                    bones.append((w.bones[0], w.bones[1], -1, -1))
+                    weights.append((s.weight, 1.0-s.weight, 0.0, 0.0))
+                    sdef_index.append(i)
+                    sdef.append(tuple(s.c) + tuple(s.r0) + tuple(s.r1))
+                else:
+                    raise ValueError('invalid weight type %s'%str(t))
+                types.append(t)
+        ret.weight_type[:] = types
+        _fill(ret.bones, bones)
+        _fill(ret.weights, weights)
+        if sdef_index:
+            sdef = np.array(sdef, dtype=np.float32)
+            ret.sdef_c[sdef_index] = sdef[:, 0:3]
+            ret.sdef_r0[sdef_index] = sdef[:, 3:6]
+            ret.sdef_r1[sdef_index] = sdef[:, 6:9]
+        return ret
+
+    def to_vertices(self):
+        """ Build the equivalent list of pmx.Vertex objects.
+        """
+        BoneWeight, BoneWeightSDEF, Vertex = pmx.BoneWeight, pmx.BoneWeightSDEF, pmx.Vertex
+        BDEF1, BDEF2, BDEF4 = BoneWeight.BDEF1, BoneWeight.BDEF2, BoneWeight.BDEF4
+        vertices = []
+        with _gc_paused():
+            sdef_index = np.flatnonzero(self.weight_type == BoneWeight.SDEF)
+            sdef = dict(zip(sdef_index.tolist(), zip(self.weights[sdef_index, 0].tolist(),
+                                                     map(tuple, self.sdef_c[sdef_index].tolist()),
+                                                     map(tuple, self.sdef_r0[sdef_index].tolist()),
+                                                     map(tuple, self.sdef_r1[sdef_index].tolist()))))
+            if self.additional_uvs.shape[1] > 0:
+                add_uvs = ([tuple(x) for x in uvs] for uvs in self.additional_uvs.tolist())
+            else:
+                add_uvs = ([] for i in range(len(self)))
+            columns = zip(map(tuple, self.co.tolist()), map(tuple, self.normal.tolist()), map(tuple, self.uv.tolist()),
+                          add_uvs, self.weight_type.tolist(), self.bones.tolist(), self.weights.tolist(), self.edge_scale.tolist())
+            for i, (co, normal, uv, additional_uvs, weight_type, bones, weights, edge_scale) in enumerate(columns):
+                v = Vertex()
+                v.co = co
+                v.normal = normal
+                v.uv = uv
+                v.additional_uvs = additional_uvs
+                v.edge_scale = edge_scale
+
+                weight = BoneWeight()
+                weight.type = weight_type
+                if weight_type == BDEF1:
+                    weight.bones = bones[:1]
+                elif weight_type == BDEF2:
+                    weight.bones = bones[:2]
+                    weight.weights = weights[:1]
+                elif weight_type == BDEF4:
+                    weight.bones = bones
+                    weight.weights = tuple(weights)
+                else:
+                    weight.bones = bones[:2]
+                    weight.weights = BoneWeightSDEF(*sdef[i])
+                v.weight = weight
+                vertices.append(v)
+        return vertices
+
+
+def _scan_vertices(fs, count):
+    """ Locate ``count`` vertex records from the current position of ``fs`` and move past them.
+
+    @return (buffer, record start offsets, weight types, record sizes per weight type)
+    """
+    header = fs.header()
+    bi = header.bone_index_size
+    prefix = 4 * (8 + 4*header.additional_uvs)
+    weight_sizes = (1+bi, 1+2*bi+4, 1+4*bi+16, 1+2*bi+40) # BDEF1, BDEF2, BDEF4, SDEF
+    record = [prefix+s+4 for s in weight_sizes]
+
+    start = fs.tell()
+    buf = fs.readView(count * max(record))
+    buf_len = len(buf)
+
+    starts = [0] * count
+    types = bytearray(count)
+    off = 0
+    for i in range(count):
+        pos = off + prefix
+        if pos >= buf_len:
+            raise struct.error('truncated vertex data (%d of %d vertices)'%(i, count))
+        t = buf[pos]
+        if t > 3:
+            raise ValueError('invalid weight type %s'%str(t))
+        starts[i] = off
+        types[i] = t
+        off += record[t]
+    if off > buf_len:
+        raise struct.error('truncated vertex data')
+    fs.seek(start + off)
+    return buf, starts, types, record
+
+
+def skip_vertices(fs, count):
+    """ Move ``fs`` past ``count`` vertex records without decoding them.
+    """
+    _scan_vertices(fs, count)
+
+
+def read_vertices(fs, count):
+    """ Decode ``count`` vertex records from the current position of ``fs`` in one pass.
+
+    @return VertexArrays holding the same data as the pmx.Vertex objects loaded by Vertex.load()
+    """
+    header = fs.header()
+    prefix = 4 * (8 + 4*header.additional_uvs)
+    bi = header.bone_index_size
+    buf, starts, types, record = _scan_vertices(fs, count)
+
+    ret = VertexArrays(count, header.additional_uvs)
+    if count < 1:
+        return ret
+    starts = np.array(starts, dtype=np.int64)
+    types = np.frombuffer(bytes(types), dtype=np.uint8)
+
+    fixed = _gather(buf, starts, '<f4', prefix//4)
+    ret.co[:] = fixed[:, 0:3]
+    ret.normal[:] = fixed[:, 3:6]
+    ret.uv[:] = fixed[:, 6:8]
+    ret.additional_uvs[:] = fixed[:, 8:].reshape(count, -1, 4)
+    fixed = None
+
+    ret.weight_type[:] = types
+    bone_dtype = _SIGNED_INDEX[bi]
+    BoneWeight = pmx.BoneWeight
+    for t, bone_count in ((BoneWeight.BDEF1, 1), (BoneWeight.BDEF2, 2), (BoneWeight.BDEF4, 4), (BoneWeight.SDEF, 2)):
+        sel = np.flatnonzero(types == t)
+        if len(sel) < 1:
+            continue
+        pos = starts[sel] + (prefix + 1)
+        ret.bones[sel, :bone_count] = _gather(buf, pos, bone_dtype, bone_count)
+        pos += bone_count * bi
+        if t == BoneWeight.BDEF1:
+            ret.weights[sel, 0] = 1.0
+        elif t == BoneWeight.BDEF4:
+            ret.weights[sel] = _gather(buf, pos, '<f4', 4)
+        else:
+            w = _gather(buf, pos, '<f4', 1)[:, 0]
+            ret.weights[sel, 0] = w
+            ret.weights[sel, 1] = 1.0 - w
+            if t == BoneWeight.SDEF:
+                sdef = _gather(buf, pos + 4, '<f4', 9)
+                ret.sdef_c[sel] = sdef[:, 0:3]
+                ret.sdef_r0[sel] = sdef[:, 3:6]
+                ret.sdef_r1[sel] = sdef[:, 6:9]
+
+    ends = starts + np.array(record, dtype=np.int64)[types]
+    ret.edge_scale[:] = _gather(buf, ends - 4, '<f4', 1)[:, 0]
+    return ret
+
+
+def _scatter(out, starts, data):
+    """ Store each row of ``data`` as raw bytes at the byte offsets ``starts`` of ``out``.
+    """
+    raw = np.ascontiguousarray(data).view(np.uint8).reshape(len(starts), -1)
+    out[starts[:, None] + np.arange(raw.shape[1])] = raw
+
+
+def _to_index(values, size, signed):
+    """ Convert indices to little-endian integers of ``size`` bytes, raising struct.error when out of range.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    bits = 8*size - signed
+    lo, hi = (-(1 << bits), (1 << bits) - 1) if signed else (0, (1 << bits) - 1)
+    if len(values) > 0 and (values.min() < lo or values.max() > hi):
+        raise struct.error('index out of range for %d byte index'%size)
+    return values.astype((_SIGNED_INDEX if signed else _UNSIGNED_INDEX)[size])
+
+
+def pack_vertices(arrays, header):
+    """ Pack VertexArrays into the byte layout of the pmx vertex section, excluding the vertex count.
+    """
+    count = len(arrays)
+    bi = header.bone_index_size
+    add_uvs = header.additional_uvs
+    prefix = 4 * (8 + 4*add_uvs)
+    weight_sizes = (1+bi, 1+2*bi+4, 1+4*bi+16, 1+2*bi+40) # BDEF1, BDEF2, BDEF4, SDEF
+    types = arrays.weight_type
+    if count > 0 and types.max() > 3:
+        raise ValueError('invalid weight type %s'%str(types.max()))
+    record = np.array([prefix+s+4 for s in weight_sizes], dtype=np.int64)[types]
+    ends = np.cumsum(record)
+    starts = ends - record
+    out = np.zeros(int(ends[-1]) if count > 0 else 0, dtype=np.uint8)
+    if count < 1:
+        return out.tobytes()
+
+    uvs = np.zeros((count, add_uvs, 4), dtype=np.float32)
+    n = min(add_uvs, arrays.additional_uvs.shape[1])
+    uvs[:, :n] = arrays.additional_uvs[:, :n]
+    fixed = np.concatenate((arrays.co, arrays.normal, arrays.uv, uvs.reshape(count, -1)), axis=1)
+    _scatter(out, starts, fixed.astype('<f4'))
+    out[starts + prefix] = types
+
+    BoneWeight = pmx.BoneWeight
+    for t, bone_count in ((BoneWeight.BDEF1, 1), (BoneWeight.BDEF2, 2), (BoneWeight.BDEF4, 4), (BoneWeight.SDEF, 2)):
+        sel = np.flatnonzero(types == t)
+        if len(sel) < 1:
+            continue
+        pos = starts[sel] + (prefix + 1)
+        _scatter(out, pos, _to_index(arrays.bones[sel, :bone_count], bi, True))
+        pos += bone_count * bi
+        if t == BoneWeight.BDEF4:
+            _scatter(out, pos, arrays.weights[sel].astype('<f4'))
+        elif t != BoneWeight.BDEF1:
+            _scatter(out, pos, arrays.weights[sel, :1].astype('<f4'))
+            if t == BoneWeight.SDEF:
+                sdef = np.concatenate((arrays.sdef_c[sel], arrays.sdef_r0[sel], arrays.sdef_r1[sel]), axis=1)
+                _scatter(out, pos + 4, sdef.astype('<f4'))
+    _scatter(out, ends - 4, arrays.edge_scale.astype('<f4').reshape(-1, 1))
+    return out.tobytes()
+
+
+def write_vertices(fs, vertices):
+    """ Write the vertex section. ``vertices`` is a list of pmx.Vertex or a VertexArrays.
+    """
+    header = fs.header()
+    if not isinstance(vertices, VertexArrays):
+        if any(len(v.additional_uvs) > header.additional_uvs for v in vertices):
+            fs.writeInt(len(vertices)) # keep the data of the extra uvs as Vertex.save() does
+            for v in vertices:
+                v.save(fs)
+            return
+        vertices = VertexArrays.from_vertices(vertices, header.additional_uvs)
+    fs.writeInt(len(vertices))
+    fs.writeBytes(pack_vertices(vertices, header))
+
+
+def write_faces(fs, faces):
+    """ Write the face section. ``faces`` is a list of vertex index triples or an array of shape (N, 3).
+    """
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    fs.writeInt(len(faces)*3)
+    fs.writeBytes(_to_index(faces[:, ::-1], fs.header().vertex_index_size, False).tobytes())
+
+
+def write_morph(fs, morph):
+    """ Same as morph.save(fs) but packs the offsets of vertex and uv morphs in one go.
+    """
+    if not isinstance(morph, (pmx.VertexMorph, pmx.UVMorph)):
+        morph.save(fs)
+        return
+    offsets = morph.offsets
+    width = 3 if isinstance(morph, pmx.VertexMorph) else 4
+    if not isinstance(offsets, MorphOffsetArrays):
+        if any(len(o.offset) != width for o in offsets):
+            morph.save(fs)
+            return
+        offsets = MorphOffsetArrays.from_offsets(offsets, width)
+    vi = fs.header().vertex_index_size
+    data = np.empty(len(offsets), dtype=[('index', _UNSIGNED_INDEX[vi]), ('offset', '<f4', (width,))])
+    data['index'] = _to_index(offsets.index, vi, False)
+    data['offset'] = offsets.offset
+    fs.writeStr(morph.name)
+    fs.writeStr(morph.name_e)
+    fs.writeSignedByte(morph.category)
+    fs.writeSignedByte(morph.type_index())
+    fs.writeInt(len(offsets))
+    fs.writeBytes(data.tobytes())
+
+
+class MorphOffsetArrays:
+    """ Column storage of the offsets of a vertex morph (width 3) or an uv morph (width 4).
+    """
+    def __init__(self, count=0, width=3):
+        self.index = np.zeros(count, dtype=np.uint32)
+        self.offset = np.zeros((count, width), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return '<MorphOffsetArrays count %d, width %d>'%(len(self), self.offset.shape[1])
+
+    @classmethod
+    def from_offsets(cls, offsets, width):
+        ret = cls(len(offsets), width)
+        if len(offsets) > 0:
+            ret.index[:] = [o.index for o in offsets]
+            ret.offset[:] = [tuple(o.offset) for o in offsets]
+        return ret
+
+    def to_offsets(self, offset_class):
+        offsets = []
+        with _gc_paused():
+            for index, offset in zip(self.index.tolist(), self.offset.tolist()):
+                o = offset_class()
+                o.index = index
+                o.offset = tuple(offset)
+                offsets.append(o)
+        return offsets
+
+
+def read_faces(fs, count):
+    """ Decode the face section holding ``count`` vertex indices.
+
+    @return an array of shape (count//3, 3) in the same vertex order as pmx.Model.faces
+    """
+    vi = fs.header().vertex_index_size
+    num_faces = count // 3
+    buf = fs.readView(num_faces * 3 * vi)
+    if len(buf) < num_faces * 3 * vi:
+        raise struct.error('truncated face data')
+    faces = np.frombuffer(buf, dtype=_UNSIGNED_INDEX[vi], count=num_faces*3).reshape(num_faces, 3)
+    return faces[:, ::-1].astype(np.uint32)
+
+
+def _copy_morph_offsets(offsets, buf, dtype):
+    data = np.frombuffer(buf, dtype=dtype, count=len(offsets))
+    offsets.index[:] = data['index']
+    offsets.offset[:] = data['offset']
+
+
+def read_morph_offsets(fs, width, pending=None):
+    """ Decode the offsets of a vertex morph (width 3) or an uv morph (width 4).
+
+    @param pending if a list is given, the offsets are returned unfilled and (offsets, data, dtype)
+        is appended to the list, to be copied later by _copy_morph_offsets()
+    """
+    vi = fs.header().vertex_index_size
+    count = fs.readInt()
+    dtype = np.dtype([('index', _UNSIGNED_INDEX[vi]), ('offset', '<f4', (width,))])
+    buf = fs.readView(count * dtype.itemsize)
+    if len(buf) < count * dtype.itemsize:
+        raise struct.error('truncated morph data')
+    ret = MorphOffsetArrays(count, width)
+    if pending is None:
+        _copy_morph_offsets(ret, buf, dtype)
+    else:
+        pending.append((ret, buf, dtype))
+    return ret
+
+
+def read_morph(fs, pending=None):
+    """ Same as pmx.Morph.create() but the offsets of vertex and uv morphs are MorphOffsetArrays.
+
+    @param pending see read_morph_offsets()
+    """
+    name = fs.readStr()
+    name_e = fs.readStr()
+    category = fs.readSignedByte()
+    type_index = fs.readSignedByte()
+    if type_index == 1:
+        ret = pmx.VertexMorph(name, name_e, category, type_index=type_index)
+        ret.offsets = read_morph_offsets(fs, 3, pending)
+    elif 3 <= type_index <= 7:
+        ret = pmx.UVMorph(name, name_e, category, type_index=type_index)
+        ret.offsets = read_morph_offsets(fs, 4, pending)
+    else:
+        _CLASSES = {
+            0: pmx.GroupMorph,
+            2: pmx.BoneMorph,
+            8: pmx.MaterialMorph,
+            }
+        ret = _CLASSES[type_index](name, name_e, category, type_index=type_index)
+        ret.load(fs)
+    return ret
+
+
+def _morph_objects(morph):
+    """ Convert the MorphOffsetArrays of a vertex/uv morph to a list of pmx offset objects.
+    """
+    if not isinstance(morph.offsets, MorphOffsetArrays):
+        return morph
+    ret = type(morph)(morph.name, morph.name_e, morph.category, type_index=morph.type_index())
+    offset_class = pmx.VertexMorphOffset if isinstance(morph, pmx.VertexMorph) else pmx.UVMorphOffset
+    ret.offsets = morph.offsets.to_offsets(offset_class)
+    return ret
+
+
+def _copy_morph_offsets_block(block):
+    for offsets, buf, dtype in block:
+        _copy_morph_offsets(offsets, buf, dtype)
+
+
+# copy the morph offsets in parallel when there are more bytes than this
+PARALLEL_MORPH_SIZE = 4*1024*1024
+
+def read_morphs(fs, num_morphs, as_objects=False, workers=None):
+    """ Decode the morph section in two passes.
+
+    The first pass decodes the morph records and only locates the offset data of vertex/uv morphs
+    as views of the stream. The second pass splits the located data into blocks of about the same
+    size in bytes and copies them into the MorphOffsetArrays on a pool of threads. The copies are
+    done by numpy, which releases the GIL, and all the workers share the views of the same file.
+    The result is the same as decoding the morphs one by one.
+
+    @param as_objects the offsets of vertex/uv morphs are pmx offset objects instead of MorphOffsetArrays
+    @param workers the number of workers, the number of CPUs by default
+    """
+    pending = []
+    morphs = [read_morph(fs, pending) for i in range(num_morphs)]
+    size = sum(len(buf) for offsets, buf, dtype in pending)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(pending))
+    if workers < 2 or size < PARALLEL_MORPH_SIZE:
+        _copy_morph_offsets_block(pending)
+    else:
+        blocks = [[]]
+        block_size = 0
+        for item in pending:
+            if block_size >= size/workers:
+                blocks.append([])
+                block_size = 0
+            blocks[-1].append(item)
+            block_size += len(item[1])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_copy_morph_offsets_block, blocks))
+    return [_morph_objects(m) for m in morphs] if as_objects else morphs
+
+
+class ColumnarModel(pmx.Model):
+    """ pmx.Model variant which keeps the bulk data in numpy arrays.
+
+    vertices is a VertexArrays, faces is an array of shape (N, 3) and the offsets of
+    vertex/uv morphs are MorphOffsetArrays. The other sections are the usual pmx objects.
+    """
+    def __init__(self):
+        pmx.Model.__init__(self)
+        self.vertices = VertexArrays()
+        self.faces = np.zeros((0, 3), dtype=np.uint32)
+
+    def _loadVertices(self, fs, num_vertices):
+        self.vertices = read_vertices(fs, num_vertices)
+        logging.info('----- Loaded %d vertices', len(self.vertices))
+
+    def _loadFaces(self, fs, num_faces):
+        self.faces = read_faces(fs, num_faces)
+        logging.info('----- Loaded %d faces', len(self.faces))
+
+    def _loadMorphs(self, fs, num_morph):
+        self.morphs = read_morphs(fs, num_morph)
+        logging.info('----- Loaded %d morphs', len(self.morphs))
+
+    @classmethod
+    def from_model(cls, model):
+        """ Build a ColumnarModel from a pmx.Model. Sections kept as objects are shared, not copied.
+        """
+        ret = cls()
+        ret.__dict__.update(model.__dict__)
+        ret.vertices = VertexArrays.from_vertices(model.vertices, model.header.additional_uvs if model.header else None)
+        ret.faces = np.array(model.faces, dtype=np.uint32).reshape(-1, 3)
+        ret.morphs = []
+        for m in model.morphs:
+            if isinstance(m, (pmx.VertexMorph, pmx.UVMorph)):
+                c = type(m)(m.name, m.name_e, m.category, type_index=m.type_index())
+                c.offsets = MorphOffsetArrays.from_offsets(m.offsets, 3 if isinstance(m, pmx.VertexMorph) else 4)
+                m = c
+            ret.morphs.append(m)
+        return ret
+
+    def to_model(self):
+        """ Build the equivalent pmx.Model. Sections kept as objects are shared, not copied.
+        """
+        ret = pmx.Model()
+        ret.__dict__.update(self.__dict__)
+        ret.vertices = self.vertices.to_vertices()
+        with _gc_paused():
+            ret.faces = list(map(tuple, self.faces.tolist()))
+        ret.morphs = [_morph_objects(m) for m in self.morphs]
+        return ret
+
+
+def load(path, sections=None):
+    """ Same as pmx.load() but returns a ColumnarModel.
+    """
+    with pmx.MappedFileReadStream(path) as fs:
+        header = pmx.Header()
+        header.load(fs)
+        fs.setHeader(header)
+        model = ColumnarModel()
+        try:
+            model.load(fs, sections)
+        except struct.error as e:
+            logging.error(' * Corrupted file: %s', e)
+        return model
+
+
+# the version of the data stored by load_cached(), increase it when the loaded data changes
+CACHE_VERSION = 2
+
+def load_cached(path, cache):
+    """ Same as pmx.load() but reuses the parsed data stored in ``cache``, a core.cache.DiskCache.
+
+    Entries are keyed by the file content and its absolute directory, since texture paths are resolved against it.
+    """
+    import hashlib
+    from mmd_tools.core.cache import file_digest
+    directory = os.path.normcase(os.path.dirname(os.path.abspath(path)))
+    key = hashlib.sha1(('%s|%s'%(file_digest(path), directory)).encode('utf-8')).hexdigest()
+    model = cache.get('pmx', CACHE_VERSION, key)
+    if not isinstance(model, ColumnarModel):
+        model = load(path)
+        cache.put('pmx', CACHE_VERSION, key, model)
+    model = model.to_model()
+    model.filepath = path
+    return model
+
+
+def bone_weight_entries(vertices, group_count):
+    """ The vertex group weights of the bone weights of ``vertices``, a VertexArrays, as the PMX
+    importer assigns them: BDEF1 vertices of no bone are skipped, the weights of BDEF2/SDEF
+    vertices are (w, 1-w) and the 4 bones of BDEF4 vertices are used as is. Negative bone
+    indices are counted from the end of the ``group_count`` groups.
+
+    @return (group indices, vertex indices, weights) of the entries in vertex order
+    """
+    BoneWeight = pmx.BoneWeight
+    weight_type = vertices.weight_type[:, None]
+    slots = np.arange(4)
+    used = np.where(weight_type == BoneWeight.BDEF4, True, np.where(weight_type == BoneWeight.BDEF1, slots < 1, slots < 2))
+    used[:, 0] &= (vertices.weight_type != BoneWeight.BDEF1) | (vertices.bones[:, 0] >= 0)
+    rows, columns = np.nonzero(used)
+    groups = vertices.bones[rows, columns].astype(np.int64)
+    groups[groups < 0] += group_count
+    return groups, rows, vertices.weights[rows, columns]
+
+def vertex_group_buckets(groups, vertices, weights):
+    """ Group the vertex group entries by (group, weight) to assign each bucket at once.
+
+    Each weight is clamped to [0, 1] as the weight argument of VertexGroup.add() is, then the weights
+    of the same vertex and group are added in float32 in order and each sum is limited to 1, as
+    VertexGroup.add(type='ADD') does.
+
+    @return a list of (group index, weight, vertex index array) sorted by group
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    vertices = np.asarray(vertices, dtype=np.int64)
+    weights = np.clip(np.asarray(weights, dtype=np.float32), 0, 1)
+    if len(groups) < 1:
+        return []
+    pairs, inverse = np.unique(groups*(vertices.max() + 1) + vertices, return_inverse=True)
+    total = np.zeros(len(pairs), dtype=np.float32)
+    # the sums never decrease, so limiting the final sums is the same as limiting every sum
+    np.add.at(total, inverse.reshape(-1), weights)
+    total = np.minimum(total, np.float32(1))
+    groups, vertices = np.divmod(pairs, vertices.max() + 1)
+
+    keys, inverse = np.unique((groups << 32) | total.view(np.uint32).astype(np.int64), return_inverse=True)
+    order = np.argsort(inverse.reshape(-1), kind='stable')
+    bounds = np.flatnonzero(np.diff(inverse.reshape(-1)[order])) + 1
+    bucket_vertices = np.split(vertices[order], bounds)
+    bucket_weights = (keys & 0xffffffff).astype(np.uint32).view(np.float32)
+    return list(zip((keys >> 32).tolist(), bucket_weights.tolist(), bucket_vertices))
+
+
+def row_ids(rows):
+    """ Number the distinct rows of a 2-d array, comparing them as tuples of the values:
+    -0.0 equals 0.0 and a row with NaN values only equals itself.
+
+    @return the int64 array of the ids of the rows
+    """
+    rows = np.ascontiguousarray(np.asarray(rows, dtype=np.float64) + 0.0)
+    if len(rows) < 1:
+        return np.zeros(0, dtype=np.int64)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize*rows.shape[1]))).reshape(-1)
+    ids = np.unique(keys, return_inverse=True)[1].reshape(-1).astype(np.int64)
+    nan = np.flatnonzero(np.isnan(rows).any(axis=1))
+    if nan.size:
+        ids[nan] = ids.max() + 1 + np.arange(nan.size)
+    return ids
+
+def _pair_ids(a, b):
+    """ Number the distinct pairs of two int arrays in sorted order """
+    return np.unique(a*(b.max() + 1) + b, return_inverse=True)[1].reshape(-1)
+
+def morph_offset_entries(morphs):
+    """ The offsets of the vertex and uv morphs of ``morphs`` as rows (morph index, x, y, z, w)
+    in float64, the w of vertex morph offsets is 0.
+
+    @return (vertex indices, rows) of the offsets in morph order
+    """
+    indices, rows = [], []
+    for i, m in enumerate(morphs):
+        if not isinstance(m, (pmx.VertexMorph, pmx.UVMorph)) or len(m.offsets) < 1:
+            continue
+        width = 4 if isinstance(m, pmx.UVMorph) else 3
+        r = np.zeros((len(m.offsets), 5))
+        r[:, 0] = i
+        _fill(r[:, 1:width+1], (x.offset for x in m.offsets))
+        rows.append(r)
+        indices.append(np.fromiter((x.index for x in m.offsets), dtype=np.int64, count=len(m.offsets)))
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 5))
+    return np.concatenate(indices), np.concatenate(rows)
+
+def merge_vertices(co, entry_vertices, entry_rows):
+    """ Find the vertices of the same position and the same sequence of morph offset rows, as
+    comparing tuple(co) + the tuples of the rows of each vertex in order.
+
+    @param co the positions of the vertices, an array of shape (N, 3)
+    @param entry_vertices, entry_rows the morph offsets from ``morph_offset_entries``
+    @return (pmx indices, blender indices), the first vertex of the same signature of each vertex
+        and the index of the signature in the order of the first vertices
+    """
+    count = len(co)
+    if count < 1:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    ids = row_ids(np.asarray(co).reshape(count, -1))
+    entry_vertices = np.asarray(entry_vertices, dtype=np.int64)
+    if len(entry_vertices):
+        order = np.argsort(entry_vertices, kind='stable')
+        entry_ids = row_ids(entry_rows)[order]
+        lengths = np.bincount(entry_vertices, minlength=count)
+        starts = np.cumsum(lengths) - lengths
+        # the vertices of the same id have the same number of entries, extend the ids entry by entry
+        ids = _pair_ids(ids, lengths)
+        next_id = ids.max() + 1
+        for k in range(lengths.max()):
+            sel = np.flatnonzero(lengths > k)
+            new_ids = _pair_ids(ids[sel], entry_ids[starts[sel] + k])
+            ids[sel] = next_id + new_ids
+            next_id += new_ids.max() + 1
+    first, ids = np.unique(ids, return_index=True, return_inverse=True)[1:]
+    ids = ids.reshape(-1)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return first[ids], rank[ids]
+
+def clean_faces(faces, face_counts, corner_keys=None):
+    """ Find the faces to keep in the faces of each material: the faces of less than 3 different
+    vertices are removed, so are the faces of the same vertices and corner keys as an earlier
+    face of the same material, in any order. The faces after the last material are removed.
+
+    @param faces the vertex indices of the faces, an int array of shape (F, 3)
+    @param face_counts the number of faces of each material
+    @param corner_keys the ints compared along with the vertices of each corner, of shape (F, 3)
+    @return (a bool mask of the faces to keep, the number of kept faces of each material)
+    """
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    face_counts = np.asarray(face_counts, dtype=np.int64)
+    material = np.repeat(np.arange(len(face_counts)), face_counts)[:len(faces)]
+    keep = np.zeros(len(faces), dtype=bool)
+    keep[:len(material)] = True
+    f = faces[:len(material)]
+    keep[:len(material)] &= (f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 0] != f[:, 2])
+
+    sel = np.flatnonzero(keep)
+    order = np.argsort(faces[sel], axis=1)
+    keys = [material[sel, None], np.take_along_axis(faces[sel], order, axis=1)]
+    if corner_keys is not None:
+        keys.append(np.take_along_axis(np.asarray(corner_keys, dtype=np.int64).reshape(-1, 3)[sel], order, axis=1))
+    keys = np.ascontiguousarray(np.hstack(keys))
+    if len(keys):
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize*keys.shape[1]))).reshape(-1)
+        first = np.unique(keys, return_index=True)[1]
+        keep[sel] = False
+        keep[sel[first]] = True
+    return keep, np.bincount(material[keep[:len(material)]], minlength=len(face_counts))
@@ -1018,7 +1018,14 @@ class __PmxExporter:
         if self.__vertex_order_map: # sort vertices
             mesh_id = self.__vertex_order_map.setdefault('mesh_id', 0)
             self.__vertex_order_map['mesh_id'] += 1
-            if vg_vertex_order and self.__vertex_order_map['method'] == 'CUSTOM':
+            order_attribute = getattr(base_mesh, 'attributes', {}).get('mmd_vertex_order', None)
+            if order_attribute and (order_attribute.data_type, order_attribute.domain) != ('INT', 'POINT'):
+                order_attribute = None
+            if order_attribute and self.__vertex_order_map['method'] == 'CUSTOM':
+                vertex_orders = [0] * len(base_mesh.vertices)
+                order_attribute.data.foreach_get('value', vertex_orders)
+                get_vertex_order = lambda x: (mesh_id, vertex_orders[x.index] or float('inf'), x.index)
+            elif vg_vertex_order and self.__vertex_order_map['method'] == 'CUSTOM':
                 get_vertex_order = lambda x: (mesh_id, _get_weight(vg_vertex_order.index, x, 2), x.index)
             else:
                 get_vertex_order = lambda x: (mesh_id, x.index)
@@ -5,6 +5,7 @@ import logging
 import time
 
 import bpy
+import numpy as np
 from mathutils import Vector, Matrix
 
 import mmd_tools.core.model as mmd_model
@@ -105,6 +106,13 @@ class PMXImporter:
         self.__targetScene.active_object = self.__meshObj
         bpy.ops.object.shape_key_add()
 
+    def __basisCoordinates(self):
+        """ @return the coordinates of the basis shape key, a float32 array of shape (N, 3) """
+        basis_data = self.__meshObj.data.shape_keys.reference_key.data
+        basis = np.empty((len(basis_data), 3), dtype=np.float32)
+        basis_data.foreach_get('co', basis.ravel())
+        return basis
+
     def __importVertexGroup(self):
         vgroups = self.__meshObj.vertex_groups
         self.__vertexGroupTable = [vgroups.new(name=i.name) for i in self.__model.bones] or [vgroups.new(name='NO BONES')]
@@ -123,56 +131,63 @@ class PMXImporter:
         if vertex_count < 1:
             return
 
+        from mmd_tools.core.pmx import bulk
+        vertex_arrays = bulk.VertexArrays.from_vertices(pmx_vertices, 0)
         mesh = self.__meshObj.data
         mesh.vertices.add(count=vertex_count)
-        mesh.vertices.foreach_set('co', tuple(i for pv in pmx_vertices for i in (Vector(pv.co).xzy * self.__scale)))
+        # scaled in float32 as mathutils did
+        mesh.vertices.foreach_set('co', (vertex_arrays.co[:, (0, 2, 1)] * np.float32(self.__scale)).ravel())
+
+        for i in np.flatnonzero(vertex_arrays.weight_type == pmx.BoneWeight.SDEF).tolist():
+            pv = pmx_vertices[i]
+            pv_bones, pv_weights = pv.weight.bones, pv.weight.weights
+            if pv_bones[0] > pv_bones[1]:
+                pv_bones.reverse()
+                pv_weights.weight = 1.0 - pv_weights.weight
+                pv_weights.r0, pv_weights.r1 = pv_weights.r1, pv_weights.r0
+            self.__sdefVertices[i] = pv
 
+        start_time = time.time()
         vertex_group_table = self.__vertexGroupTable
         vg_edge_scale = self.__meshObj.vertex_groups.new(name='mmd_edge_scale')
-        vg_vertex_order = self.__meshObj.vertex_groups.new(name='mmd_vertex_order')
-        for i, pv in enumerate(pmx_vertices):
-            pv_bones, pv_weights, idx = pv.weight.bones, pv.weight.weights, (i,)
-
-            vg_edge_scale.add(index=idx, weight=pv.edge_scale, type='REPLACE')
-            vg_vertex_order.add(index=idx, weight=i/vertex_count, type='REPLACE')
-
-            if isinstance(pv_weights, pmx.BoneWeightSDEF):
-                if pv_bones[0] > pv_bones[1]:
-                    pv_bones.reverse()
-                    pv_weights.weight = 1.0 - pv_weights.weight
-                    pv_weights.r0, pv_weights.r1 = pv_weights.r1, pv_weights.r0
-                vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights.weight, type='ADD')
-                vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights.weight, type='ADD')
-                self.__sdefVertices[i] = pv
-            elif len(pv_bones) == 1:
-                bone_index = pv_bones[0]
-                if bone_index >= 0:
-                    vertex_group_table[bone_index].add(index=idx, weight=1.0, type='ADD')
-            elif len(pv_bones) == 2:
-                vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights[0], type='ADD')
-                vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights[0], type='ADD')
-            elif len(pv_bones) == 4:
-                for bone, weight in zip(pv_bones, pv_weights):
-                    vertex_group_table[bone].add(index=idx, weight=weight, type='ADD')
-            else:
-                raise Exception('unkown bone weight type.')
+        vertex_indices = np.arange(vertex_count)
+        assignments = [
+            (vertex_group_table, bulk.vertex_group_buckets(*bulk.bone_weight_entries(vertex_arrays, len(vertex_group_table)))),
+            ([vg_edge_scale], bulk.vertex_group_buckets(np.zeros(vertex_count), vertex_indices, vertex_arrays.edge_scale)),
+            ]
+        vg_vertex_order = None
+        if hasattr(mesh, 'attributes'):
+            # 1-based, vertices added later have 0 and are sorted last on export
+            attribute = mesh.attributes.new(name='mmd_vertex_order', type='INT', domain='POINT')
+            attribute.data.foreach_set('value', np.arange(1, vertex_count + 1, dtype=np.int32))
+        else:
+            vg_vertex_order = self.__meshObj.vertex_groups.new(name='mmd_vertex_order')
+            assignments.append(([vg_vertex_order], bulk.vertex_group_buckets(np.zeros(vertex_count), vertex_indices, vertex_indices/vertex_count)))
+        calls = 0
+        for groups, buckets in assignments:
+            for group_index, weight, indices in buckets:
+                groups[group_index].add(index=indices.tolist(), weight=weight, type='REPLACE')
+            calls += len(buckets)
+        logging.info('Assigned the vertex weights in %d calls in %f seconds', calls, time.time() - start_time)
 
         vg_edge_scale.lock_weight = True
-        vg_vertex_order.lock_weight = True
+        if vg_vertex_order:
+            vg_vertex_order.lock_weight = True
 
     def __storeVerticesSDEF(self):
         if len(self.__sdefVertices) < 1:
             return
 
         self.__createBasisShapeKey()
-        sdefC = self.__meshObj.shape_key_add(name='mmd_sdef_c')
-        sdefR0 = self.__meshObj.shape_key_add(name='mmd_sdef_r0')
-        sdefR1 = self.__meshObj.shape_key_add(name='mmd_sdef_r1')
-        for i, pv in self.__sdefVertices.items():
-            w = pv.weight.weights
-            sdefC.data[i].co = Vector(w.c).xzy * self.__scale
-            sdefR0.data[i].co = Vector(w.r0).xzy * self.__scale
-            sdefR1.data[i].co = Vector(w.r1).xzy * self.__scale
+        basis = self.__basisCoordinates()
+        indices = np.fromiter(self.__sdefVertices.keys(), dtype=np.intp, count=len(self.__sdefVertices))
+        weights = [pv.weight.weights for pv in self.__sdefVertices.values()]
+        scale = np.float32(self.__scale)
+        for name, attr in (('mmd_sdef_c', 'c'), ('mmd_sdef_r0', 'r0'), ('mmd_sdef_r1', 'r1')):
+            shapeKey = self.__meshObj.shape_key_add(name=name)
+            co = basis.copy()
+            co[indices] = np.array([getattr(w, attr) for w in weights], dtype=np.float32).reshape(-1, 3)[:, (0, 2, 1)] * scale
+            shapeKey.data.foreach_set('co', co.ravel())
         logging.info('Stored %d SDEF vertices', len(self.__sdefVertices))
 
     def __importTextures(self):
@@ -582,42 +597,50 @@ class PMXImporter:
         mesh = self.__meshObj.data
         vertex_map = self.__vertex_map
 
-        loop_indices_orig = tuple(i for f in pmxModel.faces for i in f)
-        loop_indices = tuple(vertex_map[i][1] for i in loop_indices_orig) if vertex_map else loop_indices_orig
-        material_indices = tuple(i for i, c in enumerate(self.__materialFaceCountTable) for x in range(c))
+        face_count = len(pmxModel.faces)
+        loop_indices_orig = np.array(pmxModel.faces, dtype=np.int64).reshape(-1)
+        if vertex_map:
+            loop_indices = np.array([x[1] for x in vertex_map], dtype=np.int32)[loop_indices_orig]
+        else:
+            loop_indices = loop_indices_orig.astype(np.int32)
+        material_indices = np.repeat(np.arange(len(self.__materialFaceCountTable), dtype=np.int32), self.__materialFaceCountTable)
 
-        mesh.loops.add(len(pmxModel.faces)*3)
+        mesh.loops.add(face_count*3)
         mesh.loops.foreach_set('vertex_index', loop_indices)
 
-        mesh.polygons.add(len(pmxModel.faces))
-        mesh.polygons.foreach_set('loop_start', tuple(range(0, len(mesh.loops), 3)))
-        mesh.polygons.foreach_set('loop_total', (3,)*len(pmxModel.faces))
-        mesh.polygons.foreach_set('use_smooth', (True,)*len(pmxModel.faces))
+        mesh.polygons.add(face_count)
+        mesh.polygons.foreach_set('loop_start', np.arange(0, face_count*3, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('loop_total', np.full(face_count, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('use_smooth', np.ones(face_count, dtype=bool))
         mesh.polygons.foreach_set('material_index', material_indices)
 
+        # the uvs of the pmx vertices with V flipped, picked for the loops at once
+        def _loop_uvs(uv):
+            uv = np.array(uv, dtype=np.float64)
+            uv[:, 1] = 1.0 - uv[:, 1]
+            return uv.astype(np.float32)[loop_indices_orig].ravel()
+
         uv_textures, uv_layers = getattr(mesh, 'uv_textures', mesh.uv_layers), mesh.uv_layers
         uv_tex = uv_textures.new()
         uv_layer = uv_layers[uv_tex.name]
-        uv_table = {vi:self.flipUV_V(v.uv) for vi, v in enumerate(pmxModel.vertices)}
-        uv_layer.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i]))
+        uv_layer.data.foreach_set('uv', _loop_uvs([v.uv for v in pmxModel.vertices]))
 
         if hasattr(mesh, 'uv_textures'):
-            for bf, mi in zip(uv_tex.data, material_indices):
+            for bf, mi in zip(uv_tex.data, material_indices.tolist()):
                 bf.image = self.__imageTable.get(mi, None)
 
         if pmxModel.header and pmxModel.header.additional_uvs:
             logging.info('Importing %d additional uvs', pmxModel.header.additional_uvs)
             zw_data_map = collections.OrderedDict()
-            split_uvzw = lambda uvi: (self.flipUV_V(uvi[:2]), uvi[2:])
             for i in range(pmxModel.header.additional_uvs):
                 add_uv = uv_layers[uv_textures.new(name='UV'+str(i+1)).name]
                 logging.info(' - %s...(uv channels)', add_uv.name)
-                uv_table = {vi:split_uvzw(v.additional_uvs[i]) for vi, v in enumerate(pmxModel.vertices)}
-                add_uv.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i][0]))
-                if not any(any(s[1]) for s in uv_table.values()):
+                uvzw = np.array([v.additional_uvs[i] for v in pmxModel.vertices], dtype=np.float64).reshape(-1, 4)
+                add_uv.data.foreach_set('uv', _loop_uvs(uvzw[:, :2]))
+                if not np.any(uvzw[:, 2:] != 0):
                     logging.info('\t- zw are all zeros: %s', add_uv.name)
                 else:
-                    zw_data_map['_'+add_uv.name] = {k:self.flipUV_V(v[1]) for k, v in uv_table.items()}
+                    zw_data_map['_'+add_uv.name] = uvzw[:, 2:]
             for name, zw_table in zw_data_map.items():
                 logging.info(' - %s...(zw channels of %s)', name, name[1:])
                 add_zw = uv_textures.new(name=name)
@@ -625,7 +648,7 @@ class PMXImporter:
                     logging.warning('\t* Lost zw channels')
                     continue
                 add_zw = uv_layers[add_zw.name]
-                add_zw.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in zw_table[i]))
+                add_zw.data.foreach_set('uv', _loop_uvs(zw_table))
 
         if bpy.app.version >= (2, 80, 0):
             self.__fixOverlappingFaceMaterials(mesh.materials, mesh.vertices, loop_indices, material_indices)
@@ -634,35 +657,49 @@ class PMXImporter:
         # This is not the best way to setup blend_method, might just work for some common cases. And FnMaterial.update_alpha() is still using 'HASHED'.
         # For EEVEE, basically users should know which blend_method is best for each material of their models.
         # For Cycles, users have to offset or delete those z-fighting faces to fix it manually.
-        check = {}
-        mi_skip = -1
-        def _rounded_co(co): return tuple(round(v, 6) for v in co)
+        from mmd_tools.core.pmx import bulk
         assert(len(loop_indices) == len(material_indices)*3)
-        for i, mi in enumerate(material_indices):
-            if mi > mi_skip:
-                si = 3*i
-                verts = tuple(sorted(_rounded_co(vertices[vi].co) for vi in loop_indices[si:si+3]))
-                if verts not in check:
-                    check[verts] = mi
-                elif check[verts] < mi:
-                    logging.debug(' >> fix blend method of material: %s', materials[mi].name)
-                    materials[mi].blend_method = 'BLEND'
-                    materials[mi].show_transparent_back = False
-                    mi_skip = mi
+        co = np.empty((len(vertices), 3), dtype=np.float32)
+        vertices.foreach_get('co', co.ravel())
+        # the faces at the same rounded coordinates get the same key: the sorted ids of their points.
+        # np.round() equals round(v, 6) here: a float32 times 1e6 is exact in float64, so rint()
+        # rounds the exact value half to even as round() does
+        point_ids = bulk.row_ids(np.round(co.astype(np.float64), 6))
+        face_keys = bulk.row_ids(np.sort(point_ids[np.asarray(loop_indices).reshape(-1, 3)], axis=1))
+
+        # a material overlapping any face of the previous materials is fixed, and its faces after
+        # the first overlapping one are not checked against the following materials
+        checked = np.zeros(len(face_keys) + 1, dtype=bool)
+        bounds = np.flatnonzero(np.diff(material_indices)) + 1
+        for start, stop in zip(np.append(0, bounds).tolist(), np.append(bounds, len(material_indices)).tolist()):
+            keys = face_keys[start:stop]
+            overlapped = np.flatnonzero(checked[keys])
+            if overlapped.size:
+                mi = int(material_indices[start])
+                logging.debug(' >> fix blend method of material: %s', materials[mi].name)
+                materials[mi].blend_method = 'BLEND'
+                materials[mi].show_transparent_back = False
+                keys = keys[:overlapped[0]]
+            checked[keys] = True
 
     def __importVertexMorphs(self):
         mmd_root = self.__root.mmd_root
         categories = self.CATEGORIES
         self.__createBasisShapeKey()
+        from mmd_tools.core.pmx import bulk
+        basis = self.__basisCoordinates()
+        scale = np.float32(self.__scale)
         for morph in (x for x in self.__model.morphs if isinstance(x, pmx.VertexMorph)):
             shapeKey = self.__meshObj.shape_key_add(name=morph.name)
             vtx_morph = mmd_root.vertex_morphs.add()
             vtx_morph.name = morph.name
             vtx_morph.name_e = morph.name_e
             vtx_morph.category = categories.get(morph.category, 'OTHER')
-            for md in morph.offsets:
-                shapeKeyPoint = shapeKey.data[md.index]
-                shapeKeyPoint.co += Vector(md.offset).xzy * self.__scale
+            offsets = bulk.MorphOffsetArrays.from_offsets(morph.offsets, 3)
+            co = basis.copy()
+            # summed in float32 in order, as adding the offsets to the points one by one
+            np.add.at(co, offsets.index.astype(np.intp), offsets.offset[:, (0, 2, 1)] * scale)
+            shapeKey.data.foreach_set('co', co.ravel())
 
     def __importMaterialMorphs(self):
         mmd_root = self.__root.mmd_root
@@ -779,13 +816,14 @@ class PMXImporter:
             logging.info(' * No support for custom normals!!')
             return
         logging.info('Setting custom normals...')
+        verts = self.__model.vertices
+        normals = np.array([v.normal for v in verts], dtype=np.float64).reshape(-1, 3)[:, (0, 2, 1)]
+        length = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = (normals / np.where(length > 0, length, 1.0)).astype(np.float32)
         if self.__vertex_map:
-            verts, faces = self.__model.vertices, self.__model.faces
-            custom_normals = [(Vector(verts[i].normal).xzy).normalized() for f in faces for i in f]
-            mesh.normals_split_custom_set(custom_normals)
+            mesh.normals_split_custom_set(normals[np.array(self.__model.faces, dtype=np.intp).reshape(-1)])
         else:
-            custom_normals = [(Vector(v.normal).xzy).normalized() for v in self.__model.vertices]
-            mesh.normals_split_custom_set_from_vertices(custom_normals)
+            mesh.normals_split_custom_set_from_vertices(normals)
         mesh.use_auto_smooth = True
         logging.info('   - Done!!')
 
@@ -806,11 +844,21 @@ class PMXImporter:
             m.name = utils.uniqueName(m.name or 'Morph', used_names)
             used_names.add(m.name)
 
+    @staticmethod
+    def __loadModel(filepath):
+        cache_folder = bpyutils.addon_preferences('cache_folder', '')
+        if not cache_folder:
+            return pmx.load(filepath)
+        from mmd_tools.core.cache import DiskCache
+        from mmd_tools.core.pmx import bulk
+        cache_size = bpyutils.addon_preferences('cache_size', 1024)
+        return bulk.load_cached(filepath, DiskCache(bpy.path.abspath(cache_folder), cache_size*1024*1024))
+
     def execute(self, **args):
         if 'pmx' in args:
             self.__model = args['pmx']
         else:
-            self.__model = pmx.load(args['filepath'])
+            self.__model = self.__loadModel(args['filepath'])
         self.__fixRepeatedMorphName()
 
         types = args.get('types', set())
@@ -899,25 +947,18 @@ class _PMXCleaner:
         pmx_vertices = pmx_model.vertices
 
         # clean face/vertex
-        cls.__clean_pmx_faces(pmx_faces, pmx_model.materials, lambda f: frozenset(f))
+        faces = cls.__clean_pmx_faces(pmx_faces, pmx_model.materials)
 
-        index_map = {v:v for f in pmx_faces for v in f}
-        is_index_clean = len(index_map) == len(pmx_vertices)
+        used = np.unique(faces)
+        is_index_clean = len(used) == len(pmx_vertices)
         if is_index_clean:
             logging.info('   (vertices is clean)')
         else:
-            new_vertex_count = 0
-            for v in sorted(index_map):
-                if v != new_vertex_count:
-                    pmx_vertices[new_vertex_count] = pmx_vertices[v]
-                    index_map[v] = new_vertex_count
-                new_vertex_count += 1
-            logging.warning('   - removed %d vertices', len(pmx_vertices)-new_vertex_count)
-            del pmx_vertices[new_vertex_count:]
+            logging.warning('   - removed %d vertices', len(pmx_vertices)-len(used))
+            pmx_vertices[:] = [pmx_vertices[v] for v in used.tolist()]
 
             # update vertex indices of faces
-            for f in pmx_faces:
-                f[:] = [index_map[v] for v in f]
+            pmx_faces[:] = np.searchsorted(used, faces).tolist()
 
         if mesh_only:
             logging.info('   - Done (mesh only)!!')
@@ -925,10 +966,12 @@ class _PMXCleaner:
 
         if not is_index_clean:
             # clean vertex/uv morphs
-            def __update_index(x):
-                x.index = index_map.get(x.index, None)
-                return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+            def __update_indices(indices):
+                new_indices = np.searchsorted(used, indices)
+                keep = new_indices < len(used)
+                keep[keep] = used[new_indices[keep]] == indices[keep]
+                return new_indices, keep
+            cls.__clean_pmx_morphs(pmx_model.morphs, __update_indices)
         logging.info('   - Done!!')
 
     @classmethod
@@ -936,26 +979,15 @@ class _PMXCleaner:
         logging.info('Removing doubles...')
         pmx_vertices = pmx_model.vertices
 
-        vertex_map = [None] * len(pmx_vertices)
-        # gather vertex data
-        for i, v in enumerate(pmx_vertices):
-            vertex_map[i] = [tuple(v.co)]
-        if not mesh_only:
-            for i, m in enumerate(pmx_model.morphs):
-                if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
-                    continue
-                for x in m.offsets:
-                    vertex_map[x.index].append((i,)+tuple(x.offset))
-        # generate vertex merging table
-        keys = {}
-        for i, v in enumerate(vertex_map):
-            k = tuple(v)
-            if k in keys:
-                vertex_map[i] = keys[k] # merge pmx_vertices[i] to pmx_vertices[keys[k][0]]
-            else:
-                vertex_map[i] = keys[k] = (i, len(keys)) # (pmx index, blender index)
-        counts = len(vertex_map) - len(keys)
-        keys.clear()
+        from mmd_tools.core.pmx import bulk
+        # gather vertex data and generate vertex merging table
+        co = np.array([v.co for v in pmx_vertices], dtype=np.float64).reshape(-1, 3)
+        if mesh_only:
+            entries = (np.zeros(0, dtype=np.int64), np.zeros((0, 5)))
+        else:
+            entries = bulk.morph_offset_entries(pmx_model.morphs)
+        pmx_indices, blender_indices = bulk.merge_vertices(co, *entries)
+        counts = len(pmx_vertices) - (blender_indices.max() + 1 if len(pmx_vertices) else 0)
         if counts:
             logging.warning('   - %d vertices will be removed', counts)
         else:
@@ -963,57 +995,56 @@ class _PMXCleaner:
             return None
 
         # clean face
-        #face_key_func = lambda f: frozenset(vertex_map[x][0] for x in f)
-        face_key_func = lambda f: frozenset({vertex_map[x][0]:tuple(pmx_vertices[x].uv) for x in f}.items())
-        cls.__clean_pmx_faces(pmx_model.faces, pmx_model.materials, face_key_func)
+        uv_ids = bulk.row_ids(np.array([v.uv for v in pmx_vertices], dtype=np.float64).reshape(-1, 2))
+        cls.__clean_pmx_faces(pmx_model.faces, pmx_model.materials, pmx_indices, uv_ids)
 
         if mesh_only:
             logging.info('   - Done (mesh only)!!')
         else:
             # clean vertex/uv morphs
-            def __update_index(x):
-                indices = vertex_map[x.index]
-                x.index = indices[1] if x.index == indices[0] else None
-                return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+            def __update_indices(indices):
+                return blender_indices[indices], pmx_indices[indices] == indices
+            cls.__clean_pmx_morphs(pmx_model.morphs, __update_indices)
             logging.info('   - Done!!')
-        return vertex_map
+        return list(zip(pmx_indices.tolist(), blender_indices.tolist())) # (pmx index, blender index)
 
 
     @staticmethod
-    def __clean_pmx_faces(pmx_faces, pmx_materials, face_key_func):
-        new_face_count = 0
-        face_iter = iter(pmx_faces)
-        for mat in pmx_materials:
-            used_faces = set()
-            new_vertex_count = 0
-            for i in range(int(mat.vertex_count/3)):
-                f = next(face_iter)
-
-                f_key = face_key_func(f)
-                if len(f_key) != 3 or f_key in used_faces:
-                    continue
-                used_faces.add(f_key)
-
-                pmx_faces[new_face_count] = list(f)
-                new_face_count += 1
-                new_vertex_count += 3
-            mat.vertex_count = new_vertex_count
-        face_iter = None
-        if new_face_count == len(pmx_faces):
+    def __clean_pmx_faces(pmx_faces, pmx_materials, merged_indices=None, uv_ids=None):
+        """ Remove the degenerate faces and the repeated faces of each material, the corners are
+        compared by the vertex indices mapped by ``merged_indices`` and the ``uv_ids`` of the vertices.
+
+        @return the int array of the kept faces
+        """
+        from mmd_tools.core.pmx import bulk
+        faces = np.array(pmx_faces, dtype=np.int64).reshape(-1, 3)
+        keep, face_counts = bulk.clean_faces(faces if merged_indices is None else merged_indices[faces],
+                                             [int(mat.vertex_count/3) for mat in pmx_materials],
+                                             None if uv_ids is None else uv_ids[faces])
+        for mat, count in zip(pmx_materials, face_counts.tolist()):
+            mat.vertex_count = count * 3
+        faces = faces[keep]
+        if len(faces) == len(pmx_faces):
             logging.info('   (faces is clean)')
         else:
-            logging.warning('   - removed %d faces', len(pmx_faces)-new_face_count)
-            del pmx_faces[new_face_count:]
+            logging.warning('   - removed %d faces', len(pmx_faces)-len(faces))
+        pmx_faces[:] = faces.tolist()
+        return faces
 
     @staticmethod
     def __clean_pmx_morphs(pmx_morphs, index_update_func):
+        """ Remap the vertex indices of the vertex/uv morph offsets by ``index_update_func``, which
+        returns (new indices, mask of the offsets to keep) of an index array.
+        """
         for m in pmx_morphs:
             if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
                 continue
             old_len = len(m.offsets)
-            m.offsets = [x for x in m.offsets if index_update_func(x)]
+            indices = np.fromiter((x.index for x in m.offsets), dtype=np.int64, count=old_len)
+            new_indices, keep = index_update_func(indices)
+            m.offsets = [m.offsets[i] for i in np.flatnonzero(keep).tolist()]
+            for x, index in zip(m.offsets, new_indices[keep].tolist()):
+                x.index = index
             counts = old_len - len(m.offsets)
             if counts:
                 logging.warning('   - removed %d (of %d) offsets of "%s"', counts, old_len, m.name)
-
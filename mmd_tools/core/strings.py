@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+class StringDecoder:
+    """ Decode byte strings of a file, caching the decoded results.
+
+    Names are repeated many times in pmx/pmd/vmd files (e.g. the bone name of every
+    vmd keyframe), so every distinct byte string is decoded only once and equal
+    results share one str object.
+    """
+    def __init__(self, encoding, terminator=None):
+        """
+        @param encoding the charset of the byte strings
+        @param terminator the byte string is truncated at its first terminator if specified
+        """
+        self.encoding = encoding
+        self.terminator = terminator
+        self.__decoded = {}
+        self.__strings = {}
+
+    def __len__(self):
+        """ The number of distinct byte strings decoded so far. """
+        return len(self.__decoded)
+
+    def decode(self, data):
+        s = self.__decoded.get(data)
+        if s is None:
+            text = data
+            if self.terminator is not None:
+                text = text.split(self.terminator, 1)[0]
+            text = str(text, self.encoding, errors='replace')
+            s = self.__decoded[bytes(data)] = self.__strings.setdefault(text, text)
+        return s
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
 import struct
 import collections
 
+from mmd_tools.core.strings import StringDecoder
+
 class InvalidFileError(Exception):
     pass
 
@@ -12,6 +15,9 @@ def _toShiftJisString(byteString):
 def _toShiftJisBytes(string):
     return string.encode('shift_jis', errors='replace')
 
+def _nameDecoder():
+    return StringDecoder('shift_jis', b'\x00')
+
 
 class Header:
     VMD_SIGN = b'Vocaloid Motion Data 0002'
@@ -34,6 +40,7 @@ class Header:
 
 
 class BoneFrameKey:
+    __slots__ = ('frame_number', 'location', 'rotation', 'interp')
     def __init__(self):
         self.frame_number = 0
         self.location = []
@@ -63,6 +70,7 @@ class BoneFrameKey:
 
 
 class ShapeKeyFrameKey:
+    __slots__ = ('frame_number', 'weight')
     def __init__(self):
         self.frame_number = 0
         self.weight = 0.0
@@ -156,11 +164,9 @@ class SelfShadowFrameKey:
         self.frame_number, = struct.unpack('<L', fin.read(4))
         self.mode, = struct.unpack('<b', fin.read(1))
         if self.mode not in range(3):
-            print(' * Invalid self shadow mode %d at frame %d'%(self.mode, self.frame_number))
-            raise struct.error
+            raise struct.error('invalid self shadow mode %d at frame %d'%(self.mode, self.frame_number))
         distance, = struct.unpack('<f', fin.read(4))
         self.distance = 10000 - distance*100000
-        print('    ', self)
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
@@ -215,24 +221,22 @@ class _AnimationBase(collections.defaultdict):
     def frameClass():
         raise NotImplementedError
 
-    def load(self, fin):
+    def load(self, fin, decoder=None):
+        """
+        @param decoder a StringDecoder of the frame key names, which can be shared by the animations of a file
+        """
+        from mmd_tools.core.vmd import bulk
         count, = struct.unpack('<L', fin.read(4))
         print('loading %s... %d'%(self.__class__.__name__, count))
-        for i in range(count):
-            name = _toShiftJisString(struct.unpack('<15s', fin.read(15))[0])
-            cls = self.frameClass()
-            frameKey = cls()
-            frameKey.load(fin)
-            self[name].append(frameKey)
+        frameKeys, complete = bulk.read_frame_keys(fin, count, self.frameClass(), decoder)
+        for name, keys in frameKeys:
+            self[name].extend(keys)
+        if not complete:
+            raise struct.error('truncated %s data'%self.__class__.__name__)
 
     def save(self, fin):
-        count = sum([len(i) for i in self.values()])
-        fin.write(struct.pack('<L', count))
-        for name, frameKeys in self.items():
-            name_data = struct.pack('<15s', _toShiftJisBytes(name))
-            for frameKey in frameKeys:
-                fin.write(name_data)
-                frameKey.save(fin)
+        from mmd_tools.core.vmd import bulk
+        fin.write(bulk.pack_frame_keys(self, self.frameClass()))
 
 
 class _AnimationListBase(list):
@@ -253,9 +257,8 @@ class _AnimationListBase(list):
             self.append(frameKey)
 
     def save(self, fin):
-        fin.write(struct.pack('<L', len(self)))
-        for frameKey in self:
-            frameKey.save(fin)
+        from mmd_tools.core.vmd import bulk
+        fin.write(bulk.pack_list_keys(self, self.frameClass()))
 
 
 class BoneAnimation(_AnimationBase):
@@ -324,7 +327,14 @@ class File:
         self.propertyAnimation = None
 
     def load(self, **args):
+        """
+        @param filepath the vmd file
+        @param frame_range (start, end) of the frames to load, inclusive. None of either end means unbounded.
+        @param bone_names the names of the bones to load, all bones if None
+        @param morph_names the names of the morphs to load, all morphs if None
+        """
         path = args['filepath']
+        key_filter = {k:args[k] for k in ('frame_range', 'bone_names', 'morph_names') if args.get(k) is not None}
 
         with open(path, 'rb') as fin:
             self.filepath = path
@@ -337,9 +347,13 @@ class File:
             self.propertyAnimation = PropertyAnimation()
 
             self.header.load(fin)
+            if key_filter:
+                self.__loadFiltered(fin, key_filter)
+                return
+            decoder = _nameDecoder()
             try:
-                self.boneAnimation.load(fin)
-                self.shapeKeyAnimation.load(fin)
+                self.boneAnimation.load(fin, decoder)
+                self.shapeKeyAnimation.load(fin, decoder)
                 self.cameraAnimation.load(fin)
                 self.lampAnimation.load(fin)
                 self.selfShadowAnimation.load(fin)
@@ -347,6 +361,18 @@ class File:
             except struct.error:
                 pass # no valid camera/lamp data
 
+    def __loadFiltered(self, fin, key_filter):
+        from mmd_tools.core.vmd import bulk
+        try:
+            for attr, name, keys in bulk.iter_keys(fin, **key_filter):
+                animation = getattr(self, attr)
+                if name is None:
+                    animation.extend(keys)
+                else:
+                    animation[name].extend(keys)
+        except struct.error:
+            pass # no valid camera/lamp data
+
     def save(self, **args):
         path = args.get('filepath', self.filepath)
 
@@ -358,12 +384,21 @@ class File:
         selfShadowAnimation = self.selfShadowAnimation or SelfShadowAnimation()
         propertyAnimation = self.propertyAnimation or PropertyAnimation()
 
-        with open(path, 'wb') as fin:
-            header.save(fin)
-            boneAnimation.save(fin)
-            shapeKeyAnimation.save(fin)
-            cameraAnimation.save(fin)
-            lampAnimation.save(fin)
-            selfShadowAnimation.save(fin)
-            propertyAnimation.save(fin)
+        from mmd_tools.core.vmd import bulk
+        # write a temporary file next to the target, so a failed save never leaves a truncated file behind
+        temp_path = '%s.%d.tmp'%(path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as fin:
+                header.save(fin)
+                fin.write(bulk.pack_frame_keys(boneAnimation, BoneFrameKey))
+                fin.write(bulk.pack_frame_keys(shapeKeyAnimation, ShapeKeyFrameKey))
+                fin.write(bulk.pack_list_keys(cameraAnimation, CameraKeyFrameKey))
+                fin.write(bulk.pack_list_keys(lampAnimation, LampKeyFrameKey))
+                fin.write(bulk.pack_list_keys(selfShadowAnimation, SelfShadowFrameKey))
+                fin.write(bulk.pack_list_keys(propertyAnimation, PropertyFrameKey))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
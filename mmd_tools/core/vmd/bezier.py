@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+""" Solve and split the cubic bezier curves of vmd interpolations and F-Curves in bulk.
+
+The x of a curve is solved for t by Newton's steps kept inside the brackets of the root,
+the values which are not solved after the steps are bisected, so every solved t satisfies
+abs(bezier_x(t) - x) <= 1e-12. The vmd curves are identified by the control points
+(x1, x2) in range [0, 127], a table of the t of each pair is solved once and cached to
+start the steps near the roots.
+"""
+
+import numpy as np
+
+_NEWTON_ITERATIONS = 3
+_SOLVER_TOLERANCE = 1e-12
+_T_TABLE_SIZE = 16
+
+
+def _bisect_t(x1, x2, x, lo, hi, iterations):
+    for i in range(iterations):
+        t = (lo + hi) * 0.5
+        s = 1 - t
+        below = 3*s*s*t*x1 + 3*s*t*t*x2 + t*t*t < x
+        lo = np.where(below, t, lo)
+        hi = np.where(below, hi, t)
+    return (lo + hi) * 0.5
+
+def _solve_t(x1, x2, x, lo, hi, t, iterations):
+    """ Newton's steps kept inside the brackets [lo, hi] of the roots, the values which are not
+    solved after ``iterations`` steps are bisected. The arguments are 1-d float64 arrays.
+    """
+    a1, a2 = 3*x1, 3*x2
+    b1, b2 = 2*(a2 - a1), 3 - a2
+    for i in range(iterations):
+        s = 1 - t
+        error = ((a1*s + a2*t)*s + t*t)*t - x
+        slope = (a1*s + b1*t)*s + b2*t*t
+        below = error < 0
+        lo = np.maximum(lo, t*below)
+        hi = np.minimum(hi, t + below)
+        t = np.clip(t - error/np.maximum(slope, 1e-12), lo, hi)
+    s = 1 - t
+    error = ((a1*s + a2*t)*s + t*t)*t - x
+    rest = np.flatnonzero(np.abs(error) > _SOLVER_TOLERANCE)
+    if rest.size:
+        t[rest] = _bisect_t(x1[rest], x2[rest], x[rest], lo[rest], hi[rest], 48)
+    return t
+
+def bezier_t(x1, x2, x):
+    """ Solve bezier_x(t) == x of the curves from (0, 0) to (1, 1).
+
+    x1 and x2 are the x of the control points, bezier_x is monotonic if they are in range [0, 1],
+    otherwise one of the roots is found. The arguments are broadcast.
+
+    @return the t in range [0, 1] of which bezier_x(t) is within 1e-12 from x
+    """
+    x1, x2, x = np.broadcast_arrays(x1, x2, x)
+    shape = x.shape
+    x1, x2, x = (a.astype(np.float64).ravel() for a in (x1, x2, x))
+    t = _solve_t(x1, x2, x, np.zeros(x.shape), np.ones(x.shape), np.clip(x, 0.0, 1.0), _NEWTON_ITERATIONS*2)
+    return t.reshape(shape)
+
+def bezier_basis(t):
+    """ @return the weights of y1, y2 and the constant term of bezier_y(t) """
+    s = 1 - t
+    return 3*s*s*t, 3*s*t*t, t*t*t
+
+
+class _TTables:
+    """ The t of bezier_x(t) == k/N, k = 0, 1, ..., N, of the vmd curves, a row for each (x1, x2)
+    pair solved on the first use.
+    """
+    def __init__(self):
+        self.__table = np.zeros((128*128, _T_TABLE_SIZE + 1))
+        self.__solved = np.zeros(128*128, dtype=bool)
+
+    def solve(self, codes):
+        new = np.unique(codes[~self.__solved[codes]])
+        if new.size:
+            x = np.tile(np.arange(_T_TABLE_SIZE + 1) / _T_TABLE_SIZE, len(new))
+            x1, x2 = np.repeat(new//128, _T_TABLE_SIZE + 1) / 127.0, np.repeat(new%128, _T_TABLE_SIZE + 1) / 127.0
+            t = _solve_t(x1, x2, x, np.zeros(x.shape), np.ones(x.shape), x.copy(), _NEWTON_ITERATIONS*2)
+            self.__table[new] = t.reshape(len(new), -1)
+            self.__solved[new] = True
+
+    def bracket(self, codes, x):
+        """ @return (lo, hi, t) the brackets of the roots and the estimated roots """
+        table = self.__table.reshape(-1)
+        base = codes * (_T_TABLE_SIZE + 1)
+        pos = x * _T_TABLE_SIZE
+        i = np.minimum(pos.astype(np.intp), _T_TABLE_SIZE - 1)
+        lo, hi = table[base + i], table[base + i + 1]
+        return lo, hi, lo + (hi - lo)*(pos - i)
+
+_t_tables = _TTables()
+
+def curve_codes(x1, x2):
+    """ Identify the vmd curves by the x of the control points in range [0, 127] and solve the
+    cached tables of the new ones.
+
+    @return the int array of the codes of the curves for ``curve_t``
+    """
+    codes = (np.clip(np.asarray(x1, dtype=np.intp), 0, 127)*128 + np.clip(np.asarray(x2, dtype=np.intp), 0, 127)).reshape(-1)
+    _t_tables.solve(codes)
+    return codes
+
+def curve_t(codes, x):
+    """ Solve bezier_x(t) == x of the vmd curves.
+
+    @param codes the codes from ``curve_codes`` of each value
+    @param x the ratios in range [0, 1], a float64 array of the shape of ``codes``
+    """
+    x = np.clip(np.asarray(x, dtype=np.float64).reshape(-1), 0.0, 1.0)
+    lo, hi, t = _t_tables.bracket(codes, x)
+    return _solve_t((codes//128) / 127.0, (codes%128) / 127.0, x, lo, hi, t, _NEWTON_ITERATIONS)
+
+def bezier_ratio(curves, x):
+    """ Evaluate the vmd interpolation curves at ``x``.
+
+    @param curves the (x1, y1, x2, y2) of each curve in range [0, 127], an array of shape (..., 4)
+    @param x the ratios of the frames in the spans, broadcast with curves[..., 0]
+    """
+    curves, x = np.broadcast_arrays(np.asarray(curves), np.asarray(x, dtype=np.float64)[..., None])
+    shape = x.shape[:-1]
+    curves = curves.reshape(-1, 4)
+    t = curve_t(curve_codes(curves[:, 0], curves[:, 2]), x[..., 0])
+    b1, b2, b3 = bezier_basis(t)
+    return (b1*curves[:, 1]/127.0 + b2*curves[:, 3]/127.0 + b3).reshape(shape)
+
+
+def solve_x(points, x):
+    """ Solve the t of a curve at the values ``x`` of the first coordinate.
+
+    @param points the 4 points of the curve, an array like of shape (4, D), the first coordinates of
+        the control points are expected between the ends
+    @param x an array like of the values
+    @return the t in range [0, 1] of the shape of ``x``
+    """
+    px = np.asarray(points, dtype=np.float64)[:, 0]
+    dx = px[3] - px[0]
+    x = np.asarray(x, dtype=np.float64)
+    if dx == 0:
+        return np.zeros(x.shape)
+    return bezier_t((px[1] - px[0]) / dx, (px[2] - px[0]) / dx, (x - px[0]) / dx)
+
+def _blossom(points, u1, u2, u3):
+    """ de Casteljau's steps by different t, the point of the curve if all of them are equal """
+    p = points[None]
+    for u in (u1, u2, u3):
+        u = u[:, None, None]
+        p = (1 - u)*p[:, :-1] + u*p[:, 1:]
+    return p[:, 0]
+
+def split(points, t):
+    """ Split a curve at the sorted values ``t`` at once.
+
+    @param points the 4 points of the curve, an array like of shape (4, D)
+    @return the points of the len(t) + 1 pieces, an array of shape (len(t) + 1, 4, D)
+    """
+    points = np.asarray(points, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64).reshape(-1)
+    a, b = np.append(0.0, t), np.append(t, 1.0)
+    ret = np.stack((_blossom(points, a, a, a), _blossom(points, a, a, b),
+                    _blossom(points, a, b, b), _blossom(points, b, b, b)), axis=1)
+    ret[0, 0], ret[-1, -1] = points[0], points[-1]
+    return ret
+
+def split_by_x(points, x):
+    """ Split a curve at the sorted values ``x`` of the first coordinate at once.
+
+    @return the points of the len(x) + 1 pieces, see ``split``
+    """
+    return split(points, solve_x(points, x))
@@ -0,0 +1,632 @@
+# -*- coding: utf-8 -*-
+import array
+import collections
+import copy
+import io
+import itertools
+import logging
+import operator
+import struct
+
+import numpy as np
+
+from mmd_tools.core import vmd
+from mmd_tools.core.pmx.bulk import _gc_paused
+
+BONE_KEY_DTYPE = np.dtype([
+    ('name', 'V15'),
+    ('frame_number', '<u4'),
+    ('location', '<f4', (3,)),
+    ('rotation', '<f4', (4,)),
+    ('interp', 'i1', (64,)),
+    ])
+
+SHAPE_KEY_DTYPE = np.dtype([
+    ('name', 'V15'),
+    ('frame_number', '<u4'),
+    ('weight', '<f4'),
+    ])
+
+CAMERA_KEY_DTYPE = np.dtype([
+    ('frame_number', '<u4'),
+    ('distance', '<f4'),
+    ('location', '<f4', (3,)),
+    ('rotation', '<f4', (3,)),
+    ('interp', 'i1', (24,)),
+    ('angle', '<u4'),
+    ('persp', 'i1'),
+    ])
+
+LAMP_KEY_DTYPE = np.dtype([
+    ('frame_number', '<u4'),
+    ('color', '<f4', (3,)),
+    ('direction', '<f4', (3,)),
+    ])
+
+SELF_SHADOW_KEY_DTYPE = np.dtype([
+    ('frame_number', '<u4'),
+    ('mode', 'i1'),
+    ('distance', '<f4'),
+    ])
+
+
+def read_records(fin, count, dtype):
+    """ Read ``count`` fixed size records of ``dtype`` from ``fin``.
+
+    @return (the structured array of the complete records, True if all records were read)
+    """
+    data = fin.read(count * dtype.itemsize)
+    num = len(data) // dtype.itemsize
+    return np.frombuffer(data, dtype=dtype, count=num), num == count
+
+
+def group_by_name(names, decoder=None):
+    """ Group the records by their 15 bytes name fields with one stable sort.
+
+    @param names an array of the raw name fields
+    @return a list of (name, record indices), ordered by the first appearance of each name.
+        The indices of a name keep the record order.
+    """
+    if decoder is None:
+        decoder = vmd._nameDecoder()
+    count = len(names)
+    if count < 1:
+        return []
+    padded = np.zeros((count, 16), dtype=np.uint8)
+    padded[:, :15] = np.ascontiguousarray(names).view(np.uint8).reshape(count, 15)
+    keys = padded.view('>u8') # big endian words, so the order of keys is the order of the bytes
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    sorted_keys = keys[order]
+    changed = np.flatnonzero(np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)) + 1
+    starts = np.concatenate(([0], changed))
+    ends = np.concatenate((changed, [count]))
+
+    groups = collections.OrderedDict()
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        name = decoder.decode(padded[order[start], :15].tobytes())
+        # different raw names can decode to the same name, e.g. with garbage after the terminator
+        groups.setdefault(name, []).append(order[start:end])
+    ret = []
+    for name, parts in groups.items():
+        indices = parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+        ret.append((name, indices))
+    ret.sort(key=lambda x: x[1][0])
+    return ret
+
+
+def bone_frame_keys(records):
+    """ Build BoneFrameKey objects equal to the ones loaded by BoneFrameKey.load().
+    """
+    BoneFrameKey = vmd.BoneFrameKey
+    keys = []
+    with _gc_paused():
+        columns = zip(records['frame_number'].tolist(), records['location'].tolist(),
+                      records['rotation'].tolist(), records['interp'].tolist())
+        for frame_number, location, rotation, interp in columns:
+            k = BoneFrameKey()
+            k.frame_number = frame_number
+            k.location = location
+            k.rotation = rotation if any(rotation) else (0, 0, 0, 1)
+            k.interp = interp
+            keys.append(k)
+    return keys
+
+
+def shape_key_frame_keys(records):
+    """ Build ShapeKeyFrameKey objects equal to the ones loaded by ShapeKeyFrameKey.load().
+    """
+    ShapeKeyFrameKey = vmd.ShapeKeyFrameKey
+    keys = []
+    with _gc_paused():
+        for frame_number, weight in zip(records['frame_number'].tolist(), records['weight'].tolist()):
+            k = ShapeKeyFrameKey()
+            k.frame_number = frame_number
+            k.weight = weight
+            keys.append(k)
+    return keys
+
+
+# (x1, y1, x2, y2) of the x, y, z and rotation curves: x_x1, y_x1, z_x1, r_x1, x_y1, y_y1, ...
+_BONE_INTERP_ORDER = [axis*4 + i for i in range(4) for axis in range(4)]
+# the 4 rows of a bone key interpolation, each row is shifted by one and padded with 0 (index 16),
+# the padded values are unclear
+_BONE_INTERP_LAYOUT = np.array(sum((_BONE_INTERP_ORDER[i:] + [16]*i for i in range(4)), []))
+
+def bone_interpolation(points):
+    """ Lay out the interpolation data of bone keys.
+
+    @param points the control points ((x1, y1), (x2, y2)) of x, y, z and rotation curves of each key,
+        an array like of shape (N, 4, 2, 2) in range [0, 127]
+    @return an int8 array of shape (N, 64)
+    """
+    points = np.asarray(points, dtype=np.int8).reshape(-1, 16)
+    padded = np.zeros((len(points), 17), dtype=np.int8)
+    padded[:, :16] = points
+    return padded[:, _BONE_INTERP_LAYOUT]
+
+
+class _KeyArrays:
+    """ Common methods of the column storages, every attribute is an array of one row per key.
+    """
+    def __len__(self):
+        return len(self.frame_number)
+
+    def take(self, indices):
+        """ @return a new instance of the keys at ``indices``, an index array or a boolean mask """
+        ret = type(self)(0)
+        for k, v in vars(self).items():
+            setattr(ret, k, v[indices])
+        return ret
+
+    @classmethod
+    def concatenate(cls, arrays_list):
+        """ @return a new instance of the keys of ``arrays_list`` in order """
+        ret = cls(0)
+        for k, v in vars(ret).items():
+            setattr(ret, k, np.concatenate([v] + [getattr(a, k) for a in arrays_list]))
+        return ret
+
+
+class BoneKeyArrays(_KeyArrays):
+    """ Column storage of the bone keyframes of one bone.
+
+    Zero rotations are replaced by the identity quaternion (0, 0, 0, 1) as BoneFrameKey does.
+    """
+    def __init__(self, count=0):
+        self.frame_number = np.zeros(count, dtype=np.uint32)
+        self.location = np.zeros((count, 3), dtype=np.float32)
+        self.rotation = np.zeros((count, 4), dtype=np.float32)
+        self.rotation[:, 3] = 1
+        self.interp = np.zeros((count, 64), dtype=np.int8)
+
+    def __repr__(self):
+        return '<BoneKeyArrays count %d>'%len(self)
+
+    @classmethod
+    def from_records(cls, records):
+        ret = cls(0)
+        ret.frame_number = records['frame_number'].astype(np.uint32)
+        ret.location = records['location'].astype(np.float32)
+        ret.rotation = records['rotation'].astype(np.float32)
+        ret.rotation[~ret.rotation.any(axis=1)] = (0, 0, 0, 1)
+        ret.interp = records['interp'].astype(np.int8)
+        return ret
+
+    @classmethod
+    def from_columns(cls, frame_numbers, locations, rotations, interp):
+        """ Build from sequences of the per key values, ``interp`` is an array of shape (N, 64).
+        """
+        ret = cls(0)
+        ret.frame_number = np.array(frame_numbers, dtype=np.uint32).reshape(-1)
+        ret.location = np.array(locations, dtype=np.float32).reshape(-1, 3)
+        ret.rotation = np.array(rotations, dtype=np.float32).reshape(-1, 4)
+        ret.interp = np.asarray(interp, dtype=np.int8).reshape(-1, 64)
+        return ret
+
+    @classmethod
+    def from_frame_keys(cls, keys):
+        """ Build from a list of BoneFrameKey objects. """
+        return cls.from_columns([k.frame_number for k in keys], [k.location for k in keys],
+                                [k.rotation for k in keys], [k.interp for k in keys])
+
+    def to_records(self):
+        """ @return the BONE_KEY_DTYPE records with empty names """
+        records = np.zeros(len(self), dtype=BONE_KEY_DTYPE)
+        records['frame_number'] = self.frame_number
+        records['location'] = self.location
+        records['rotation'] = self.rotation
+        records['interp'] = self.interp
+        return records
+
+    def to_frame_keys(self):
+        return bone_frame_keys(self.to_records())
+
+
+class ShapeKeyArrays(_KeyArrays):
+    """ Column storage of the keyframes of one shape key.
+    """
+    def __init__(self, count=0):
+        self.frame_number = np.zeros(count, dtype=np.uint32)
+        self.weight = np.zeros(count, dtype=np.float32)
+
+    def __repr__(self):
+        return '<ShapeKeyArrays count %d>'%len(self)
+
+    @classmethod
+    def from_records(cls, records):
+        ret = cls(0)
+        ret.frame_number = records['frame_number'].astype(np.uint32)
+        ret.weight = records['weight'].astype(np.float32)
+        return ret
+
+    @classmethod
+    def from_columns(cls, frame_numbers, weights):
+        ret = cls(0)
+        ret.frame_number = np.array(frame_numbers, dtype=np.uint32).reshape(-1)
+        ret.weight = np.array(weights, dtype=np.float32).reshape(-1)
+        return ret
+
+    @classmethod
+    def from_frame_keys(cls, keys):
+        """ Build from a list of ShapeKeyFrameKey objects. """
+        return cls.from_columns([k.frame_number for k in keys], [k.weight for k in keys])
+
+    def to_records(self):
+        """ @return the SHAPE_KEY_DTYPE records with empty names """
+        records = np.zeros(len(self), dtype=SHAPE_KEY_DTYPE)
+        records['frame_number'] = self.frame_number
+        records['weight'] = self.weight
+        return records
+
+    def to_frame_keys(self):
+        return shape_key_frame_keys(self.to_records())
+
+
+def unique_frames(arrays):
+    """ Sort the keys by frame number, the last one of the keys of the same frame is kept.
+    """
+    order = np.argsort(arrays.frame_number, kind='stable')
+    frames = arrays.frame_number[order]
+    last = np.append(frames[1:] != frames[:-1], True)
+    return arrays.take(order[last])
+
+
+def read_frame_keys(fin, count, frame_class, decoder=None):
+    """ Read ``count`` BoneFrameKey or ShapeKeyFrameKey records in bulk.
+
+    @return (a list of (name, list of frame keys) ordered by the first appearance of each name,
+        True if all records were read)
+    """
+    if frame_class is vmd.BoneFrameKey:
+        dtype, frame_keys = BONE_KEY_DTYPE, bone_frame_keys
+    elif frame_class is vmd.ShapeKeyFrameKey:
+        dtype, frame_keys = SHAPE_KEY_DTYPE, shape_key_frame_keys
+    else:
+        raise ValueError('unsupported frame class %s'%frame_class.__name__)
+    records, complete = read_records(fin, count, dtype)
+    keys = frame_keys(records)
+    return [(name, [keys[i] for i in indices.tolist()]) for name, indices in group_by_name(records['name'], decoder)], complete
+
+
+def read_keys(fin, arrays_class, decoder=None):
+    """ Read a bone or morph keyframe block.
+
+    @param arrays_class BoneKeyArrays or ShapeKeyArrays
+    @return (an OrderedDict of {name: arrays_class}, True if the block is complete)
+    """
+    dtype = BONE_KEY_DTYPE if arrays_class is BoneKeyArrays else SHAPE_KEY_DTYPE
+    count, = struct.unpack('<L', fin.read(4))
+    records, complete = read_records(fin, count, dtype)
+    ret = collections.OrderedDict()
+    for name, indices in group_by_name(records['name'], decoder):
+        ret[name] = arrays_class.from_records(records[indices])
+    return ret, complete
+
+
+STREAM_CHUNK_SIZE = 65536
+
+_KEY_SECTIONS = (
+    ('boneAnimation', BONE_KEY_DTYPE, bone_frame_keys),
+    ('shapeKeyAnimation', SHAPE_KEY_DTYPE, shape_key_frame_keys),
+    )
+
+_LIST_SECTIONS = (
+    ('cameraAnimation', vmd.CameraKeyFrameKey),
+    ('lampAnimation', vmd.LampKeyFrameKey),
+    ('selfShadowAnimation', vmd.SelfShadowFrameKey),
+    ('propertyAnimation', vmd.PropertyFrameKey),
+    )
+
+
+def frame_mask(frame_numbers, frame_range):
+    start, end = frame_range
+    mask = np.ones(len(frame_numbers), dtype=bool)
+    if start is not None:
+        mask &= frame_numbers >= start
+    if end is not None:
+        mask &= frame_numbers <= end
+    return mask
+
+def in_frame_range(frame_number, frame_range):
+    start, end = frame_range
+    return (start is None or frame_number >= start) and (end is None or frame_number <= end)
+
+
+def iter_keys(fin, frame_range=None, bone_names=None, morph_names=None, chunk_size=None):
+    """ Read the keyframes following the header of a vmd file section by section.
+
+    The bone and morph keyframes are read in chunks of ``chunk_size`` records, and the
+    keyframe objects are only created for the records passing the filters, so the memory
+    use is bounded by the chunk size and the selected keyframes.
+
+    @param frame_range (start, end) of the frames to keep, inclusive. None of either end means unbounded.
+    @param bone_names the names of the bones to keep, all bones if None
+    @param morph_names the names of the morphs to keep, all morphs if None
+    @return an iterator of (animation attribute of vmd.File, name, list of frame keys).
+        The name is None for the camera, lamp, self shadow and property animations.
+        The keys of a name can be split into several items, which are yielded in file order.
+        struct.error is raised after the last complete keyframe if the data is truncated.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    decoder = vmd._nameDecoder()
+    for (attr, dtype, frame_keys), names in zip(_KEY_SECTIONS, (bone_names, morph_names)):
+        count, = struct.unpack('<L', fin.read(4))
+        while count > 0:
+            records, complete = read_records(fin, min(count, chunk_size), dtype)
+            count -= len(records)
+            if frame_range is not None:
+                records = records[frame_mask(records['frame_number'], frame_range)]
+            groups = group_by_name(records['name'], decoder)
+            if names is not None:
+                groups = [(name, indices) for name, indices in groups if name in names]
+            if groups:
+                keys = iter(frame_keys(records[np.concatenate([indices for name, indices in groups])]))
+                for name, indices in groups:
+                    yield attr, name, [next(keys) for i in range(len(indices))]
+            if not complete:
+                raise struct.error('truncated %s data'%attr)
+
+    for attr, frame_class in _LIST_SECTIONS:
+        count, = struct.unpack('<L', fin.read(4))
+        keys = []
+        try:
+            for i in range(count):
+                k = frame_class()
+                k.load(fin)
+                if frame_range is None or in_frame_range(k.frame_number, frame_range):
+                    keys.append(k)
+        except struct.error:
+            if keys:
+                yield attr, None, keys
+            raise
+        if keys:
+            yield attr, None, keys
+
+
+_KEY_DTYPES = {
+    vmd.BoneFrameKey: BONE_KEY_DTYPE,
+    vmd.ShapeKeyFrameKey: SHAPE_KEY_DTYPE,
+    vmd.CameraKeyFrameKey: CAMERA_KEY_DTYPE,
+    vmd.LampKeyFrameKey: LAMP_KEY_DTYPE,
+    vmd.SelfShadowFrameKey: SELF_SHADOW_KEY_DTYPE,
+    }
+
+# the fields which are not saved as is, see the save() of the frame key classes
+_KEY_GETTERS = {
+    vmd.CameraKeyFrameKey: {'persp': lambda k: 0 if k.persp else 1},
+    vmd.SelfShadowFrameKey: {'distance': lambda k: (10000 - k.distance)/100000},
+    }
+
+
+class _UnpackableKeys(Exception):
+    """ The keys hold values which are not accepted by struct.pack(), they are saved one by one
+    to raise the same error as before.
+    """
+
+
+def _column(values, dtype, shape):
+    """ Convert the values of a field to an array, accepting the same values as struct.pack().
+    """
+    count = len(values)
+    try:
+        if shape and count > 0 and set(map(len, values)) != {shape[0]}:
+            raise _UnpackableKeys
+        if dtype.kind == 'f':
+            if shape:
+                values = itertools.chain.from_iterable(values)
+            data = np.frombuffer(array.array('d', values), dtype=np.float64)
+            with np.errstate(over='ignore'):
+                column = data.astype(dtype)
+            if np.count_nonzero(np.isinf(column)) != np.count_nonzero(np.isinf(data)):
+                raise _UnpackableKeys # too large for a float
+            return column.reshape((count,) + shape)
+        if shape: # signed bytes, array('b') accepts the same values as struct.pack('b')
+            column = np.frombuffer(array.array('b', itertools.chain.from_iterable(values)), dtype=np.int8)
+            return column.reshape((count,) + shape)
+        column = np.array(values)
+    except (TypeError, ValueError, OverflowError):
+        raise _UnpackableKeys
+    if count > 0:
+        info = np.iinfo(dtype)
+        if column.dtype.kind not in 'biu' or column.min() < info.min or column.max() > info.max:
+            raise _UnpackableKeys
+    return column.astype(dtype)
+
+
+def _key_records(keys, frame_class):
+    """ Build the records of frame key objects, the name fields are left empty.
+    """
+    dtype = _KEY_DTYPES[frame_class]
+    getters = _KEY_GETTERS.get(frame_class, {})
+    records = np.zeros(len(keys), dtype=dtype)
+    for field in dtype.names:
+        if field == 'name':
+            continue
+        values = list(map(getters.get(field) or operator.attrgetter(field), keys))
+        field_dtype = dtype.fields[field][0]
+        records[field] = _column(values, field_dtype.base, field_dtype.shape)
+    return records
+
+
+def _save_keys(keys, name_data=b''):
+    fout = io.BytesIO()
+    for k in keys:
+        fout.write(name_data)
+        k.save(fout)
+    return fout.getvalue()
+
+
+def pack_frame_keys(animation, frame_class):
+    """ Pack a bone or morph keyframe block, the same bytes as _AnimationBase.save() writes.
+
+    @param animation a mapping of {name: list of frame keys or BoneKeyArrays/ShapeKeyArrays}
+    @return bytes
+    """
+    count = sum(len(keys) for keys in animation.values())
+    data = [struct.pack('<L', count)]
+    for name, keys in animation.items():
+        if len(keys) < 1:
+            continue
+        name_data = struct.pack('<15s', vmd._toShiftJisBytes(name))
+        if isinstance(keys, (BoneKeyArrays, ShapeKeyArrays)):
+            records = keys.to_records()
+        else:
+            try:
+                records = _key_records(keys, frame_class)
+            except _UnpackableKeys:
+                data.append(_save_keys(keys, name_data))
+                continue
+        records['name'] = np.void(name_data)
+        data.append(records.tobytes())
+    return b''.join(data)
+
+
+def pack_list_keys(keys, frame_class):
+    """ Pack a camera, lamp, self shadow or property keyframe block, the same bytes as
+    _AnimationListBase.save() writes.
+
+    @return bytes
+    """
+    data = struct.pack('<L', len(keys))
+    if frame_class in _KEY_DTYPES:
+        try:
+            return data + _key_records(keys, frame_class).tobytes()
+        except _UnpackableKeys:
+            pass
+    return data + _save_keys(keys)
+
+
+# the animations of a ColumnarFile holding {name: arrays} and the ones holding lists of keys
+KEY_ANIMATIONS = ('boneAnimation', 'shapeKeyAnimation')
+LIST_ANIMATIONS = collections.OrderedDict((
+    ('cameraAnimation', vmd.CameraAnimation),
+    ('lampAnimation', vmd.LampAnimation),
+    ('selfShadowAnimation', vmd.SelfShadowAnimation),
+    ('propertyAnimation', vmd.PropertyAnimation),
+    ))
+
+def iter_animations(motion, attrs):
+    """ Yield (attr, animation) of ``motion`` for the names ``attrs``, a missing animation is empty.
+    """
+    for attr in attrs:
+        animation = getattr(motion, attr)
+        if animation is None:
+            animation = {} if attr in KEY_ANIMATIONS else ()
+        yield attr, animation
+
+
+class ColumnarFile(vmd.File):
+    """ vmd.File variant which keeps the bone and morph keyframes in numpy arrays.
+
+    boneAnimation and shapeKeyAnimation are OrderedDicts of {name: BoneKeyArrays/ShapeKeyArrays}.
+    The other animations are the usual vmd objects.
+    """
+    @classmethod
+    def empty_like(cls, source):
+        """ A motion without keys which has a copy of the header of ``source``.
+        """
+        ret = cls()
+        ret.header = copy.copy(source.header) if source.header else vmd.Header()
+        for attr in KEY_ANIMATIONS:
+            setattr(ret, attr, collections.OrderedDict())
+        for attr, animation_class in LIST_ANIMATIONS.items():
+            setattr(ret, attr, animation_class())
+        return ret
+
+    def load(self, **args):
+        path = args['filepath']
+
+        with open(path, 'rb') as fin:
+            self.filepath = path
+            self.header = vmd.Header()
+            self.boneAnimation = collections.OrderedDict()
+            self.shapeKeyAnimation = collections.OrderedDict()
+            self.cameraAnimation = vmd.CameraAnimation()
+            self.lampAnimation = vmd.LampAnimation()
+            self.selfShadowAnimation = vmd.SelfShadowAnimation()
+            self.propertyAnimation = vmd.PropertyAnimation()
+
+            self.header.load(fin)
+            decoder = vmd._nameDecoder()
+            try:
+                for attr, arrays_class in (('boneAnimation', BoneKeyArrays), ('shapeKeyAnimation', ShapeKeyArrays)):
+                    keys, complete = read_keys(fin, arrays_class, decoder)
+                    setattr(self, attr, keys)
+                    if not complete:
+                        raise struct.error('truncated %s'%attr)
+                self.cameraAnimation.load(fin)
+                self.lampAnimation.load(fin)
+                self.selfShadowAnimation.load(fin)
+                self.propertyAnimation.load(fin)
+            except struct.error:
+                pass # no valid camera/lamp data
+
+    def to_file(self):
+        """ Build the equivalent vmd.File. The other animations are shared, not copied.
+        """
+        ret = vmd.File()
+        ret.__dict__.update(self.__dict__)
+        ret.boneAnimation = vmd.BoneAnimation()
+        for name, keys in self.boneAnimation.items():
+            ret.boneAnimation[name] = keys.to_frame_keys()
+        ret.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+        for name, keys in self.shapeKeyAnimation.items():
+            ret.shapeKeyAnimation[name] = keys.to_frame_keys()
+        return ret
+
+
+def load(path):
+    """ Same as vmd.File().load(filepath=path) but returns a ColumnarFile.
+    """
+    ret = ColumnarFile()
+    ret.load(filepath=path)
+    logging.info('Loaded %d bone and %d morph keyframes from %s', sum(map(len, ret.boneAnimation.values())),
+                 sum(map(len, ret.shapeKeyAnimation.values())), path)
+    return ret
+
+
+# the version of the data stored by load_cached(), increase it when the loaded data changes
+CACHE_VERSION = 1
+
+# the number of the motions kept in memory by load_cached()
+SESSION_CACHE_SIZE = 8
+
+_session_motions = collections.OrderedDict()
+
+def load_cached(path, cache=None, digest=None):
+    """ Same as load() but reuses the motions loaded in this session, and the motions stored in
+    ``cache``, a core.cache.DiskCache, if it is not None. Entries are keyed by the file content.
+
+    The key arrays are shared by the loads of the same content and must not be modified in place,
+    the other keys are copied.
+
+    @param digest the core.cache.file_digest() of the file if the caller already has it
+    """
+    import copy
+    from mmd_tools.core.cache import file_digest
+    key = digest or file_digest(path)
+    motion = _session_motions.pop(key, None)
+    if motion is None and cache is not None:
+        motion = cache.get('vmd', CACHE_VERSION, key)
+        if not isinstance(motion, ColumnarFile):
+            motion = None
+    if motion is None:
+        motion = load(path)
+        if cache is not None:
+            cache.put('vmd', CACHE_VERSION, key, motion)
+    else:
+        logging.info('Reused the motion of %s', path)
+    _session_motions[key] = motion
+    while len(_session_motions) > SESSION_CACHE_SIZE:
+        _session_motions.popitem(last=False)
+
+    ret = ColumnarFile()
+    ret.__dict__.update(motion.__dict__)
+    ret.filepath = path
+    ret.boneAnimation = collections.OrderedDict(motion.boneAnimation)
+    ret.shapeKeyAnimation = collections.OrderedDict(motion.shapeKeyAnimation)
+    for attr, frame_class in _LIST_SECTIONS:
+        keys = getattr(motion, attr)
+        setattr(ret, attr, type(keys)())
+        getattr(ret, attr).extend(copy.copy(k) for k in keys)
+    return ret
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
 import re
 
@@ -8,6 +9,7 @@ import math
 import mathutils
 
 from mmd_tools.core import vmd
+from mmd_tools.core.vmd import bulk as vmd_bulk
 from mmd_tools.core.camera import MMDCamera
 from mmd_tools.core.lamp import MMDLamp
 
@@ -97,11 +99,8 @@ class _FCurve:
             elif len(frames) == 1:
                 yield [kp.co[1], self.getVMDControlPoints(prev_kp, kp)]
             elif prev_kp.interpolation == 'BEZIER':
-                bz = _FnBezier.from_fcurve(prev_kp, kp)
-                for f in frames[:-1]:
-                    b1, bz, pt = bz.split_by_x(f)
-                    yield [pt.y, self.__toVMDControlPoints(b1)]
-                yield [bz.points[-1].y, self.__toVMDControlPoints(bz)]
+                for bz in _FnBezier.from_fcurve(prev_kp, kp).split_by_x_list(frames[:-1]):
+                    yield [bz.points[-1].y, self.__toVMDControlPoints(bz)]
             else:
                 for f in frames:
                     yield [evaluate(f), ((20, 20), (107, 107))]
@@ -157,29 +156,6 @@ class VMDExporter:
         #t2 = prev_q.rotation_difference(-curr_q).angle
         return -curr_q if t2 < t1 else curr_q
 
-    @staticmethod
-    def __getVMDBoneInterpolation(x_axis, y_axis, z_axis, rotation):
-        x_x1, x_y1 = x_axis[0]
-        x_x2, x_y2 = x_axis[1]
-        y_x1, y_y1 = y_axis[0]
-        y_x2, y_y2 = y_axis[1]
-        z_x1, z_y1 = z_axis[0]
-        z_x2, z_y2 = z_axis[1]
-        r_x1, r_y1 = rotation[0]
-        r_x2, r_y2 = rotation[1]
-        #return [ # minimum acceptable data
-        #    x_x1, 0, 0, 0, x_y1, 0, 0, 0, x_x2, 0, 0, 0, x_y2, 0, 0, 0,
-        #    y_x1, 0, 0, 0, y_y1, 0, 0, 0, y_x2, 0, 0, 0, y_y2, 0, 0, 0,
-        #    z_x1, 0, 0, 0, z_y1, 0, 0, 0, z_x2, 0, 0, 0, z_y2, 0, 0, 0,
-        #    r_x1, 0, 0, 0, r_y1, 0, 0, 0, r_x2, 0, 0, 0, r_y2, 0, 0, 0,
-        #    ]
-        return [ # full data, indices in [2, 3, 31, 46, 47, 61, 62, 63] are unclear
-            x_x1, y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,
-            y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,
-            z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,
-            r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,    0,
-            ]
-
     @staticmethod
     def __pickRotationInterpolation(rotation_interps):
         for ir in rotation_interps:
@@ -212,7 +188,7 @@ class VMDExporter:
             logging.warning('[WARNING] armature "%s" has no animation data', armObj.name)
             return None
 
-        vmd_bone_anim = vmd.BoneAnimation()
+        vmd_bone_anim = collections.OrderedDict()
 
         anim_bones = {}
         rePath = re.compile(r'^pose\.bones\["(.+)"\]\.([a-z_]+)$')
@@ -256,25 +232,25 @@ class VMDExporter:
         for bone, bone_curves in anim_bones.items():
             key_name = bone.mmd_bone.name_j or bone.name
             assert(key_name not in vmd_bone_anim) # VMD bone name collision
-            frame_keys = vmd_bone_anim[key_name]
 
             get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
             converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
             prev_rot = None
+            frame_numbers, locations, rotations, interps = [], [], [], []
             for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves):
-                key = vmd.BoneFrameKey()
-                key.frame_number = frame_number - self.__frame_start
-                key.location = converter.convert_location([x[0], y[0], z[0]])
+                frame_numbers.append(frame_number - self.__frame_start)
+                locations.append(converter.convert_location([x[0], y[0], z[0]]))
                 curr_rot = converter.convert_rotation(get_xyzw([rx[0], ry[0], rz[0], rw[0]]))
                 if prev_rot is not None:
                     curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
                 prev_rot = curr_rot
-                key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
+                rotations.append(curr_rot[1:] + curr_rot[0:1]) # (w, x, y, z) to (x, y, z, w)
                 #FIXME we can only choose one interpolation from (rw, rx, ry, rz) for bone's rotation
                 ir = self.__pickRotationInterpolation([rw[1], rx[1], ry[1], rz[1]])
                 ix, iy, iz = converter.convert_interpolation([x[1], y[1], z[1]])
-                key.interp = self.__getVMDBoneInterpolation(ix, iy, iz, ir)
-                frame_keys.append(key)
+                interps.append((ix, iy, iz, ir))
+            frame_keys = vmd_bone_anim[key_name] = vmd_bulk.BoneKeyArrays.from_columns(
+                frame_numbers, locations, rotations, vmd_bulk.bone_interpolation(interps))
             logging.info('(bone) frames:%5d  name: %s', len(frame_keys), key_name)
         logging.info('---- bone animations:%5d  source: %s', len(vmd_bone_anim), armObj.name)
         return vmd_bone_anim
@@ -291,7 +267,7 @@ class VMDExporter:
             logging.warning('[WARNING] mesh "%s" has no animation data', meshObj.name)
             return None
 
-        vmd_morph_anim = vmd.ShapeKeyAnimation()
+        vmd_morph_anim = collections.OrderedDict()
 
         key_blocks = meshObj.data.shape_keys.key_blocks
         def __get_key_block(key):
@@ -316,16 +292,15 @@ class VMDExporter:
 
             key_name = kb.name
             assert(key_name not in vmd_morph_anim)
-            anim = vmd_morph_anim[key_name]
 
             curve = _FCurve(kb.value)
             curve.setFCurve(fcurve)
 
+            frame_numbers, weights = [], []
             for frame_number, weight in self.__allFrameKeys([curve]):
-                key = vmd.ShapeKeyFrameKey()
-                key.frame_number = frame_number - self.__frame_start
-                key.weight = weight[0]
-                anim.append(key)
+                frame_numbers.append(frame_number - self.__frame_start)
+                weights.append(weight[0])
+            anim = vmd_morph_anim[key_name] = vmd_bulk.ShapeKeyArrays.from_columns(frame_numbers, weights)
             logging.info('(mesh) frames:%5d  name: %s', len(anim), key_name)
         logging.info('---- morph animations:%5d  source: %s', len(vmd_morph_anim), meshObj.name)
         return vmd_morph_anim
@@ -483,7 +458,7 @@ class VMDExporter:
             self.__bone_converter_cls = vmd.importer.BoneConverterPoseMode
 
         if armature or mesh:
-            vmdFile = vmd.File()
+            vmdFile = vmd_bulk.ColumnarFile()
             vmdFile.header = vmd.Header()
             vmdFile.header.model_name = args.get('model_name', '')
             vmdFile.boneAnimation = self.__exportBoneAnimation(armature)
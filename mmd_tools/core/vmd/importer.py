@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
 import os
 
@@ -8,6 +9,7 @@ import math
 from mathutils import Vector, Quaternion
 
 from mmd_tools import utils
+from mmd_tools import bpyutils
 from mmd_tools.bpyutils import matmul
 from mmd_tools.core import vmd
 from mmd_tools.core.camera import MMDCamera
@@ -177,16 +179,20 @@ class _FnBezier:
     def split_by_x(self, x):
         return self.split(self.axis_to_t(x))
 
+    def split_by_x_list(self, x_list):
+        """ Split the curve at the sorted values of x at once.
+
+        @return a list of len(x_list) + 1 curves
+        """
+        from mmd_tools.core.vmd import bezier
+        return [_FnBezier(*(Vector(p) for p in points)) for points in bezier.split_by_x(self.points, x_list)]
+
     def evaluate_by_x(self, x):
         return self.evaluate(self.axis_to_t(x))
 
     def axis_to_t(self, val, axis=0):
-        p0, p1, p2, p3 = self._p0[axis], self._p1[axis], self._p2[axis], self._p3[axis]
-        a = p3 - p0 + 3 * (p1 - p2)
-        b = 3 * (p0 - 2*p1 + p2)
-        c = 3 * (p1 - p0)
-        d = p0 - val
-        return next(self.__find_roots(a, b, c, d))
+        from mmd_tools.core.vmd import bezier
+        return float(bezier.solve_x([(p[axis],) for p in self.points], val))
 
     def find_critical(self):
         p0, p1, p2, p3 = self._p0.y, self._p1.y, self._p2.y, self._p3.y
@@ -195,69 +201,60 @@ class _FnBezier:
             a = 3 * (p3 - p0 + 3 * (p1 - p2))
             b = 6 * (p0 - 2*p1 + p2)
             c = 3 * (p1 - p0)
-            yield from self.__find_roots(0, a, b, c)
+            yield from self.__find_roots(a, b, c)
 
     @staticmethod
-    def __find_roots(a, b, c, d): # a*t*t*t + b*t*t + c*t + d = 0
-        #TODO fix precision errors (ex: t=0 and t=1) and improve performance
+    def __find_roots(a, b, c): # a*t*t + b*t + c = 0
         if a == 0:
-            if b == 0:
-                t = -d/c
-                if 0 <= t <= 1:
-                    yield t
-            else:
-                D = c*c - 4*b*d
-                if D < 0:
-                    return
-                D = D**0.5
-                b2 = 2*b
-                t = (-c + D)/b2
-                if 0 <= t <= 1:
-                    yield t
-                t = (-c - D)/b2
+            if b != 0:
+                t = -c/b
                 if 0 <= t <= 1:
                     yield t
             return
-
-        def _sqrt3(v):
-            return -((-v)**(1/3)) if v < 0 else v**(1/3)
-
-        A = b*c/(6*a*a) - b*b*b/(27*a*a*a) - d/(2*a)
-        B = c/(3*a) - b*b/(9*a*a)
-        b_3a = -b/(3*a)
-        D = A*A + B*B*B
-
-        if D > 0:
-            D = D**0.5
-            t = b_3a + _sqrt3(A+D) + _sqrt3(A-D)
-            if 0 <= t <= 1:
-                yield t
-        elif D == 0:
-            t = b_3a + _sqrt3(A)*2
-            if 0 <= t <= 1:
-                yield t
-            t = b_3a - _sqrt3(A)
-            if 0 <= t <= 1:
-                yield t
-        else:
-            R = A / (-B*B*B)**0.5
-            t = b_3a + 2*(-B)**0.5 * math.cos(math.acos(R) / 3)
-            if 0 <= t <= 1:
-                yield t
-            t = b_3a + 2*(-B)**0.5 * math.cos((math.acos(R) + 2*math.pi) / 3)
-            if 0 <= t <= 1:
-                yield t
-            t = b_3a + 2*(-B)**0.5 * math.cos((math.acos(R) - 2*math.pi) / 3)
-            if 0 <= t <= 1:
-                yield t
+        D = b*b - 4*a*c
+        if D < 0:
+            return
+        D = D**0.5
+        a2 = 2*a
+        t = (-b + D)/a2
+        if 0 <= t <= 1:
+            yield t
+        t = (-b - D)/a2
+        if 0 <= t <= 1:
+            yield t
 
 
 class VMDImporter:
+    # the converted bone keys of the recent imports,
+    # {(motion key, conversion options): {(motion bone name, rest pose signature): keyframe points}}
+    __converted_motions = collections.OrderedDict()
+
     def __init__(self, filepath, scale=1.0, bone_mapper=None, use_pose_mode=False,
-            convert_mmd_camera=True, convert_mmd_lamp=True, frame_margin=5, use_mirror=False):
-        self.__vmdFile = vmd.File()
-        self.__vmdFile.load(filepath=filepath)
-        logging.debug(str(self.__vmdFile.header))
+            convert_mmd_camera=True, convert_mmd_lamp=True, frame_margin=5, use_mirror=False,
+            frame_range=None, bone_names=None, morph_names=None, key_tolerances=None):
+        """
+        @param frame_range (start, end) of the motion frames to import, inclusive
+        @param bone_names the names of the motion bones to import, all bones if None
+        @param morph_names the names of the motion morphs to import, all morphs if None
+        @param key_tolerances (location, rotation in degrees, morph weight) tolerances to remove
+            the bone and morph keys reproduced by the other keys before importing, all keys are
+            imported if None
+        """
+        from mmd_tools.core.cache import file_digest
+        digest = file_digest(filepath)
+        motion = self.__loadMotion(filepath, digest, frame_range, bone_names, morph_names)
+        logging.debug(str(motion.header))
+        self.reduction_report = None
+        if key_tolerances is not None:
+            from mmd_tools.core.vmd import reduction
+            motion, self.reduction_report = reduction.reduce_keys(motion, *key_tolerances)
+            motion.filepath = filepath
+        # the bone and morph tracks are lists of frame keys or the arrays of vmd.bulk
+        self.__vmdFile = motion
+        self.__motion_key = (digest, None if frame_range is None else tuple(frame_range),
+                             None if bone_names is None else frozenset(bone_names),
+                             None if morph_names is None else frozenset(morph_names),
+                             None if key_tolerances is None else tuple(key_tolerances))
         self.__scale = scale
         self.__convert_mmd_camera = convert_mmd_camera
         self.__convert_mmd_lamp = convert_mmd_lamp
@@ -267,6 +264,28 @@ class VMDImporter:
         self.__mirror = use_mirror
 
 
+    @staticmethod
+    def __loadMotion(filepath, digest, frame_range, bone_names, morph_names):
+        """ Load the motion. A filtered motion is streamed from the file and only the selected keys
+        are kept, the whole motion is reused from the motions parsed in this session or the cache
+        folder.
+
+        @return a vmd.File of the filtered motion or a vmd.bulk.ColumnarFile of the whole motion
+        """
+        if frame_range is not None or bone_names is not None or morph_names is not None:
+            motion = vmd.File()
+            motion.load(filepath=filepath, frame_range=frame_range, bone_names=bone_names, morph_names=morph_names)
+            return motion
+
+        from mmd_tools.core.cache import DiskCache
+        from mmd_tools.core.vmd import bulk
+        cache = None
+        cache_folder = bpyutils.addon_preferences('cache_folder', '')
+        if cache_folder:
+            cache_size = bpyutils.addon_preferences('cache_size', 1024)
+            cache = DiskCache(bpy.path.abspath(cache_folder), cache_size*1024*1024)
+        return bulk.load_cached(filepath, cache, digest)
+
     @staticmethod
     def __minRotationDiff(prev_q, curr_q):
         t1 = (prev_q.w - curr_q.w)**2 + (prev_q.x - curr_q.x)**2 + (prev_q.y - curr_q.y)**2 + (prev_q.z - curr_q.z)**2
@@ -327,6 +346,109 @@ class VMDImporter:
                 compatible_rotation = lambda prev, curr: curr.make_compatible(prev) or curr
         return _ConverterWrap
 
+    def __convertedBones(self):
+        from mmd_tools.core.vmd import bulk
+        key = (self.__motion_key, self.__scale, self.__bone_util_cls, self.__frame_margin, self.__mirror)
+        motions = VMDImporter.__converted_motions
+        bones = motions.pop(key, None) or {}
+        motions[key] = bones
+        while len(motions) > bulk.SESSION_CACHE_SIZE:
+            motions.popitem(last=False)
+        return bones
+
+    def __restSignature(self, bone, default_values):
+        """ The values of ``bone`` used by the conversion of its keys """
+        if self.__bone_util_cls is BoneConverterPoseMode:
+            matrices = (bone.matrix, bone.matrix_basis)
+        else:
+            matrices = (bone.bone.matrix_local,)
+        values = [v for m in matrices for row in m for v in row] + list(default_values)
+        return (bone.rotation_mode,) + tuple(round(v, 6) for v in values)
+
+    def __convertBoneKeys(self, bone, keyFrames, bone_rotation, default_values, extra_frame):
+        """ Convert the keys of a bone, a list of BoneFrameKey or a vmd.bulk.BoneKeyArrays, to the
+        keyframe points of its F-Curves.
+
+        @return a list of (co, handle_left, handle_right, interpolations) of each F-Curve, the
+            flat float32 arrays of the points and the interpolations of the points except the last
+        """
+        import numpy as np
+        from mmd_tools.core.vmd import bulk
+        _loc = _rot = lambda i: i
+        if self.__mirror:
+            _loc, _rot = _MirrorMapper.get_location, _MirrorMapper.get_rotation
+
+        converter = self.__getBoneConverter(bone)
+        count = len(default_values)
+        indices = tuple(converter.convert_interpolation((0, 16, 32)))+(48,)*(count - 3)
+        if not isinstance(keyFrames, bulk.BoneKeyArrays):
+            keyFrames = bulk.BoneKeyArrays.from_frame_keys(keyFrames)
+        keyFrames = keyFrames.take(np.argsort(keyFrames.frame_number, kind='stable'))
+        frames, values = [], []
+        if extra_frame:
+            frames.append(1)
+            values.append(default_values)
+        prev_rot = bone_rotation if extra_frame else None
+        for frame_number, location, rotation in zip(keyFrames.frame_number.tolist(), keyFrames.location.tolist(), keyFrames.rotation.tolist()):
+            loc = converter.convert_location(_loc(location))
+            curr_rot = converter.convert_rotation(_rot(rotation))
+            if prev_rot is not None:
+                curr_rot = converter.compatible_rotation(prev_rot, curr_rot)
+                #FIXME the rotation interpolation has slightly different result
+                #   Blender: rot(x) = prev_rot*(1 - bezier(t)) + curr_rot*bezier(t)
+                #       MMD: rot(x) = prev_rot.slerp(curr_rot, factor=bezier(t))
+            prev_rot = curr_rot
+            frames.append(frame_number + self.__frame_margin)
+            values.append(list(loc) + list(curr_rot))
+
+        frames = np.array(frames, dtype=np.float64)
+        values = np.array(values, dtype=np.float64).reshape(len(frames), count)
+        # the (x1, y1, x2, y2) of each F-Curve of the spans ending at the keys after the first vmd key
+        first = 1 + extra_frame
+        bezier = keyFrames.interp.astype(np.float64)[1:, np.add.outer(indices, (0, 4, 8, 12))] / 127.0
+        linear = ((bezier[:, :, 0] == bezier[:, :, 1]) & (bezier[:, :, 2] == bezier[:, :, 3]))
+        d_frame = frames[first:] - frames[first-1:-1]
+
+        ret = []
+        for i in range(count):
+            co = np.stack((frames, values[:, i]), axis=1)
+            handle_left, handle_right = co - (1, 0), co + (1, 0)
+            d_value = values[first:, i] - values[first-1:-1, i]
+            b = bezier[:, i]
+            handle_right[first-1:-1] = co[first-1:-1] + np.stack((d_frame*b[:, 0], d_value*b[:, 1]), axis=1)
+            handle_left[first:] = co[first-1:-1] + np.stack((d_frame*b[:, 2], d_value*b[:, 3]), axis=1)
+            interpolations = ['LINEAR']*extra_frame + ['LINEAR' if l else 'BEZIER' for l in linear[:, i].tolist()]
+            ret.append(tuple(a.astype(np.float32).ravel() for a in (co, handle_left, handle_right)) + (interpolations,))
+        return ret
+
+    @staticmethod
+    def __setKeyframePoints(fcurve, co, handle_left, handle_right, interpolations, extra_frame):
+        """ Fill the keyframe points of ``fcurve``. The handles of the span from the extra key to the
+        first vmd key are left as keyframe_points.add() makes them, which Blender computes automatically.
+        """
+        import numpy as np
+        keyframe_points = fcurve.keyframe_points
+        count = len(co)//2
+        keyframe_points.add(count)
+        keyframe_points.foreach_set('co', co)
+        auto_span = extra_frame and count > 1
+        if auto_span:
+            handle_left, handle_right = handle_left.copy(), handle_right.copy()
+            handles = np.empty(count*2, dtype=np.float32)
+            keyframe_points.foreach_get('handle_left', handles)
+            handle_left[2:4] = handles[2:4]
+            keyframe_points.foreach_get('handle_right', handles)
+            handle_right[0:2] = handles[0:2]
+        for i, kp in enumerate(keyframe_points):
+            if i != 1 or not auto_span:
+                kp.handle_left_type = 'FREE'
+            if i != 0 or not auto_span:
+                kp.handle_right_type = 'FREE'
+        for kp, interpolation in zip(keyframe_points, interpolations):
+            kp.interpolation = interpolation
+        keyframe_points.foreach_set('handle_left', handle_left)
+        keyframe_points.foreach_set('handle_right', handle_right)
+
     def __assignToArmature(self, armObj, action_name=None):
         boneAnim = self.__vmdFile.boneAnimation
         logging.info('---- bone animations:%5d  target: %s', len(boneAnim), armObj.name)
@@ -343,14 +465,11 @@ class VMDImporter:
         if self.__bone_mapper:
             pose_bones = self.__bone_mapper(armObj)
 
-        _loc = _rot = lambda i: i
         if self.__mirror:
             pose_bones = _MirrorMapper(pose_bones)
-            _loc, _rot = _MirrorMapper.get_location, _MirrorMapper.get_rotation
 
-        class _Dummy: pass
-        dummy_keyframe_points = iter(lambda: _Dummy, None)
         prop_rot_map = {'QUATERNION':'rotation_quaternion', 'AXIS_ANGLE':'rotation_axis_angle'}
+        converted_bones = self.__convertedBones()
 
         bone_name_table = {}
         for name, keyFrames in boneAnim.items():
@@ -365,56 +484,24 @@ class VMDImporter:
             assert(bone_name_table.get(bone.name, name) == name)
             bone_name_table[bone.name] = name
 
-            fcurves = [dummy_keyframe_points]*7 # x, y, z, r0, r1, r2, (r3)
             data_path_rot = prop_rot_map.get(bone.rotation_mode, 'rotation_euler')
             bone_rotation = getattr(bone, data_path_rot)
             default_values = list(bone.location) + list(bone_rotation)
+            converted_key = (name, self.__restSignature(bone, default_values))
+            keyframe_points = converted_bones.get(converted_key, None)
+            if keyframe_points is None:
+                keyframe_points = converted_bones[converted_key] = self.__convertBoneKeys(bone, keyFrames, bone_rotation, default_values, extra_frame)
+
+            fcurves = [] # x, y, z, r0, r1, r2, (r3)
             data_path = 'pose.bones["%s"].location'%bone.name
             for axis_i in range(3):
-                fcurves[axis_i] = action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name)
+                fcurves.append(action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name))
             data_path = 'pose.bones["%s"].%s'%(bone.name, data_path_rot)
             for axis_i in range(len(bone_rotation)):
-                fcurves[3+axis_i] = action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name)
-
-            for i in range(len(default_values)):
-                c = fcurves[i]
-                c.keyframe_points.add(extra_frame+num_frame)
-                kp_iter = iter(c.keyframe_points)
-                if extra_frame:
-                    kp = next(kp_iter)
-                    kp.co = (1, default_values[i])
-                    kp.interpolation = 'LINEAR'
-                fcurves[i] = kp_iter
-
-            converter = self.__getBoneConverter(bone)
-            prev_rot = bone_rotation if extra_frame else None
-            prev_kps, indices = None, tuple(converter.convert_interpolation((0, 16, 32)))+(48,)*len(bone_rotation)
-            keyFrames.sort(key=lambda x:x.frame_number)
-            for k, x, y, z, r0, r1, r2, r3 in zip(keyFrames, *fcurves):
-                frame = k.frame_number + self.__frame_margin
-                loc = converter.convert_location(_loc(k.location))
-                curr_rot = converter.convert_rotation(_rot(k.rotation))
-                if prev_rot is not None:
-                    curr_rot = converter.compatible_rotation(prev_rot, curr_rot)
-                    #FIXME the rotation interpolation has slightly different result
-                    #   Blender: rot(x) = prev_rot*(1 - bezier(t)) + curr_rot*bezier(t)
-                    #       MMD: rot(x) = prev_rot.slerp(curr_rot, factor=bezier(t))
-                prev_rot = curr_rot
-
-                x.co = (frame, loc[0])
-                y.co = (frame, loc[1])
-                z.co = (frame, loc[2])
-                r0.co = (frame, curr_rot[0])
-                r1.co = (frame, curr_rot[1])
-                r2.co = (frame, curr_rot[2])
-                r3.co = (frame, curr_rot[-1])
-
-                curr_kps = (x, y, z, r0, r1, r2, r3)
-                if prev_kps is not None:
-                    interp = k.interp
-                    for idx, prev_kp, kp in zip(indices, prev_kps, curr_kps):
-                        self.__setInterpolation(interp[idx:idx+16:4], prev_kp, kp)
-                prev_kps = curr_kps
+                fcurves.append(action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name))
+
+            for c, points in zip(fcurves, keyframe_points):
+                self.__setKeyframePoints(c, *points, extra_frame=extra_frame)
 
         for c in action.fcurves:
             self.__fixFcurveHandles(c)
@@ -452,7 +539,9 @@ class VMDImporter:
         mirror_map = _MirrorMapper(meshObj.data.shape_keys.key_blocks) if self.__mirror else {}
         shapeKeyDict = {k:mirror_map.get(k, v) for k, v in meshObj.data.shape_keys.key_blocks.items()}
 
+        import numpy as np
         from math import floor, ceil
+        from mmd_tools.core.vmd import bulk
         for name, keyFrames in shapeKeyAnim.items():
             if name not in shapeKeyDict:
                 logging.warning('WARNING: not found shape key %s (%d frames)', name, len(keyFrames))
@@ -460,14 +549,16 @@ class VMDImporter:
             logging.info('(mesh) frames:%5d  name: %s', len(keyFrames), name)
             shapeKey = shapeKeyDict[name]
             fcurve = action.fcurves.new(data_path='key_blocks["%s"].value'%shapeKey.name)
+            if not isinstance(keyFrames, bulk.ShapeKeyArrays):
+                keyFrames = bulk.ShapeKeyArrays.from_frame_keys(keyFrames)
+            keyFrames = keyFrames.take(np.argsort(keyFrames.frame_number, kind='stable'))
             fcurve.keyframe_points.add(len(keyFrames))
-            keyFrames.sort(key=lambda x:x.frame_number)
-            for k, v in zip(keyFrames, fcurve.keyframe_points):
-                v.co = (k.frame_number+self.__frame_margin, k.weight)
+            co = np.stack((keyFrames.frame_number.astype(np.float64) + self.__frame_margin, keyFrames.weight), axis=1)
+            fcurve.keyframe_points.foreach_set('co', co.astype(np.float32).ravel())
+            for v in fcurve.keyframe_points:
                 v.interpolation = 'LINEAR'
-            weights = tuple(i.weight for i in keyFrames)
-            shapeKey.slider_min = min(shapeKey.slider_min, floor(min(weights)))
-            shapeKey.slider_max = max(shapeKey.slider_max, ceil(max(weights)))
+            shapeKey.slider_min = min(shapeKey.slider_min, floor(keyFrames.weight.min()))
+            shapeKey.slider_max = max(shapeKey.slider_max, ceil(keyFrames.weight.max()))
 
 
     def __assignToRoot(self, rootObj, action_name=None):
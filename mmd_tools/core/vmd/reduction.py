@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+""" Remove the keyframes of vmd motions which can be reproduced within error tolerances.
+
+The motion is evaluated at every frame as MMD plays it: the location of a bone key span
+is interpolated by the bezier curves of the x, y and z axes and the rotation is slerped by
+the rotation curve, morph weights are interpolated linearly. The keys of each track are
+visited in order and a key is removed when a single span with fitted bezier curves reproduces
+all frames it covers within the tolerances. The first and last keys of every track are kept.
+"""
+
+import collections
+import copy
+import logging
+import math
+
+import numpy as np
+
+from mmd_tools.core.vmd import bezier
+from mmd_tools.core.vmd import bulk
+from mmd_tools.core.vmd import sampler
+
+DEFAULT_LOCATION_TOLERANCE = 0.01
+DEFAULT_ROTATION_TOLERANCE = 0.1 # degrees
+DEFAULT_WEIGHT_TOLERANCE = 0.001
+
+# the (x1, x2) candidates of the fitted curves, (42, 85) is nearly linear in x
+_CURVE_X_VALUES = (0, 42, 85, 127)
+_CURVE_X = np.array([(x1, x2) for x1 in _CURVE_X_VALUES for x2 in _CURVE_X_VALUES], dtype=np.float64)
+
+_LINEAR_CURVE = (20, 20, 107, 107)
+
+
+class ReductionReport(collections.namedtuple('ReductionReport', 'bone_keys reduced_bone_keys morph_keys reduced_morph_keys '
+                                             'location_error rotation_error weight_error')):
+    """ The numbers of keys before and after the reduction and the max errors of the reduced motion,
+    the rotation error is in degrees.
+    """
+    __slots__ = ()
+
+    @property
+    def removed_bone_keys(self):
+        return self.bone_keys - self.reduced_bone_keys
+
+    @property
+    def removed_morph_keys(self):
+        return self.morph_keys - self.reduced_morph_keys
+
+    def __str__(self):
+        return ('bone keys: %d -> %d (%d removed), morph keys: %d -> %d (%d removed), '
+                'max errors: location %g, rotation %g degrees, weight %g')%(
+            self.bone_keys, self.reduced_bone_keys, self.removed_bone_keys,
+            self.morph_keys, self.reduced_morph_keys, self.removed_morph_keys,
+            self.location_error, self.rotation_error, self.weight_error)
+
+
+class _CurveFitter:
+    """ Least squares fitting of the vmd interpolation curves to spans of dense samples.
+
+    The samples of a span of L frames are at the ratios 1/L, 2/L, ..., (L-1)/L, so the bases of
+    the candidate curves are computed once for each span length.
+    """
+    def __init__(self):
+        self.__bases = {}
+
+    def __basis(self, length):
+        basis = self.__bases.get(length, None)
+        if basis is None:
+            x = np.arange(1, length) / length
+            b1, b2, b3 = bezier.bezier_basis(bezier.bezier_t(_CURVE_X[:, 0:1]/127.0, _CURVE_X[:, 1:2]/127.0, x))
+            b = np.stack((b1, b2), axis=-1) # (curves, samples, 2)
+            basis = self.__bases[length] = (b, b3, np.linalg.pinv(b))
+        return basis
+
+    def fit(self, length, progress):
+        """ Fit curves of the span to the progress of each channel.
+
+        @param progress the expected curve values of shape (channels, length - 1)
+        @return (the curves (x1, y1, x2, y2) of each channel and the candidate, in range [0, 127],
+            the curve values of each channel and candidate of shape (channels, candidates, length - 1))
+        """
+        b, b3, pinv = self.__basis(length)
+        residual = progress[:, None, :] - b3[None, :, :]
+        y = np.einsum('cks,jcs->jck', pinv, residual)
+        y = np.rint(np.clip(y, 0.0, 1.0) * 127.0)
+        values = np.einsum('jck,csk->jcs', y / 127.0, b) + b3[None, :, :]
+        curves = np.empty(y.shape[:2] + (4,))
+        curves[..., 0], curves[..., 2] = _CURVE_X[:, 0], _CURVE_X[:, 1]
+        curves[..., 1], curves[..., 3] = y[..., 0], y[..., 1]
+        return curves, values
+
+
+def _greedy_spans(count, fit_span):
+    """ Choose the keys to keep, from the first key extend every span as long as ``fit_span`` succeeds.
+
+    @param fit_span a function (start index, end index) returning the fit of the span, or None if it fails
+    @return a list of (index of a kept key, the fit of the span ending at the key or None for an original span)
+    """
+    kept = [(0, None)]
+    start = 0
+    while start < count - 1:
+        good, good_fit = start + 1, None
+        step = 2
+        bad = None
+        while good < count - 1:
+            end = min(start + step, count - 1)
+            fit = fit_span(start, end)
+            if fit is None:
+                bad = end
+                break
+            good, good_fit = end, fit
+            step *= 2
+        while bad is not None and bad - good > 1:
+            end = (good + bad) // 2
+            fit = fit_span(start, end)
+            if fit is None:
+                bad = end
+            else:
+                good, good_fit = end, fit
+        kept.append((good, good_fit))
+        start = good
+    return kept
+
+
+def _reduce_bone_keys(arrays, fitter, location_tolerance, rotation_tolerance):
+    frame_numbers = arrays.frame_number.astype(np.int64)
+    first = frame_numbers[0]
+    loc_samples, rot_samples = sampler.sample_bone_keys(arrays, np.arange(first, frame_numbers[-1] + 1))
+    locations = arrays.location.astype(np.float64)
+    rotations = arrays.rotation.astype(np.float64)
+    rotations /= np.linalg.norm(rotations, axis=1, keepdims=True)
+    cos_tolerance = math.cos(math.radians(rotation_tolerance) / 2)
+
+    def fit_span(start, end):
+        f0, f1 = frame_numbers[start], frame_numbers[end]
+        length = int(f1 - f0)
+        loc = loc_samples[f0 - first + 1:f1 - first]
+        rot = rot_samples[f0 - first + 1:f1 - first]
+
+        loc0, delta = locations[start], locations[end] - locations[start]
+        moving = np.abs(delta) > 1e-9
+        progress = np.zeros((4, length - 1))
+        progress[:3][moving] = ((loc - loc0) / np.where(moving, delta, 1.0)).T[moving]
+
+        q0, q1 = rotations[start], rotations[end]
+        dot = np.dot(q0, q1)
+        if dot < 0:
+            q1, dot = -q1, -dot
+        angle = math.acos(min(dot, 1.0))
+        if angle > 1e-9:
+            perp = q1 - dot*q0
+            perp /= np.linalg.norm(perp)
+            rot = np.where((rot @ (q0 + q1))[:, None] < 0, -rot, rot)
+            progress[3] = np.arctan2(rot @ perp, rot @ q0) / angle
+        else:
+            perp = q0
+
+        curves, values = fitter.fit(length, progress)
+        loc_errors = np.abs(loc0[:, None, None] + delta[:, None, None]*values[:3] - loc.T[:, None, :]) # (3, candidates, samples)
+        best = np.argmin(loc_errors.max(axis=2), axis=1)
+        loc_error = loc_errors[np.arange(3), best]
+        loc_error = np.sum(loc_error*loc_error, axis=0).max()
+        if loc_error > location_tolerance*location_tolerance:
+            return None
+        rot_best = np.argmin(np.abs(values[3] - progress[3]).max(axis=1))
+        r = values[3, rot_best] * angle
+        fitted = np.outer(np.cos(r), q0) + np.outer(np.sin(r), perp)
+        rot_cos = np.abs(np.sum(fitted*rot, axis=1)).min()
+        if rot_cos < cos_tolerance:
+            return None
+        points = curves[[0, 1, 2, 3], list(best) + [rot_best]]
+        points[~np.append(moving, angle > 1e-9)] = _LINEAR_CURVE
+        return points, math.sqrt(loc_error), math.degrees(2*math.acos(min(rot_cos, 1.0)))
+
+    kept = _greedy_spans(len(arrays), fit_span)
+    ret = arrays.take([i for i, fit in kept])
+    fitted = [(n, fit) for n, (i, fit) in enumerate(kept) if fit is not None]
+    if not fitted:
+        return ret, 0.0, 0.0
+    rows, fits = zip(*fitted)
+    points, loc_errors, rot_errors = zip(*fits)
+    ret.interp = ret.interp.copy()
+    ret.interp[list(rows)] = bulk.bone_interpolation(np.array(points).reshape(-1, 4, 2, 2))
+    return ret, max(loc_errors), max(rot_errors)
+
+def _reduce_shape_keys(arrays, weight_tolerance):
+    frame_numbers = arrays.frame_number.astype(np.int64)
+    first = frame_numbers[0]
+    samples = sampler.sample_shape_keys(arrays, np.arange(first, frame_numbers[-1] + 1))
+    weights = arrays.weight.astype(np.float64)
+
+    def fit_span(start, end):
+        f0, f1 = frame_numbers[start], frame_numbers[end]
+        ratio = np.arange(1, f1 - f0) / (f1 - f0)
+        fitted = weights[start] + (weights[end] - weights[start]) * ratio
+        error = np.abs(fitted - samples[f0 - first + 1:f1 - first]).max()
+        if error > weight_tolerance:
+            return None
+        return error
+
+    kept = _greedy_spans(len(arrays), fit_span)
+    return arrays.take([i for i, fit in kept]), max([fit for i, fit in kept if fit is not None] or [0.0])
+
+
+def reduce_keys(motion, location_tolerance=DEFAULT_LOCATION_TOLERANCE, rotation_tolerance=DEFAULT_ROTATION_TOLERANCE,
+                weight_tolerance=DEFAULT_WEIGHT_TOLERANCE):
+    """ Remove the bone and morph keys which are reproduced by the other keys within the tolerances.
+
+    The kept keys are not moved and keep their values, only the interpolation curves of the keys
+    ending merged spans are refitted. The camera, lamp, self shadow and property keys are copied.
+
+    @param motion a vmd.File or vmd.bulk.ColumnarFile, which is not modified
+    @param location_tolerance the max distance of the bone locations
+    @param rotation_tolerance the max angle of the bone rotations in degrees
+    @param weight_tolerance the max difference of the morph weights
+    @return (a vmd.bulk.ColumnarFile of the reduced motion, a ReductionReport)
+    """
+    ret = bulk.ColumnarFile.empty_like(motion)
+    fitter = _CurveFitter()
+    counts = [0, 0, 0, 0]
+    errors = [0.0, 0.0, 0.0]
+    for name, keys in (motion.boneAnimation or {}).items():
+        arrays = sampler.track_arrays(keys, bulk.BoneKeyArrays)
+        if len(arrays) < 1:
+            continue
+        reduced, loc_error, rot_error = _reduce_bone_keys(arrays, fitter, location_tolerance, rotation_tolerance)
+        ret.boneAnimation[name] = reduced
+        errors[0] = max(errors[0], loc_error)
+        errors[1] = max(errors[1], rot_error)
+        counts[0] += len(keys)
+        counts[1] += len(reduced)
+    for name, keys in (motion.shapeKeyAnimation or {}).items():
+        arrays = sampler.track_arrays(keys, bulk.ShapeKeyArrays)
+        if len(arrays) < 1:
+            continue
+        reduced, weight_error = _reduce_shape_keys(arrays, weight_tolerance)
+        ret.shapeKeyAnimation[name] = reduced
+        errors[2] = max(errors[2], weight_error)
+        counts[2] += len(keys)
+        counts[3] += len(reduced)
+    for attr, keys in bulk.iter_animations(motion, bulk.LIST_ANIMATIONS):
+        getattr(ret, attr).extend(copy.copy(k) for k in keys)
+
+    report = ReductionReport(*(counts + errors))
+    logging.info('Reduced %s', report)
+    return ret, report
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+""" Evaluate vmd motions at any frames without Blender.
+
+The bone locations are interpolated by the bezier curves of the x, y and z axes and the
+rotations are slerped along the shorter arc by the rotation curve, as MMD plays them.
+The morph weights are interpolated linearly. Before the first key and after the last key
+of a track the values of the first and last keys are held.
+"""
+
+import numpy as np
+
+from mmd_tools.core.vmd import bezier
+from mmd_tools.core.vmd import bulk
+
+# the bone key interpolation of the first row: x1, y1, x2, y2 of the x, y, z and rotation curves
+_CURVE_INDICES = np.arange(4)[:, None] + np.array([0, 4, 8, 12])
+
+
+def track_arrays(keys, arrays_class):
+    """ Convert the keys of a track, a list of vmd frame keys or arrays, to arrays sorted by frame.
+    The last one of the keys of the same frame is kept.
+    """
+    if not isinstance(keys, bulk._KeyArrays):
+        keys = arrays_class.from_frame_keys(keys)
+    return bulk.unique_frames(keys)
+
+
+class _Tracks:
+    """ The keys of several tracks in flat arrays, a track of one key gets a copy of the key at the
+    next frame so every key span has 2 keys.
+    """
+    def __init__(self, tracks):
+        single = np.array([len(a) == 1 for a in tracks], dtype=bool)
+        tracks = [a.take([0, 0]) if len(a) == 1 else a for a in tracks]
+        counts = np.array([len(a) for a in tracks], dtype=np.int64)
+        self.stops = np.cumsum(counts)
+        self.starts = self.stops - counts
+        self.frames = np.concatenate([a.frame_number for a in tracks] or [[]]).astype(np.float64)
+        self.frames[self.starts[single] + 1] += 1
+        self.first = self.frames[self.starts] if len(tracks) else np.zeros(0)
+        self.last = self.frames[self.stops - 1] if len(tracks) else np.zeros(0)
+        # sortable keys of all tracks: (track index * stride + frame)
+        stride = (self.frames.max() + 2) if len(self.frames) else 1
+        self.offsets = np.arange(len(tracks)) * stride
+        self.keys = np.repeat(self.offsets, counts) + self.frames
+        span = np.empty_like(self.frames)
+        span[1:] = self.frames[1:] - self.frames[:-1]
+        span[self.starts] = 1
+        self.inv_span = 1.0 / span
+        self.tracks = tracks
+
+    def locate(self, frames):
+        """ @return (the flat index of the key ending the span of each track and frame, the ratio of
+            the frame in the span), of shape (tracks, frames)
+        """
+        q = np.clip(frames[None, :], self.first[:, None], self.last[:, None])
+        end = np.searchsorted(self.keys, (q + self.offsets[:, None]).ravel(), side='right').reshape(q.shape)
+        end = np.clip(end, self.starts[:, None] + 1, self.stops[:, None] - 1)
+        ratio = np.clip((q - self.frames[end - 1]) * self.inv_span[end], 0.0, 1.0)
+        return end, ratio
+
+
+class _BoneTracks(_Tracks):
+    def __init__(self, tracks):
+        _Tracks.__init__(self, tracks)
+        if not self.tracks:
+            return
+        location = np.concatenate([a.location for a in self.tracks]).astype(np.float64)
+        rotation = np.concatenate([a.rotation for a in self.tracks]).astype(np.float64)
+        rotation /= np.linalg.norm(rotation, axis=1, keepdims=True)
+        curves = np.clip(np.concatenate([a.interp for a in self.tracks])[:, _CURVE_INDICES].reshape(-1, 4), 0, 127)
+
+        # the values of the span ending at each key in a row:
+        # start location, location delta, start rotation, end rotation, slerp angle, 1/sin(angle)
+        # the spans ending at the first keys are unused
+        prev = np.arange(len(location)) - 1
+        prev[self.starts] = self.starts
+        q0, q1 = rotation[prev], rotation
+        dot = np.sum(q0*q1, axis=1)
+        q1 = np.where(dot[:, None] < 0, -q1, q1)
+        # slerp by sin((1-r)*angle)/sin(angle) also works for the tiny angles
+        angle = np.maximum(np.arccos(np.minimum(np.abs(dot), 1.0)), 1e-12)
+        self.spans = np.hstack((location[prev], location - location[prev], q0, q1, angle[:, None], 1/np.sin(angle)[:, None]))
+
+        # the curves with both control points on the diagonal are straight lines
+        curved = (curves[:, 0] != curves[:, 1]) | (curves[:, 2] != curves[:, 3])
+        self.curved = curved.reshape(-1, 4)
+        self.any_curved = curved.any()
+        curves = curves[curved]
+        self.curve_index = np.full(len(curved), -1, dtype=np.intp)
+        self.curve_index[curved] = np.arange(len(curves))
+        self.y1, self.y2 = curves[:, 1] / 127.0, curves[:, 3] / 127.0
+        self.codes = bezier.curve_codes(curves[:, 0], curves[:, 2])
+
+    def sample(self, frames):
+        end, ratio = self.locate(frames)
+        end, ratio = end.ravel(), ratio.ravel()
+        spans = self.spans[end]
+
+        ratios = np.repeat(ratio[:, None], 4, axis=1)
+        if self.any_curved:
+            samples, channels = np.nonzero(self.curved[end])
+            if samples.size:
+                curves = self.curve_index[end[samples]*4 + channels]
+                b1, b2, b3 = bezier.bezier_basis(bezier.curve_t(self.codes[curves], ratio[samples]))
+                ratios[samples, channels] = b1*self.y1[curves] + b2*self.y2[curves] + b3
+
+        location = spans[:, 0:3] + spans[:, 3:6] * ratios[:, :3]
+
+        r, angle, inv_sin = ratios[:, 3], spans[:, 14], spans[:, 15]
+        w0 = np.sin((1 - r)*angle) * inv_sin
+        w1 = np.sin(r*angle) * inv_sin
+        rotation = w0[:, None]*spans[:, 6:10] + w1[:, None]*spans[:, 10:14]
+        return location, rotation
+
+
+class _MorphTracks(_Tracks):
+    def __init__(self, tracks):
+        _Tracks.__init__(self, tracks)
+        weight = np.concatenate([a.weight for a in self.tracks] or [[]]).astype(np.float64)
+        self.weight0 = np.empty_like(weight)
+        self.weight0[1:] = weight[:-1]
+        self.weight0[self.starts] = weight[self.starts]
+        self.delta = weight - self.weight0
+
+    def sample(self, frames):
+        end, ratio = self.locate(frames)
+        return self.weight0[end] + self.delta[end] * ratio
+
+
+class MotionSampler:
+    """ Evaluate the bone and morph tracks of a motion at batches of frames.
+
+    The frames are frame numbers of the motion, which can be fractional. The values are computed
+    for every frame and track at once, in float64.
+
+    @param motion a vmd.File or vmd.bulk.ColumnarFile
+    @param bone_names the names of the bone tracks to sample in order, all tracks if None
+    @param morph_names the names of the morph tracks to sample in order, all tracks if None
+    """
+    def __init__(self, motion, bone_names=None, morph_names=None):
+        bone_animation = motion.boneAnimation or {}
+        morph_animation = motion.shapeKeyAnimation or {}
+        self.bone_names = [name for name in (bone_animation if bone_names is None else bone_names)
+                           if len(bone_animation.get(name, ())) > 0]
+        self.morph_names = [name for name in (morph_animation if morph_names is None else morph_names)
+                            if len(morph_animation.get(name, ())) > 0]
+        self.__bones = _BoneTracks([track_arrays(bone_animation[name], bulk.BoneKeyArrays) for name in self.bone_names])
+        self.__morphs = _MorphTracks([track_arrays(morph_animation[name], bulk.ShapeKeyArrays) for name in self.morph_names])
+
+    def bones(self, frames):
+        """ @return (locations of shape (frames, bones, 3), rotations (x, y, z, w) of shape (frames, bones, 4))
+            in the order of bone_names
+        """
+        frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+        count = len(self.bone_names)
+        if count < 1:
+            return np.zeros((len(frames), 0, 3)), np.zeros((len(frames), 0, 4))
+        location, rotation = self.__bones.sample(frames)
+        return location.reshape(count, -1, 3).transpose(1, 0, 2), rotation.reshape(count, -1, 4).transpose(1, 0, 2)
+
+    def morphs(self, frames):
+        """ @return the weights of shape (frames, morphs) in the order of morph_names """
+        frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+        if len(self.morph_names) < 1:
+            return np.zeros((len(frames), 0))
+        return self.__morphs.sample(frames).T
+
+
+def sample_bone_keys(arrays, frames):
+    """ Evaluate the BoneKeyArrays of a bone, sorted by frame without duplicates, at ``frames``.
+
+    @return (locations of shape (N, 3), rotations of shape (N, 4))
+    """
+    location, rotation = _BoneTracks([arrays]).sample(np.asarray(frames, dtype=np.float64).reshape(-1))
+    return location, rotation
+
+def sample_shape_keys(arrays, frames):
+    """ Evaluate the ShapeKeyArrays of a morph, sorted by frame without duplicates, at ``frames``. """
+    return _MorphTracks([arrays]).sample(np.asarray(frames, dtype=np.float64).reshape(-1))[0]
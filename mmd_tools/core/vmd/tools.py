@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+""" Edit vmd motions without Blender: merge, trim, split, shift, rescale, rename and reduce.
+
+The functions work on vmd.bulk.ColumnarFile, so the bone and morph keyframes are processed
+as numpy arrays. They never modify their arguments and return new motions, which can share
+the keyframe arrays with the arguments.
+
+Usage: python mmd_tools/core/vmd/tools.py COMMAND ...
+
+Run as a script, it imports mmd_tools.core without mmd_tools/__init__.py, so only numpy is
+required and the add-on (and bpy) is not loaded. "blender --background --python tools.py --
+COMMAND ..." works as well.
+"""
+
+import argparse
+import collections
+import copy
+import csv
+import logging
+import sys
+
+if __name__ == '__main__' and 'mmd_tools' not in sys.modules:
+    # an empty mmd_tools package, mmd_tools/__init__.py registers the add-on and imports bpy
+    import os
+    import types
+    _package = types.ModuleType('mmd_tools')
+    _package.__path__ = [os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))]
+    sys.modules['mmd_tools'] = _package
+
+import numpy as np
+
+from mmd_tools.core.vmd import bulk
+
+MAX_FRAME = 0xffffffff
+
+
+def load(path):
+    return bulk.load(path)
+
+def save(motion, path):
+    motion.save(filepath=path)
+    logging.info('Saved %s', path)
+
+
+def _unique_list_frames(keys):
+    ret = {}
+    for k in sorted(keys, key=lambda k: k.frame_number):
+        ret[k.frame_number] = k
+    return list(ret.values())
+
+def _map_frames(motion, func):
+    """ Move the keys to the frames ``func(frame_numbers)``, an int64 array of the frames.
+    The keys out of range [0, MAX_FRAME] are removed, the last key is kept if several keys
+    move to the same frame.
+    """
+    ret = bulk.ColumnarFile.empty_like(motion)
+    for attr, animation in bulk.iter_animations(motion, bulk.KEY_ANIMATIONS):
+        for name, arrays in animation.items():
+            frames = func(arrays.frame_number.astype(np.int64))
+            valid = (frames >= 0) & (frames <= MAX_FRAME)
+            arrays = arrays.take(valid)
+            arrays.frame_number = frames[valid].astype(np.uint32)
+            if len(arrays) > 0:
+                getattr(ret, attr)[name] = bulk.unique_frames(arrays)
+    for attr, keys in bulk.iter_animations(motion, bulk.LIST_ANIMATIONS):
+        moved = []
+        for k, frame in zip(keys, func(np.array([k.frame_number for k in keys], dtype=np.int64)).tolist()):
+            if 0 <= frame <= MAX_FRAME:
+                k = copy.copy(k)
+                k.frame_number = frame
+                moved.append(k)
+        getattr(ret, attr).extend(_unique_list_frames(moved))
+    return ret
+
+
+def merge(*motions):
+    """ Merge the tracks of ``motions``, e.g. a body motion and a facial motion.
+
+    The keys of a track found in several motions are sorted by frame, the key of the later
+    motion wins if two motions have a key at the same frame. The header is of the first motion.
+    """
+    ret = bulk.ColumnarFile.empty_like(motions[0])
+    for attr in bulk.KEY_ANIMATIONS:
+        tracks = collections.OrderedDict()
+        for motion in motions:
+            for name, arrays in (getattr(motion, attr) or {}).items():
+                tracks.setdefault(name, []).append(arrays)
+        animation = getattr(ret, attr)
+        for name, arrays_list in tracks.items():
+            arrays = arrays_list[0].concatenate(arrays_list)
+            animation[name] = bulk.unique_frames(arrays) if len(arrays_list) > 1 else arrays
+    for attr in bulk.LIST_ANIMATIONS:
+        sources = [getattr(motion, attr) for motion in motions if getattr(motion, attr)]
+        keys = [copy.copy(k) for keys in sources for k in keys]
+        getattr(ret, attr).extend(_unique_list_frames(keys) if len(sources) > 1 else keys)
+    return ret
+
+
+def trim(motion, frame_range):
+    """ Keep the keys of frames in ``frame_range``.
+
+    The keys are not moved and no key is added at the ends, so the poses between the start of the
+    range and the first key of a track are not kept.
+
+    @param frame_range (start, end) inclusive, None of either end means unbounded
+    """
+    ret = bulk.ColumnarFile.empty_like(motion)
+    for attr, animation in bulk.iter_animations(motion, bulk.KEY_ANIMATIONS):
+        for name, arrays in animation.items():
+            arrays = arrays.take(bulk.frame_mask(arrays.frame_number, frame_range))
+            if len(arrays) > 0:
+                getattr(ret, attr)[name] = arrays
+    for attr, keys in bulk.iter_animations(motion, bulk.LIST_ANIMATIONS):
+        getattr(ret, attr).extend(copy.copy(k) for k in keys if bulk.in_frame_range(k.frame_number, frame_range))
+    return ret
+
+
+def split_frames(motion, boundaries, rebase=False):
+    """ Cut ``motion`` into shots starting at the frames of ``boundaries``.
+
+    @param boundaries the sorted start frames of the second and later shots
+    @param rebase shift every shot to start at frame 0
+    @return a list of len(boundaries) + 1 motions
+    """
+    starts = [0] + list(boundaries)
+    ends = [i - 1 for i in boundaries] + [None]
+    ret = []
+    for start, end in zip(starts, ends):
+        shot = trim(motion, (start, end))
+        ret.append(shift(shot, -start) if rebase and start else shot)
+    return ret
+
+
+def select(motion, bone_names=None, morph_names=None):
+    """ Keep the bone and morph tracks of the names in ``bone_names`` and ``morph_names``.
+    None keeps all tracks of the kind. The camera, lamp, self shadow and property keys are kept.
+    """
+    ret = bulk.ColumnarFile.empty_like(motion)
+    for (attr, animation), names in zip(bulk.iter_animations(motion, bulk.KEY_ANIMATIONS), (bone_names, morph_names)):
+        getattr(ret, attr).update((name, arrays) for name, arrays in animation.items() if names is None or name in names)
+    for attr, keys in bulk.iter_animations(motion, bulk.LIST_ANIMATIONS):
+        getattr(ret, attr).extend(copy.copy(k) for k in keys)
+    return ret
+
+
+def split_names(motion, bone_names=(), morph_names=()):
+    """ Split the bone and morph tracks by name sets.
+
+    @return (a motion of the tracks in the name sets, a motion of the other tracks).
+        The camera, lamp, self shadow and property keys are in the second one.
+    """
+    bone_names, morph_names = set(bone_names), set(morph_names)
+    selected = select(motion, bone_names, morph_names)
+    for attr in bulk.LIST_ANIMATIONS:
+        del getattr(selected, attr)[:]
+    rest = select(motion,
+        {name for name in (motion.boneAnimation or {}) if name not in bone_names},
+        {name for name in (motion.shapeKeyAnimation or {}) if name not in morph_names},
+        )
+    return selected, rest
+
+
+def shift(motion, offset):
+    """ Move all keys by ``offset`` frames. The keys moved before frame 0 are removed.
+    """
+    return _map_frames(motion, lambda frames: frames + int(offset))
+
+
+def rescale(motion, factor, origin=0):
+    """ Scale the time of the motion by ``factor`` around frame ``origin``.
+
+    The frame numbers are rounded to integers, the last key is kept if several keys of a track
+    fall on the same frame. The interpolation curves are relative to the key spans and are kept.
+    """
+    if factor <= 0:
+        raise ValueError('invalid scale factor %s'%factor)
+    return _map_frames(motion, lambda frames: np.rint((frames - origin) * factor).astype(np.int64) + origin)
+
+
+def rename(motion, bone_map=None, morph_map=None):
+    """ Rename the tracks by the {old name: new name} mappings, the names not in a mapping are kept.
+
+    Tracks renamed to the same name are merged like merge() does, in the order of the tracks.
+    The bone names of the IK states of the property keys are renamed by ``bone_map`` as well.
+    """
+    ret = bulk.ColumnarFile.empty_like(motion)
+    for (attr, animation), name_map in zip(bulk.iter_animations(motion, bulk.KEY_ANIMATIONS), (bone_map, morph_map)):
+        name_map = name_map or {}
+        tracks = collections.OrderedDict()
+        for name, arrays in animation.items():
+            tracks.setdefault(name_map.get(name, name), []).append(arrays)
+        for name, arrays_list in tracks.items():
+            arrays = arrays_list[0].concatenate(arrays_list)
+            getattr(ret, attr)[name] = bulk.unique_frames(arrays) if len(arrays_list) > 1 else arrays
+    for attr, keys in bulk.iter_animations(motion, bulk.LIST_ANIMATIONS):
+        getattr(ret, attr).extend(copy.copy(k) for k in keys)
+    if bone_map:
+        for k in ret.propertyAnimation:
+            k.ik_states = [(bone_map.get(name, name), state) for name, state in k.ik_states]
+    return ret
+
+
+def read_name_map(path):
+    """ Read a csv file of "old name,new name" rows.
+    """
+    ret = {}
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].startswith('#'):
+                continue
+            ret[row[0]] = row[1]
+    return ret
+
+
+def _frame_range(text):
+    """ Parse "start-end", "start-" or "-end" """
+    start, sep, end = text.partition('-')
+    if not sep:
+        raise argparse.ArgumentTypeError('invalid frame range "%s", use START-END'%text)
+    return (int(start) if start else None, int(end) if end else None)
+
+def _split_output(output, index):
+    stem, dot, ext = output.rpartition('.')
+    return '%s_%d.%s'%(stem, index, ext) if dot else '%s_%d'%(output, index)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0], fromfile_prefix_chars='@')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    p = commands.add_parser('merge', help='merge the tracks of several motions, later motions win at the same frame')
+    p.add_argument('output')
+    p.add_argument('inputs', nargs='+')
+
+    p = commands.add_parser('trim', help='keep the keys in a frame range')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('frames', type=_frame_range, help='START-END, inclusive')
+    p.add_argument('--rebase', action='store_true', help='move the start of the range to frame 0')
+
+    p = commands.add_parser('split', help='cut a motion into shots, saved as OUTPUT_1.vmd, OUTPUT_2.vmd, ...')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('boundaries', type=int, nargs='+', help='the start frames of the second and later shots')
+    p.add_argument('--rebase', action='store_true', help='move every shot to start at frame 0')
+
+    p = commands.add_parser('select', help='split the bone and morph tracks by names')
+    p.add_argument('input')
+    p.add_argument('output', help='the motion of the named tracks')
+    p.add_argument('--rest', help='save the other tracks, camera, lamp and property keys to this file')
+    p.add_argument('--bones', nargs='*', default=[], help='the bone names, @FILE reads one name per line')
+    p.add_argument('--morphs', nargs='*', default=[], help='the morph names, @FILE reads one name per line')
+
+    p = commands.add_parser('shift', help='move all keys by some frames')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('offset', type=int)
+
+    p = commands.add_parser('rescale', help='scale the time of a motion')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('factor', type=float)
+    p.add_argument('--origin', type=int, default=0, help='the frame which is not moved')
+
+    p = commands.add_parser('rename', help='rename the tracks by csv files of "old name,new name" rows')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('--bone-map', help='the csv file of the bone names')
+    p.add_argument('--morph-map', help='the csv file of the morph names')
+
+    p = commands.add_parser('reduce', help='remove the bone and morph keys which are reproduced by the other keys within tolerances')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('--location-tolerance', type=float, default=0.01, help='the max distance of the bone locations')
+    p.add_argument('--rotation-tolerance', type=float, default=0.1, help='the max angle of the bone rotations in degrees')
+    p.add_argument('--weight-tolerance', type=float, default=0.001, help='the max difference of the morph weights')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'merge':
+        save(merge(*[load(path) for path in args.inputs]), args.output)
+    elif args.command == 'trim':
+        motion = trim(load(args.input), args.frames)
+        if args.rebase and args.frames[0]:
+            motion = shift(motion, -args.frames[0])
+        save(motion, args.output)
+    elif args.command == 'split':
+        boundaries = sorted(set(args.boundaries))
+        for i, shot in enumerate(split_frames(load(args.input), boundaries, args.rebase)):
+            save(shot, _split_output(args.output, i + 1))
+    elif args.command == 'select':
+        selected, rest = split_names(load(args.input), args.bones, args.morphs)
+        save(selected, args.output)
+        if args.rest:
+            save(rest, args.rest)
+    elif args.command == 'shift':
+        save(shift(load(args.input), args.offset), args.output)
+    elif args.command == 'rescale':
+        save(rescale(load(args.input), args.factor, args.origin), args.output)
+    elif args.command == 'rename':
+        bone_map = read_name_map(args.bone_map) if args.bone_map else None
+        morph_map = read_name_map(args.morph_map) if args.morph_map else None
+        save(rename(load(args.input), bone_map, morph_map), args.output)
+    elif args.command == 'reduce':
+        from mmd_tools.core.vmd import reduction
+        motion, report = reduction.reduce_keys(load(args.input), args.location_tolerance, args.rotation_tolerance, args.weight_tolerance)
+        save(motion, args.output)
+        print(report)
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:])
@@ -267,6 +267,32 @@ class ImportVmd(Operator, ImportHelper):
         description='Update frame range and frame rate (30 fps)',
         default=True,
         )
+    use_key_reduction = bpy.props.BoolProperty(
+        name='Reduce Keyframes',
+        description='Remove the bone and morph keyframes which are reproduced by the other keyframes within the tolerances',
+        default=False,
+        )
+    location_tolerance = bpy.props.FloatProperty(
+        name='Location Tolerance',
+        description='The max location error of the removed bone keyframes (in MMD units)',
+        min=0.0,
+        default=0.01,
+        precision=4,
+        )
+    rotation_tolerance = bpy.props.FloatProperty(
+        name='Rotation Tolerance',
+        description='The max rotation error of the removed bone keyframes (in degrees)',
+        min=0.0,
+        default=0.1,
+        precision=3,
+        )
+    weight_tolerance = bpy.props.FloatProperty(
+        name='Morph Tolerance',
+        description='The max weight error of the removed morph keyframes',
+        min=0.0,
+        default=0.001,
+        precision=4,
+        )
 
     @classmethod
     def poll(cls, context):
@@ -284,6 +310,11 @@ class ImportVmd(Operator, ImportHelper):
             layout.prop(self, 'dictionary')
         layout.prop(self, 'use_pose_mode')
         layout.prop(self, 'use_mirror')
+        layout.prop(self, 'use_key_reduction')
+        if self.use_key_reduction:
+            layout.prop(self, 'location_tolerance')
+            layout.prop(self, 'rotation_tolerance')
+            layout.prop(self, 'weight_tolerance')
 
         layout.prop(self, 'update_scene_settings')
 
@@ -315,11 +346,14 @@ class ImportVmd(Operator, ImportHelper):
             use_pose_mode=self.use_pose_mode,
             frame_margin=self.margin,
             use_mirror=self.use_mirror,
+            key_tolerances=(self.location_tolerance, self.rotation_tolerance, self.weight_tolerance) if self.use_key_reduction else None,
             )
 
         for i in selected_objects:
             importer.assign(i)
         logging.info(' Finished importing motion in %f seconds.', time.time() - start_time)
+        if importer.reduction_report:
+            self.report({'INFO'}, 'Reduced keyframes, %s'%importer.reduction_report)
 
         if self.update_scene_settings:
             auto_scene_setup.setupFrameRanges()
@@ -467,7 +501,7 @@ class ExportPmx(Operator, ExportHelper):
         items=[
             ('NONE', 'None', 'No sorting', 0),
             ('BLENDER', 'Blender', "Use blender's internal vertex order", 1),
-            ('CUSTOM', 'Custom', 'Use custom vertex weight of vertex group "mmd_vertex_order"', 2),
+            ('CUSTOM', 'Custom', 'Use the custom vertex order of attribute "mmd_vertex_order" or the vertex weight of vertex group "mmd_vertex_order"', 2),
             ],
         default='NONE',
         )
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+""" Throughput and peak memory benchmark of the pmx/pmd/vmd/vpd readers and writers.
+
+Synthetic files are generated by synthetic.py, then every case is timed (best of
+--repeat runs) and its peak memory is traced in a separate run. The results can be
+stored as a json baseline and later runs are compared with it, a case slower or
+using more memory than the baseline by more than --tolerance is reported as a
+regression and the exit status is 1.
+
+Usage: blender --background --python bench_io.py -- [--baseline PATH] [--save-baseline] [--vertices N] ...
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+from mmd_tools.core import pmd
+from mmd_tools.core import pmx
+from mmd_tools.core import vmd
+from mmd_tools.core import vpd
+from mmd_tools.core.vmd import bulk as vmd_bulk
+from mmd_tools.core.vmd import sampler as vmd_sampler
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(TESTS_DIR, 'output', 'benchmarks')
+BASELINE_PATH = os.path.join(OUTPUT_DIR, 'baseline.json')
+
+BASELINE_VERSION = 1
+
+
+class Case:
+    """ A benchmark case.
+
+    ``setup()`` returns the argument of ``run(arg)``, which is excluded from the measurement.
+    """
+    def __init__(self, name, elements, size, run, setup=lambda: None):
+        self.name = name
+        self.elements = elements
+        self.size = size
+        self.run = run
+        self.setup = setup
+
+
+def _pmx_section_loader(path, section, num_textures):
+    def setup():
+        fs = pmx.MappedFileReadStream(path)
+        header = pmx.Header()
+        header.load(fs)
+        fs.setHeader(header)
+        fs.seek(section.offset - 4)
+        return fs
+    def run(fs):
+        try:
+            model = pmx.Model()
+            count = fs.readInt()
+            loader = getattr(model, '_load' + section.name.capitalize())
+            if section.name == 'materials':
+                loader(fs, count, num_textures)
+            else:
+                loader(fs, count)
+            return model
+        finally:
+            fs.close()
+    return setup, run
+
+def _vmd_elements(f):
+    return sum(len(keys) for keys in f.boneAnimation.values()) + sum(len(keys) for keys in f.shapeKeyAnimation.values()) + len(f.cameraAnimation)
+
+def _load_vmd(path):
+    f = vmd.File()
+    f.load(filepath=path)
+    return f
+
+def _load_vpd(path):
+    f = vpd.File()
+    f.load(filepath=path)
+    return f
+
+def build_cases(files, output_dir):
+    cases = []
+
+    pmx_path = files['pmx']
+    size = os.path.getsize(pmx_path)
+    model = pmx.load(pmx_path)
+    header, sections = pmx.scan(pmx_path)
+    elements = sum(s.count for s in sections)
+    cases.append(Case('pmx.load', elements, size, lambda arg: pmx.load(pmx_path)))
+    num_textures = {s.name:s.count for s in sections}['textures']
+    for section, end in zip(sections, [s.offset - 4 for s in sections[1:]] + [size]):
+        setup, run = _pmx_section_loader(pmx_path, section, num_textures)
+        cases.append(Case('pmx.load.%s'%section.name, section.count, end - section.offset, run, setup))
+    output_pmx = os.path.join(output_dir, 'output.pmx')
+    add_uv_count = header.additional_uvs
+    cases.append(Case('pmx.save', elements, size, lambda arg: pmx.save(output_pmx, model, add_uv_count)))
+
+    pmd_path = files['pmd']
+    p = pmd.load(pmd_path)
+    elements = len(p.vertices) + len(p.faces) + len(p.materials) + len(p.bones) + sum(len(m.data) for m in p.morphs)
+    cases.append(Case('pmd.load', elements, os.path.getsize(pmd_path), lambda arg: pmd.load(pmd_path)))
+
+    vmd_path = files['vmd']
+    motion = _load_vmd(vmd_path)
+    output_vmd = os.path.join(output_dir, 'output.vmd')
+    elements = _vmd_elements(motion)
+    cases.append(Case('vmd.load', elements, os.path.getsize(vmd_path), lambda arg: _load_vmd(vmd_path)))
+    cases.append(Case('vmd.load.columnar', elements, os.path.getsize(vmd_path), lambda arg: vmd_bulk.load(vmd_path)))
+    cases.append(Case('vmd.save', elements, os.path.getsize(vmd_path), lambda arg: motion.save(filepath=output_vmd)))
+    columnar_motion = vmd_bulk.load(vmd_path)
+    cases.append(Case('vmd.save.columnar', elements, os.path.getsize(vmd_path), lambda arg: columnar_motion.save(filepath=output_vmd)))
+    motion_sampler = vmd_sampler.MotionSampler(columnar_motion)
+    sample_frames = [float(i) for i in range(100)]
+    cases.append(Case('vmd.sample', len(sample_frames)*len(motion_sampler.bone_names), 0, lambda arg: motion_sampler.bones(sample_frames)))
+
+    vpd_path = files['vpd']
+    pose = _load_vpd(vpd_path)
+    output_vpd = os.path.join(output_dir, 'output.vpd')
+    elements = len(pose.bones) + len(pose.morphs)
+    cases.append(Case('vpd.load', elements, os.path.getsize(vpd_path), lambda arg: _load_vpd(vpd_path)))
+    cases.append(Case('vpd.save', elements, os.path.getsize(vpd_path), lambda arg: pose.save(filepath=output_vpd)))
+    return cases
+
+def measure(case, repeat):
+    seconds = float('inf')
+    for i in range(repeat):
+        arg = case.setup()
+        gc.collect()
+        t = time.perf_counter()
+        case.run(arg)
+        seconds = min(seconds, time.perf_counter() - t)
+
+    arg = case.setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = case.run(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+
+    seconds = max(seconds, 1e-9)
+    return {
+        'elements': case.elements,
+        'bytes': case.size,
+        'seconds': seconds,
+        'elements_per_sec': case.elements/seconds,
+        'mb_per_sec': case.size/seconds/(1024*1024),
+        'peak_mb': peak/(1024*1024),
+        }
+
+def compare(results, baseline, tolerance):
+    """ Compare ``results`` with ``baseline``.
+
+    @return a list of regression messages, or None if the baseline was measured with other settings
+    """
+    if baseline.get('version') != BASELINE_VERSION or baseline.get('knobs') != results['knobs']:
+        return None
+    regressions = []
+    for name, current in results['cases'].items():
+        previous = baseline['cases'].get(name)
+        if previous is None:
+            continue
+        for key in ('seconds', 'peak_mb'):
+            if current[key] > previous[key]*(1 + tolerance):
+                regressions.append('%s: %s %.4g -> %.4g (+%.0f%%)'%(name, key, previous[key], current[key], (current[key]/previous[key] - 1)*100))
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='the directory of the generated files')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='the json file of the baseline results')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--json', help='write the results to a json file')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of timed runs of each case')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='the allowed relative slowdown or memory growth')
+    parser.add_argument('--filter', default='', help='only run the cases whose name starts with this prefix')
+    synthetic.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel('ERROR')
+    knobs = {name:getattr(args, name) for name in synthetic.DEFAULTS}
+    files = synthetic.generate(args.output_dir, **knobs)
+
+    results = {
+        'version': BASELINE_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'knobs': knobs,
+        'cases': {},
+        }
+    print('%-24s %10s %10s %14s %10s %10s'%('case', 'elements', 'seconds', 'elements/sec', 'MB/sec', 'peak MB'))
+    for case in build_cases(files, args.output_dir):
+        if not case.name.startswith(args.filter):
+            continue
+        r = results['cases'][case.name] = measure(case, args.repeat)
+        print('%-24s %10d %10.4f %14.0f %10.2f %10.2f'%(case.name, r['elements'], r['seconds'], r['elements_per_sec'], r['mb_per_sec'], r['peak_mb']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Saved baseline: %s'%args.baseline)
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions is None:
+            print('Skipped the comparison, the baseline was measured with other settings: %s'%args.baseline)
+            return
+        for msg in regressions:
+            print('REGRESSION %s'%msg)
+        if regressions:
+            sys.exit(1)
+        print('No regression against baseline: %s'%args.baseline)
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+""" Memory benchmark of the record classes of the pmx/pmd/vmd data model.
+
+Compares the bytes per instance of each slot based record class with an
+equivalent class keeping a per-instance __dict__.
+
+Usage: blender --background --python bench_memory.py -- [--count N] [--json OUTPUT]
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+
+from mmd_tools.core import pmd
+from mmd_tools.core import pmx
+from mmd_tools.core import vmd
+
+def _fill_vertex(v):
+    v.co = (0.1, 0.2, 0.3)
+    v.normal = (0.0, 1.0, 0.0)
+    v.uv = (0.5, 0.5)
+    v.weight = None
+
+def _fill_bone_weight(w):
+    w.type = pmx.BoneWeight.BDEF2
+    w.bones = [1, 2]
+    w.weights = [0.5]
+
+def _fill_offset(o):
+    o.index = 12345
+    o.offset = (0.1, 0.2, 0.3)
+
+def _fill_bone_frame_key(k):
+    k.frame_number = 100
+    k.location = [0.1, 0.2, 0.3]
+    k.rotation = [0.0, 0.0, 0.0, 1.0]
+
+def _fill_shape_key_frame_key(k):
+    k.frame_number = 100
+    k.weight = 0.5
+
+RECORDS = [
+    (pmx.Vertex, _fill_vertex),
+    (pmx.BoneWeight, _fill_bone_weight),
+    (pmx.BoneWeightSDEF, None),
+    (pmx.Bone, None),
+    (pmx.Material, None),
+    (pmx.VertexMorphOffset, _fill_offset),
+    (pmx.UVMorphOffset, _fill_offset),
+    (pmx.BoneMorphOffset, None),
+    (pmx.MaterialMorphOffset, None),
+    (pmx.GroupMorphOffset, None),
+    (pmx.Rigid, None),
+    (pmx.Joint, None),
+    (pmd.Vertex, None),
+    (pmd.MorphData, _fill_offset),
+    (vmd.BoneFrameKey, _fill_bone_frame_key),
+    (vmd.ShapeKeyFrameKey, _fill_shape_key_frame_key),
+    ]
+
+def dict_based(cls):
+    """ Return a copy of ``cls`` without __slots__, i.e. with a per-instance __dict__.
+    """
+    slots = set(getattr(cls, '__slots__', ()))
+    namespace = {k:v for k, v in cls.__dict__.items() if k not in slots and k not in ('__slots__', '__dict__', '__weakref__')}
+    return type(cls.__name__, cls.__bases__, namespace)
+
+def bytes_per_instance(cls, fill, count):
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        items = []
+        for i in range(count):
+            obj = cls()
+            if fill:
+                fill(obj)
+            items.append(obj)
+        size = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return size / count
+
+def run(count):
+    results = []
+    for cls, fill in RECORDS:
+        name = '%s.%s'%(cls.__module__.rsplit('.', 1)[-1], cls.__name__)
+        compact = bytes_per_instance(cls, fill, count)
+        plain = bytes_per_instance(dict_based(cls), fill, count)
+        results.append({'record':name, 'bytes':round(compact, 1), 'bytes_dict':round(plain, 1)})
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--count', type=int, default=100000, help='the number of instances per record class')
+    parser.add_argument('--json', help='write the results to a json file')
+    args = parser.parse_args(argv)
+
+    results = run(args.count)
+    print('%-28s %12s %12s %8s'%('record', 'bytes', 'dict bytes', 'ratio'))
+    for r in results:
+        print('%-28s %12.1f %12.1f %7.2fx'%(r['record'], r['bytes'], r['bytes_dict'], r['bytes_dict']/r['bytes']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'count':args.count, 'results':results}, f, indent=2)
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+""" Deterministic generator of synthetic pmx/pmd/vmd/vpd files of configurable size.
+
+The same parameters and seed always produce the same bytes, so the generated
+files can be used as reproducible inputs of benchmarks and tests.
+
+Usage: blender --background --python synthetic.py -- OUTPUT_DIR [--vertices N] [--bones N] ...
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+
+from mmd_tools.core import pmx
+from mmd_tools.core import vmd
+from mmd_tools.core import vpd
+
+DEFAULTS = {
+    'vertices': 20000,
+    'bones': 200,
+    'morphs': 50,
+    'morph_offsets': 500,
+    'rigids': 50,
+    'joints': 40,
+    'motion_keys': 200,
+    'seed': 0,
+    }
+
+def _bone_name(i):
+    return 'ボーン%03d'%i
+
+def _morph_name(i):
+    return 'モーフ%03d'%i
+
+def _vector(rng, n, scale=10.0):
+    return tuple(rng.uniform(-scale, scale) for _ in range(n))
+
+def _normal(rng):
+    x, y, z = _vector(rng, 3, 1.0)
+    d = (x*x + y*y + z*z)**0.5 or 1.0
+    return (x/d, y/d, z/d)
+
+def _rotation(rng):
+    x, y, z, w = _vector(rng, 4, 1.0)
+    d = (x*x + y*y + z*z + w*w)**0.5 or 1.0
+    return (x/d, y/d, z/d, w/d)
+
+def _parent(rng, i):
+    return rng.randrange(i) if i > 0 else -1
+
+def make_pmx_model(vertices=DEFAULTS['vertices'], bones=DEFAULTS['bones'], morphs=DEFAULTS['morphs'],
+                   morph_offsets=DEFAULTS['morph_offsets'], rigids=DEFAULTS['rigids'], joints=DEFAULTS['joints'],
+                   additional_uvs=1, seed=DEFAULTS['seed'], **_):
+    """ Build a pmx.Model using all weight types and morph types.
+
+    @return (pmx.Model, the number of additional uvs)
+    """
+    rng = random.Random(seed)
+    bones = max(bones, 2)
+    model = pmx.Model()
+    model.name = 'シンセティック'
+    model.name_e = 'synthetic'
+    model.comment = 'seed %d'%seed
+    model.comment_e = 'generated by tests/benchmarks/synthetic.py'
+
+    for i in range(vertices):
+        v = pmx.Vertex()
+        v.co = _vector(rng, 3)
+        v.normal = _normal(rng)
+        v.uv = (rng.random(), rng.random())
+        v.additional_uvs = [_vector(rng, 4, 1.0) for _ in range(additional_uvs)]
+        v.edge_scale = 1.0
+        w = pmx.BoneWeight()
+        w.type = rng.choice((pmx.BoneWeight.BDEF1, pmx.BoneWeight.BDEF2, pmx.BoneWeight.BDEF2,
+                             pmx.BoneWeight.BDEF4, pmx.BoneWeight.SDEF))
+        if w.type == pmx.BoneWeight.BDEF1:
+            w.bones = [rng.randrange(bones)]
+        elif w.type == pmx.BoneWeight.BDEF2:
+            w.bones = [rng.randrange(bones), rng.randrange(bones)]
+            w.weights = [rng.random()]
+        elif w.type == pmx.BoneWeight.BDEF4:
+            w.bones = [rng.randrange(bones) for _ in range(4)]
+            weights = [rng.random() for _ in range(4)]
+            w.weights = [x/sum(weights) for x in weights]
+        else:
+            w.bones = [rng.randrange(bones), rng.randrange(bones)]
+            w.weights = pmx.BoneWeightSDEF(rng.random(), _vector(rng, 3), _vector(rng, 3), _vector(rng, 3))
+        v.weight = w
+        model.vertices.append(v)
+
+    num_materials = max(1, min(vertices//3//1000, 32)) if vertices >= 3 else 0
+    num_faces = vertices//3*3 if vertices >= 3 else 0
+    model.faces = [[rng.randrange(vertices) for _ in range(3)] for _ in range(num_faces//3)]
+
+    for i in range(min(num_materials, 8)):
+        t = pmx.Texture()
+        t.path = os.path.join('tex', 'texture%02d.png'%i)
+        model.textures.append(t)
+
+    for i in range(num_materials):
+        m = pmx.Material()
+        m.name = '材質%02d'%i
+        m.name_e = 'material%02d'%i
+        m.diffuse = (1.0, 1.0, 1.0, 1.0)
+        m.specular = (0.5, 0.5, 0.5)
+        m.shininess = 5.0
+        m.ambient = (0.5, 0.5, 0.5)
+        m.edge_color = (0.0, 0.0, 0.0, 1.0)
+        m.texture = i if i < len(model.textures) else -1
+        begin, end = len(model.faces)*i//num_materials, len(model.faces)*(i+1)//num_materials
+        m.vertex_count = (end - begin)*3
+        model.materials.append(m)
+
+    for i in range(bones):
+        b = pmx.Bone()
+        b.name = _bone_name(i)
+        b.name_e = 'bone%03d'%i
+        b.location = _vector(rng, 3)
+        b.parent = _parent(rng, i)
+        b.displayConnection = _vector(rng, 3, 1.0) if i%2 else -1
+        if i%20 == 19:
+            b.isIK = True
+            b.target = i - 1
+            b.loopCount = 40
+            b.rotationConstraint = 0.5
+            for j in range(2):
+                link = pmx.IKLink()
+                link.target = max(i - 2 - j, 0)
+                if j == 0:
+                    link.minimumAngle = (-3.14, 0.0, 0.0)
+                    link.maximumAngle = (-0.01, 0.0, 0.0)
+                b.ik_links.append(link)
+        if i%10 == 5:
+            b.hasAdditionalRotate = True
+            b.additionalTransform = (max(i - 1, 0), 0.5)
+        model.bones.append(b)
+
+    for i in range(morphs):
+        kind = i%5
+        name = _morph_name(i)
+        if kind == 0:
+            morph = pmx.VertexMorph(name, 'vertex%03d'%i, 1+i%4)
+            for index in sorted(rng.sample(range(vertices), min(morph_offsets, vertices))):
+                o = pmx.VertexMorphOffset()
+                o.index = index
+                o.offset = _vector(rng, 3, 0.1)
+                morph.offsets.append(o)
+        elif kind == 1:
+            morph = pmx.UVMorph(name, 'uv%03d'%i, 1+i%4)
+            for index in sorted(rng.sample(range(vertices), min(morph_offsets, vertices))):
+                o = pmx.UVMorphOffset()
+                o.index = index
+                o.offset = _vector(rng, 4, 0.1)
+                morph.offsets.append(o)
+        elif kind == 2:
+            morph = pmx.BoneMorph(name, 'bone%03d'%i, 1+i%4)
+            for index in range(min(morph_offsets, bones)):
+                o = pmx.BoneMorphOffset()
+                o.index = index
+                o.location_offset = _vector(rng, 3, 0.1)
+                o.rotation_offset = _rotation(rng)
+                morph.offsets.append(o)
+        elif kind == 3:
+            morph = pmx.MaterialMorph(name, 'material%03d'%i, 1+i%4)
+            for index in range(len(model.materials)):
+                o = pmx.MaterialMorphOffset()
+                o.index = index
+                o.offset_type = i%2
+                o.diffuse_offset = _vector(rng, 4, 1.0)
+                o.specular_offset = _vector(rng, 3, 1.0)
+                o.shininess_offset = rng.random()
+                o.ambient_offset = _vector(rng, 3, 1.0)
+                o.edge_color_offset = _vector(rng, 4, 1.0)
+                o.edge_size_offset = rng.random()
+                o.texture_factor = _vector(rng, 4, 1.0)
+                o.sphere_texture_factor = _vector(rng, 4, 1.0)
+                o.toon_texture_factor = _vector(rng, 4, 1.0)
+                morph.offsets.append(o)
+        else:
+            morph = pmx.GroupMorph(name, 'group%03d'%i, 1+i%4)
+            for index in range(max(i - 4, 0), i):
+                o = pmx.GroupMorphOffset()
+                o.morph = index
+                o.factor = rng.random()
+                morph.offsets.append(o)
+        model.morphs.append(morph)
+
+    model.display[0].data.append((0, 0))
+    model.display[1].data.extend((1, i) for i in range(morphs))
+    frame = pmx.Display()
+    frame.name = 'ボーン'
+    frame.name_e = 'bones'
+    frame.data.extend((0, i) for i in range(1, bones))
+    model.display.append(frame)
+
+    for i in range(rigids):
+        r = pmx.Rigid()
+        r.name = '剛体%03d'%i
+        r.name_e = 'rigid%03d'%i
+        r.bone = rng.randrange(bones)
+        r.collision_group_number = i%16
+        r.collision_group_mask = rng.randrange(1<<16)
+        r.type = i%3
+        r.size = _vector(rng, 3, 1.0)
+        r.location = _vector(rng, 3)
+        r.rotation = _vector(rng, 3, 3.14)
+        r.mass = 1.0
+        r.velocity_attenuation = 0.5
+        r.rotation_attenuation = 0.5
+        r.bounce = 0.0
+        r.friction = 0.5
+        r.mode = i%3
+        model.rigids.append(r)
+
+    for i in range(joints if rigids > 1 else 0):
+        j = pmx.Joint()
+        j.name = 'ジョイント%03d'%i
+        j.name_e = 'joint%03d'%i
+        j.src_rigid = i%rigids
+        j.dest_rigid = (i + 1)%rigids
+        j.location = _vector(rng, 3)
+        j.rotation = _vector(rng, 3, 3.14)
+        j.maximum_location = _vector(rng, 3, 1.0)
+        j.minimum_location = _vector(rng, 3, 1.0)
+        j.maximum_rotation = _vector(rng, 3, 1.0)
+        j.minimum_rotation = _vector(rng, 3, 1.0)
+        j.spring_constant = _vector(rng, 3, 1.0)
+        j.spring_rotation_constant = _vector(rng, 3, 1.0)
+        model.joints.append(j)
+
+    return model, additional_uvs
+
+def make_pmx(path, **knobs):
+    """ Write a synthetic pmx file, see make_pmx_model() for the size knobs.
+    """
+    model, additional_uvs = make_pmx_model(**knobs)
+    pmx.save(path, model, additional_uvs)
+    return path
+
+def _pmd_str(s, length):
+    return s.encode('shift_jis', errors='replace')[:length].ljust(length, b'\x00')
+
+def make_pmd(path, vertices=DEFAULTS['vertices'], bones=DEFAULTS['bones'], morphs=DEFAULTS['morphs'],
+             morph_offsets=DEFAULTS['morph_offsets'], rigids=DEFAULTS['rigids'], joints=DEFAULTS['joints'],
+             seed=DEFAULTS['seed'], **_):
+    """ Write a synthetic pmd file including the english names, toon textures and physics extensions.
+
+    There is no pmd writer in mmd_tools, so the file is packed directly here.
+    """
+    rng = random.Random(seed)
+    vertices = min(vertices, 0xffff) # face indices are unsigned shorts
+    bones = min(max(bones, 2), 0xfffe)
+    morphs = min(morphs, 0xff)
+    data = [b'Pmd', struct.pack('<f', 1.0), _pmd_str('シンセティック', 20), _pmd_str('seed %d'%seed, 256)]
+
+    data.append(struct.pack('<I', vertices))
+    vertex = struct.Struct('<8f2HBB')
+    for i in range(vertices):
+        data.append(vertex.pack(*_vector(rng, 3), *_normal(rng), rng.random(), rng.random(),
+                                rng.randrange(bones), rng.randrange(bones), rng.randrange(101), i%2))
+
+    num_indices = vertices//3*3
+    data.append(struct.pack('<I', num_indices))
+    data.append(struct.pack('<%dH'%num_indices, *(rng.randrange(vertices) for _ in range(num_indices))))
+
+    num_materials = max(1, min(num_indices//3000, 32)) if num_indices else 0
+    data.append(struct.pack('<I', num_materials))
+    material = struct.Struct('<4ff3f3fbBI')
+    for i in range(num_materials):
+        begin, end = num_indices//3*i//num_materials, num_indices//3*(i+1)//num_materials
+        tex = ('texture%02d.bmp'%i, 'texture%02d.bmp*sphere.sph'%i, 'sphere%02d.spa'%i)[i%3]
+        data.append(material.pack(1.0, 1.0, 1.0, 1.0, 5.0, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, i%10, 1, (end - begin)*3) + _pmd_str(tex, 20))
+
+    data.append(struct.pack('<H', bones))
+    for i in range(bones):
+        bone_type = 9 if i%20 == 19 else i%8
+        parent = _parent(rng, i)
+        data.append(_pmd_str(_bone_name(i), 20))
+        data.append(struct.pack('<HHB', 0xffff if parent < 0 else parent, i + 1 if i + 1 < bones else 0xffff, bone_type))
+        data.append(struct.pack('<h' if bone_type == 9 else '<H', 0))
+        data.append(struct.pack('<3f', *_vector(rng, 3)))
+
+    iks = [i for i in range(bones) if i%20 == 19]
+    data.append(struct.pack('<H', len(iks)))
+    for i in iks:
+        data.append(struct.pack('<HHBHf', i, i - 1, 2, 40, 0.5) + struct.pack('<2H', i - 2, i - 3))
+
+    base_indices = sorted(rng.sample(range(vertices), min(morph_offsets, vertices)))
+    data.append(struct.pack('<H', morphs + 1 if morphs else 0))
+    if morphs:
+        data.append(_pmd_str('base', 20) + struct.pack('<IB', len(base_indices), 0))
+        for index in base_indices:
+            data.append(struct.pack('<I3f', index, *_vector(rng, 3)))
+        for i in range(morphs):
+            offsets = sorted(rng.sample(range(len(base_indices)), min(morph_offsets, len(base_indices))))
+            data.append(_pmd_str(_morph_name(i), 20) + struct.pack('<IB', len(offsets), 1 + i%4))
+            for index in offsets:
+                data.append(struct.pack('<I3f', index, *_vector(rng, 3, 0.1)))
+
+    data.append(struct.pack('<B', morphs) + struct.pack('<%dH'%morphs, *range(1, morphs + 1)))
+    data.append(struct.pack('<B', 1) + _pmd_str('ボーン', 50))
+    data.append(struct.pack('<I', bones - 1) + b''.join(struct.pack('<HB', i, 1) for i in range(1, bones)))
+
+    data.append(struct.pack('<B', 1) + _pmd_str('synthetic', 20) + _pmd_str('english comment', 256))
+    data.extend(_pmd_str('bone%03d'%i, 20) for i in range(bones))
+    data.extend(_pmd_str('morph%03d'%i, 20) for i in range(morphs))
+    data.append(_pmd_str('bones', 50))
+    data.extend(_pmd_str('toon%02d.bmp'%(i + 1), 100) for i in range(10))
+
+    data.append(struct.pack('<I', rigids))
+    for i in range(rigids):
+        data.append(_pmd_str('剛体%03d'%i, 20) + struct.pack('<HBHB', rng.randrange(bones), i%16, rng.randrange(1<<16), i%3))
+        data.append(struct.pack('<3f3f3f5fB', *_vector(rng, 3, 1.0), *_vector(rng, 3), *_vector(rng, 3, 3.14),
+                                1.0, 0.5, 0.5, 0.0, 0.5, i%3))
+
+    joints = joints if rigids > 1 else 0
+    data.append(struct.pack('<I', joints))
+    for i in range(joints):
+        data.append(_pmd_str('ジョイント%03d'%i, 20) + struct.pack('<II', i%rigids, (i + 1)%rigids))
+        data.append(struct.pack('<24f', *_vector(rng, 24, 1.0)))
+
+    with open(path, 'wb') as f:
+        f.write(b''.join(data))
+    return path
+
+def _frames(rng, count, step=3):
+    frame, frames = 0, []
+    for i in range(count):
+        frames.append(frame)
+        frame += rng.randrange(1, step*2)
+    return frames
+
+def make_vmd(path, bones=DEFAULTS['bones'], morphs=DEFAULTS['morphs'], motion_keys=DEFAULTS['motion_keys'],
+             seed=DEFAULTS['seed'], **_):
+    """ Write a synthetic vmd file with ``motion_keys`` keys for every bone and morph, and a camera motion.
+    """
+    rng = random.Random(seed)
+    f = vmd.File()
+    f.header = vmd.Header()
+    f.header.model_name = 'シンセティック'
+    f.boneAnimation = vmd.BoneAnimation()
+    f.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+    f.cameraAnimation = vmd.CameraAnimation()
+    f.propertyAnimation = vmd.PropertyAnimation()
+
+    for i in range(bones):
+        keys = f.boneAnimation[_bone_name(i)]
+        for frame in _frames(rng, motion_keys):
+            k = vmd.BoneFrameKey()
+            k.frame_number = frame
+            k.location = list(_vector(rng, 3, 1.0))
+            k.rotation = list(_rotation(rng))
+            k.interp = [rng.randrange(128) for _ in range(64)]
+            keys.append(k)
+
+    for i in range(morphs):
+        keys = f.shapeKeyAnimation[_morph_name(i)]
+        for frame in _frames(rng, motion_keys):
+            k = vmd.ShapeKeyFrameKey()
+            k.frame_number = frame
+            k.weight = rng.random()
+            keys.append(k)
+
+    for frame in _frames(rng, motion_keys):
+        k = vmd.CameraKeyFrameKey()
+        k.frame_number = frame
+        k.distance = -rng.uniform(10, 50)
+        k.location = list(_vector(rng, 3))
+        k.rotation = list(_vector(rng, 3, 3.14))
+        k.interp = [rng.randrange(128) for _ in range(24)]
+        k.angle = rng.randrange(10, 60)
+        k.persp = bool(frame%2)
+        f.cameraAnimation.append(k)
+
+    k = vmd.PropertyFrameKey()
+    k.ik_states = [(_bone_name(i), i%2) for i in range(bones) if i%20 == 19]
+    f.propertyAnimation.append(k)
+
+    f.save(filepath=path)
+    return path
+
+def make_vpd(path, bones=DEFAULTS['bones'], morphs=DEFAULTS['morphs'], seed=DEFAULTS['seed'], **_):
+    """ Write a synthetic vpd file with a pose of every bone and morph.
+    """
+    rng = random.Random(seed)
+    f = vpd.File()
+    f.osm_name = 'synthetic.osm'
+    f.bones = [vpd.VpdBone(_bone_name(i), list(_vector(rng, 3, 1.0)), list(_rotation(rng))) for i in range(bones)]
+    f.morphs = [vpd.VpdMorph(_morph_name(i), rng.random()) for i in range(morphs)]
+    f.save(filepath=path)
+    return path
+
+GENERATORS = {
+    'pmx': make_pmx,
+    'pmd': make_pmd,
+    'vmd': make_vmd,
+    'vpd': make_vpd,
+    }
+
+def generate(output_dir, file_types=tuple(GENERATORS.keys()), **knobs):
+    """ Write one synthetic file of each type into ``output_dir``.
+
+    @return a dict of {file type: file path}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    ret = {}
+    for file_type in file_types:
+        path = os.path.join(output_dir, 'synthetic.%s'%file_type)
+        ret[file_type] = GENERATORS[file_type](path, **knobs)
+    return ret
+
+def add_arguments(parser):
+    for name, value in DEFAULTS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=value, dest=name)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('output_dir', help='the directory of the generated files')
+    parser.add_argument('--types', nargs='+', choices=sorted(GENERATORS.keys()), default=sorted(GENERATORS.keys()))
+    add_arguments(parser)
+    args = vars(parser.parse_args(argv))
+    output_dir, file_types = args.pop('output_dir'), args.pop('types')
+    for file_type, path in sorted(generate(output_dir, file_types, **args).items()):
+        print('%s: %s (%d bytes)'%(file_type, path, os.path.getsize(path)))
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
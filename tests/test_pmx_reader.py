@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import unittest
+
+from mmd_tools.core import pmd
+from mmd_tools.core import pmx
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'samples')
+
+class TestPmxReader(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __list_sample_files(self, file_type):
+        ret = []
+        file_ext ='.' + file_type
+        for root, dirs, files in os.walk(os.path.join(SAMPLES_DIR, file_type)):
+            for name in files:
+                if name.lower().endswith(file_ext):
+                    ret.append(os.path.join(root, name))
+        if len(ret) < 1:
+            self.fail('required %s sample file(s)!'%file_type)
+        return ret
+
+    def __dump(self, obj):
+        if isinstance(obj, (list, tuple)):
+            return [self.__dump(i) for i in obj]
+        if isinstance(obj, dict):
+            return {k:self.__dump(v) for k, v in obj.items()}
+        if hasattr(obj, '__dict__'):
+            return (type(obj).__name__, self.__dump(vars(obj)))
+        slots = [k for cls in type(obj).__mro__ for k in getattr(cls, '__slots__', ())]
+        if slots:
+            return (type(obj).__name__, {k:self.__dump(getattr(obj, k)) for k in slots})
+        return obj
+
+    def __save_pmx_by_records(self, filepath, model, add_uv_count):
+        """ pmx.save() through the per-record Vertex.save() and Morph.save() """
+        from unittest import mock
+        from mmd_tools.core.pmx import bulk
+        def write_vertices(fs, vertices):
+            fs.writeInt(len(vertices))
+            for v in vertices:
+                v.save(fs)
+        def write_faces(fs, faces):
+            fs.writeInt(len(faces)*3)
+            for f3, f2, f1 in faces:
+                fs.writeVertexIndex(f1)
+                fs.writeVertexIndex(f2)
+                fs.writeVertexIndex(f3)
+        def write_morph(fs, morph):
+            morph.save(fs)
+        with mock.patch.object(bulk, 'write_vertices', write_vertices), \
+                mock.patch.object(bulk, 'write_faces', write_faces), \
+                mock.patch.object(bulk, 'write_morph', write_morph):
+            pmx.save(filepath, model, add_uv_count)
+
+    def __load_pmx_by_file_stream(self, filepath, sections=None):
+        with pmx.FileReadStream(filepath) as fs:
+            header = pmx.Header()
+            header.load(fs)
+            fs.setHeader(header)
+            model = pmx.Model()
+            model.load(fs, sections)
+            return model
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_pmx_mapped_stream(self):
+        for filepath in self.__list_sample_files('pmx'):
+            source_model = self.__load_pmx_by_file_stream(filepath)
+            result_model = pmx.load(filepath)
+            self.assertEqual(self.__dump(source_model), self.__dump(result_model), filepath)
+
+    def test_pmd_mapped_stream(self):
+        for filepath in self.__list_sample_files('pmd'):
+            with pmd.FileReadStream(filepath) as fs:
+                source_model = pmd.Model()
+                source_model.load(fs)
+            result_model = pmd.load(filepath)
+            self.assertEqual(self.__dump(source_model), self.__dump(result_model), filepath)
+
+    def test_pmd_columnar_model(self):
+        from mmd_tools.core.pmd import bulk
+        for filepath in self.__list_sample_files('pmd'):
+            source_model = pmd.load(filepath)
+            result_model = bulk.load(filepath)
+            self.assertEqual(self.__dump(source_model.vertices), self.__dump(result_model.vertices.to_vertices()), filepath)
+            self.assertEqual(source_model.faces, list(map(tuple, result_model.faces.tolist())), filepath)
+            self.assertEqual(len(source_model.morphs), len(result_model.morphs), filepath)
+            for source_morph, result_morph in zip(source_model.morphs, result_model.morphs):
+                self.assertEqual(self.__dump(source_morph.data), self.__dump(result_morph.data.to_offsets(pmd.MorphData)), filepath)
+
+            vertices = result_model.vertices.to_pmx()
+            for v, pv, weights in zip(source_model.vertices, vertices.to_vertices(), vertices.weights.tolist()):
+                self.assertEqual(tuple(v.position), pv.co)
+                self.assertEqual(pv.edge_scale, 1.0 if v.enable_edge == 0 else 0.0)
+                if v.bones[0] != v.bones[1]:
+                    self.assertEqual(pv.weight.type, pmx.BoneWeight.BDEF2)
+                    self.assertEqual(pv.weight.bones, v.bones)
+                    # the float32 values of the weights the old converter computed in float64
+                    self.assertEqual(weights[:2], [struct.unpack('<f', struct.pack('<f', w))[0] for w in (v.weight/100.0, 1.0 - v.weight/100.0)])
+                else:
+                    self.assertEqual(pv.weight.type, pmx.BoneWeight.BDEF1)
+                    self.assertEqual(pv.weight.bones, v.bones[:1])
+
+    def test_pmx_shared_strings(self):
+        for filepath in self.__list_sample_files('pmx'):
+            model = pmx.load(filepath)
+            names = {}
+            for obj in model.bones + model.morphs + model.materials + model.rigids + model.joints:
+                for name in (obj.name, obj.name_e):
+                    self.assertIs(names.setdefault(name, name), name, filepath)
+
+    def test_pmx_sections(self):
+        for filepath in self.__list_sample_files('pmx'):
+            source_model = pmx.load(filepath)
+            header, sections = pmx.scan(filepath)
+            self.assertEqual([s.name for s in sections], list(pmx.SECTIONS))
+            for section in sections:
+                self.assertEqual(section.count, len(getattr(source_model, section.name)), filepath)
+
+            for name in pmx.SECTIONS:
+                result_model = pmx.load(filepath, sections=(name,))
+                self.assertEqual(self.__dump(getattr(source_model, name)), self.__dump(getattr(result_model, name)), filepath)
+                result_model = self.__load_pmx_by_file_stream(filepath, sections=(name,))
+                self.assertEqual(self.__dump(getattr(source_model, name)), self.__dump(getattr(result_model, name)), filepath)
+
+            result_model = pmx.load(filepath, sections=('bones',))
+            self.assertEqual(result_model.name, source_model.name)
+            self.assertEqual(len(result_model.vertices), 0)
+            self.assertEqual(len(result_model.joints), 0)
+
+        with self.assertRaises(ValueError):
+            pmx.Model().load(None, sections=('bones', 'unknown'))
+
+    def test_pmx_columnar_model(self):
+        from mmd_tools.core.pmx import bulk
+        for filepath in self.__list_sample_files('pmx'):
+            source_model = pmx.load(filepath)
+            columnar_model = bulk.load(filepath)
+            self.assertEqual(len(columnar_model.vertices), len(source_model.vertices))
+            self.assertEqual(columnar_model.faces.shape, (len(source_model.faces), 3))
+            self.assertEqual(self.__dump(source_model), self.__dump(columnar_model.to_model()), filepath)
+            columnar_model = bulk.ColumnarModel.from_model(source_model)
+            self.assertEqual(self.__dump(source_model), self.__dump(columnar_model.to_model()), filepath)
+
+    def test_vertex_group_buckets(self):
+        import numpy as np
+        from mmd_tools.core.pmx import bulk
+        for filepath in self.__list_sample_files('pmx'):
+            model = pmx.load(filepath)
+            model.vertices[0].weight.type, model.vertices[0].weight.bones = pmx.BoneWeight.BDEF4, [0, 0, -1, 1]
+            model.vertices[0].weight.weights = [0.5, 0.75, 0.0, 0.25]
+            # partial sums over 1, negative weights and weights over 1
+            model.vertices[1].weight.type, model.vertices[1].weight.bones = pmx.BoneWeight.BDEF4, [0, 0, 0, -1]
+            model.vertices[1].weight.weights = [0.75, 0.5, -0.5, 0.25]
+            model.vertices[2].weight.type, model.vertices[2].weight.bones = pmx.BoneWeight.BDEF4, [0, 0, -1, -1]
+            model.vertices[2].weight.weights = [-0.5, 0.25, 0.0, 0.0]
+            model.vertices[3].weight.type, model.vertices[3].weight.bones = pmx.BoneWeight.BDEF2, [0, 1]
+            model.vertices[3].weight.weights = [1.5]
+            group_count = max(len(model.bones), 1)
+            # VertexGroup.add(type='ADD') of the vertex weights one by one, the weight argument
+            # is clamped to [0, 1] and each sum is limited to 1
+            expected = [{} for i in range(group_count)]
+            def add(bone, vertex, weight):
+                group = expected[bone]
+                weight = min(max(np.float32(weight), np.float32(0)), np.float32(1))
+                group[vertex] = min(1.0, float(np.float32(group.get(vertex, 0.0)) + weight))
+            for i, v in enumerate(model.vertices):
+                bones, weights = v.weight.bones, v.weight.weights
+                if v.weight.type == pmx.BoneWeight.BDEF1:
+                    if bones[0] >= 0:
+                        add(bones[0], i, 1.0)
+                elif v.weight.type == pmx.BoneWeight.SDEF:
+                    add(bones[0], i, weights.weight)
+                    add(bones[1], i, 1.0 - weights.weight)
+                elif v.weight.type == pmx.BoneWeight.BDEF2:
+                    add(bones[0], i, weights[0])
+                    add(bones[1], i, 1.0 - weights[0])
+                else:
+                    for bone, weight in zip(bones, weights):
+                        add(bone, i, weight)
+
+            vertices = bulk.VertexArrays.from_vertices(model.vertices, 0)
+            result = [{} for i in range(group_count)]
+            for group, weight, indices in bulk.vertex_group_buckets(*bulk.bone_weight_entries(vertices, group_count)):
+                self.assertEqual(len(set(result[group]) & set(indices.tolist())), 0)
+                result[group].update((i, weight) for i in indices.tolist())
+            self.assertEqual(result, expected, filepath)
+            self.assertEqual(result[-1][0], 0.0)
+            self.assertEqual(result[0][0], 1.0)
+            self.assertEqual(result[0][1], 1.0)
+            self.assertEqual(result[0][2], 0.25)
+            self.assertEqual((result[0][3], result[1][3]), (1.0, 0.0))
+
+    def test_round_coordinates(self):
+        import numpy as np
+        # the overlapping face check rounds float32 coordinates with np.round() instead of round()
+        rng = np.random.RandomState(0)
+        ties = (rng.randint(-2**22, 2**22, 50000) + 0.5) / 1e6
+        co = np.concatenate([ties, np.nextafter(ties, np.inf), np.nextafter(ties, -np.inf),
+                             rng.uniform(-100, 100, 50000), [0.0, -0.0, 5e-7, -5e-7, 2.5e-6, 1e30]]).astype(np.float32)
+        values = co.astype(np.float64)
+        self.assertEqual(np.round(values, 6).tolist(), [round(v, 6) for v in values.tolist()])
+
+    def test_merge_vertices(self):
+        import random
+        import numpy as np
+        from mmd_tools.core.pmx import bulk
+        for filepath in self.__list_sample_files('pmx'):
+            model = pmx.load(filepath)
+            rng = random.Random(0)
+            vertices = model.vertices
+            for v in vertices[::2]:
+                v.co = tuple(rng.choice(vertices).co)
+            vertices[0].co, vertices[-1].co = (-0.0, 0.0, 0.0), (0.0, -0.0, 0.0)
+            # the signatures of the vertices compared as tuples, as the PMX importer did
+            signatures = [[tuple(v.co)] for v in vertices]
+            for i, m in enumerate(model.morphs):
+                if isinstance(m, (pmx.VertexMorph, pmx.UVMorph)):
+                    for x in m.offsets:
+                        signatures[x.index].append((i,) + tuple(x.offset))
+            keys = {}
+            expected = [keys.setdefault(tuple(k), (i, len(keys))) for i, k in enumerate(signatures)]
+
+            co = np.array([v.co for v in vertices], dtype=np.float64)
+            pmx_indices, blender_indices = bulk.merge_vertices(co, *bulk.morph_offset_entries(model.morphs))
+            self.assertEqual(list(zip(pmx_indices.tolist(), blender_indices.tolist())), expected, filepath)
+            self.assertLess(len(set(expected)), len(expected), filepath)
+
+            faces = [tuple(pmx_indices[list(f)].tolist()) for f in model.faces]
+            faces += faces[:5] + [f[::-1] for f in faces[:5]] + [(0, 0, 1)]
+            face_counts = [len(faces)//2, len(faces) - len(faces)//2]
+            used, expected = [set(), set()], []
+            for i, f in enumerate(faces):
+                material = int(i >= face_counts[0])
+                if len(set(f)) == 3 and frozenset(f) not in used[material]:
+                    used[material].add(frozenset(f))
+                    expected.append(i)
+            keep, counts = bulk.clean_faces(faces, face_counts)
+            self.assertEqual(np.flatnonzero(keep).tolist(), expected, filepath)
+            self.assertEqual(counts.sum(), len(expected), filepath)
+
+    def test_pmx_read_morphs(self):
+        from mmd_tools.core.pmx import bulk
+        for filepath in self.__list_sample_files('pmx'):
+            header, sections = pmx.scan(filepath)
+            section = sections[pmx.SECTIONS.index('morphs')]
+            with pmx.FileReadStream(filepath, header) as fs:
+                fs.seek(section.offset)
+                source_morphs = [pmx.Morph.create(fs) for i in range(section.count)]
+            with pmx.MappedFileReadStream(filepath, header) as fs:
+                fs.seek(section.offset)
+                result_morphs = bulk.read_morphs(fs, section.count, as_objects=True)
+                self.assertEqual(fs.tell(), sections[pmx.SECTIONS.index('display')].offset - 4, filepath)
+            self.assertEqual(self.__dump(source_morphs), self.__dump(result_morphs), filepath)
+
+    def test_pmx_parallel_morphs(self):
+        from mmd_tools.core.pmx import bulk
+        def offsets(morph):
+            if isinstance(morph.offsets, bulk.MorphOffsetArrays):
+                return morph.offsets.index.tolist(), morph.offsets.offset.tolist()
+            return self.__dump(morph.offsets)
+        parallel_morph_size = bulk.PARALLEL_MORPH_SIZE
+        try:
+            bulk.PARALLEL_MORPH_SIZE = 0
+            for filepath in self.__list_sample_files('pmx'):
+                header, sections = pmx.scan(filepath)
+                section = sections[pmx.SECTIONS.index('morphs')]
+                for as_objects in (False, True):
+                    results = []
+                    for workers in (1, 4):
+                        with pmx.MappedFileReadStream(filepath, header) as fs:
+                            fs.seek(section.offset)
+                            morphs = bulk.read_morphs(fs, section.count, as_objects=as_objects, workers=workers)
+                        results.append([(m.name, offsets(m)) for m in morphs])
+                    self.assertEqual(results[0], results[1], filepath)
+        finally:
+            bulk.PARALLEL_MORPH_SIZE = parallel_morph_size
+
+    def test_pmx_cache(self):
+        from mmd_tools.core.cache import DiskCache
+        from mmd_tools.core.pmx import bulk
+        cache_dir = os.path.join(TESTS_DIR, 'output', 'cache')
+        cache = DiskCache(cache_dir)
+        for filepath in self.__list_sample_files('pmx'):
+            source_model = pmx.load(filepath)
+            for i in range(2): # parse and store, then load from the cache
+                result_model = bulk.load_cached(filepath, cache)
+                self.assertEqual(self.__dump(source_model), self.__dump(result_model), filepath)
+            self.assertTrue(any(name.startswith('pmx-%d-'%bulk.CACHE_VERSION) for name in os.listdir(cache_dir)))
+            # a relative path of the same file hits the same entry
+            entries = sorted(os.listdir(cache_dir))
+            bulk.load_cached(os.path.relpath(filepath), cache)
+            self.assertEqual(sorted(os.listdir(cache_dir)), entries, filepath)
+
+        cache.max_size = 0
+        cache.evict()
+        self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_pmx_writer(self):
+        from mmd_tools.core.pmx import bulk
+        output_pmx = os.path.join(TESTS_DIR, 'output', 'writer.pmx')
+        for filepath in self.__list_sample_files('pmx'):
+            source_model = pmx.load(filepath)
+            add_uv_count = source_model.header.additional_uvs
+
+            self.__save_pmx_by_records(output_pmx, source_model, add_uv_count)
+            with open(output_pmx, 'rb') as f:
+                source_data = f.read()
+            pmx.save(output_pmx, source_model, add_uv_count)
+            with open(output_pmx, 'rb') as f:
+                self.assertEqual(source_data, f.read(), filepath)
+            pmx.save(output_pmx, bulk.load(filepath), add_uv_count)
+            with open(output_pmx, 'rb') as f:
+                self.assertEqual(source_data, f.read(), filepath)
+
+            source_model.vertices[0].weight.type = 9 # invalid weight type
+            with self.assertRaises(ValueError):
+                pmx.save(output_pmx, source_model, add_uv_count)
+            with open(output_pmx, 'rb') as f:
+                self.assertEqual(source_data, f.read(), filepath)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
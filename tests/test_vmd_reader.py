@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import random
+import struct
+import sys
+import unittest
+
+from mmd_tools.core import vmd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(TESTS_DIR, 'benchmarks'))
+import synthetic
+
+class TestVmdReader(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __dump(self, obj):
+        if isinstance(obj, (list, tuple)):
+            return [self.__dump(i) for i in obj]
+        if isinstance(obj, dict):
+            return {k:self.__dump(v) for k, v in obj.items()}
+        if hasattr(obj, '__dict__'):
+            return (type(obj).__name__, self.__dump(vars(obj)))
+        slots = [k for cls in type(obj).__mro__ for k in getattr(cls, '__slots__', ())]
+        if slots:
+            return (type(obj).__name__, {k:self.__dump(getattr(obj, k)) for k in slots})
+        return obj
+
+    def __make_interleaved_vmd(self, filepath):
+        ''' Write a vmd file whose keyframes of different names are interleaved
+        '''
+        synthetic.make_vmd(filepath, bones=20, morphs=10, motion_keys=30)
+        motion = vmd.File()
+        motion.load(filepath=filepath)
+        with open(filepath, 'wb') as fout:
+            motion.header.save(fout)
+            rng = random.Random(0)
+            for animation in (motion.boneAnimation, motion.shapeKeyAnimation):
+                keys = [(name, k) for name, frame_keys in animation.items() for k in frame_keys]
+                keys.append(('', keys[0][1])) # an empty name
+                rng.shuffle(keys)
+                fout.write(struct.pack('<L', len(keys)))
+                for name, k in keys:
+                    fout.write(struct.pack('<15s', vmd._toShiftJisBytes(name)))
+                    k.save(fout)
+            motion.cameraAnimation.save(fout)
+            motion.lampAnimation.save(fout)
+            motion.selfShadowAnimation.save(fout)
+            motion.propertyAnimation.save(fout)
+
+    def __load_vmd_by_frame_keys(self, filepath):
+        ''' Load the bone and morph keyframes one by one with the frame key loaders
+        '''
+        ret = []
+        with open(filepath, 'rb') as fin:
+            vmd.Header().load(fin)
+            for animation in (vmd.BoneAnimation(), vmd.ShapeKeyAnimation()):
+                count, = struct.unpack('<L', fin.read(4))
+                for i in range(count):
+                    name = vmd._toShiftJisString(struct.unpack('<15s', fin.read(15))[0])
+                    k = animation.frameClass()()
+                    k.load(fin)
+                    animation[name].append(k)
+                ret.append(animation)
+        return ret
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_vmd_frame_keys(self):
+        filepath = os.path.join(TESTS_DIR, 'output', 'interleaved.vmd')
+        self.__make_interleaved_vmd(filepath)
+        bone_animation, shape_key_animation = self.__load_vmd_by_frame_keys(filepath)
+
+        motion = vmd.File()
+        motion.load(filepath=filepath)
+        self.assertEqual(list(motion.boneAnimation.keys()), list(bone_animation.keys()))
+        self.assertEqual(self.__dump(dict(motion.boneAnimation)), self.__dump(dict(bone_animation)))
+        self.assertEqual(list(motion.shapeKeyAnimation.keys()), list(shape_key_animation.keys()))
+        self.assertEqual(self.__dump(dict(motion.shapeKeyAnimation)), self.__dump(dict(shape_key_animation)))
+        self.assertEqual(len(motion.cameraAnimation), 30)
+
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        truncated_filepath = os.path.join(TESTS_DIR, 'output', 'truncated.vmd')
+        with open(truncated_filepath, 'wb') as f:
+            f.write(data[:50 + 4 + 111*100 + 50])
+        motion = vmd.File()
+        motion.load(filepath=truncated_filepath)
+        self.assertEqual(sum(len(keys) for keys in motion.boneAnimation.values()), 100)
+        self.assertEqual(len(motion.shapeKeyAnimation), 0)
+
+    def test_vmd_columnar_file(self):
+        from mmd_tools.core.vmd import bulk
+        filepath = os.path.join(TESTS_DIR, 'output', 'interleaved.vmd')
+        self.__make_interleaved_vmd(filepath)
+        source_motion = vmd.File()
+        source_motion.load(filepath=filepath)
+        result_motion = bulk.load(filepath)
+        self.assertEqual(list(result_motion.boneAnimation.keys()), list(source_motion.boneAnimation.keys()))
+        self.assertEqual(self.__dump(source_motion), self.__dump(result_motion.to_file()))
+
+    def test_vmd_filtered_load(self):
+        from mmd_tools.core.vmd import bulk
+        filepath = os.path.join(TESTS_DIR, 'output', 'interleaved.vmd')
+        self.__make_interleaved_vmd(filepath)
+        source_motion = vmd.File()
+        source_motion.load(filepath=filepath)
+        bone_names = set(list(source_motion.boneAnimation.keys())[::3])
+        morph_names = {''}
+
+        stream_chunk_size = bulk.STREAM_CHUNK_SIZE
+        try:
+            bulk.STREAM_CHUNK_SIZE = 7
+            for frame_range in (None, (10, 40), (None, 20), (30, None), (1000, None)):
+                motion = vmd.File()
+                motion.load(filepath=filepath, frame_range=frame_range, bone_names=bone_names, morph_names=morph_names)
+                start, end = frame_range or (None, None)
+                in_range = lambda k: (start is None or k.frame_number >= start) and (end is None or k.frame_number <= end)
+                for attr, names in (('boneAnimation', bone_names), ('shapeKeyAnimation', morph_names)):
+                    expected = {name:[k for k in keys if in_range(k)] for name, keys in getattr(source_motion, attr).items() if name in names}
+                    expected = {name:keys for name, keys in expected.items() if keys}
+                    self.assertEqual(self.__dump(dict(getattr(motion, attr))), self.__dump(expected), frame_range)
+                for attr in ('cameraAnimation', 'propertyAnimation'):
+                    expected = [k for k in getattr(source_motion, attr) if in_range(k)]
+                    self.assertEqual(self.__dump(getattr(motion, attr)), self.__dump(expected), frame_range)
+        finally:
+            bulk.STREAM_CHUNK_SIZE = stream_chunk_size
+
+        with open(filepath, 'rb') as fin:
+            vmd.Header().load(fin)
+            sections = [attr for attr, name, keys in bulk.iter_keys(fin, morph_names=())]
+        self.assertNotIn('shapeKeyAnimation', sections)
+        self.assertEqual(sections[-1], 'propertyAnimation')
+
+    def test_vmd_cache(self):
+        import shutil
+        from mmd_tools.core.cache import DiskCache
+        from mmd_tools.core.vmd import bulk
+        filepath = os.path.join(TESTS_DIR, 'output', 'interleaved.vmd')
+        self.__make_interleaved_vmd(filepath)
+        source_motion = vmd.File()
+        source_motion.load(filepath=filepath)
+        cache_dir = os.path.join(TESTS_DIR, 'output', 'vmd_cache')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        cache = DiskCache(cache_dir)
+
+        bulk._session_motions.clear()
+        first = bulk.load_cached(filepath, cache)
+        self.assertTrue(any(name.startswith('vmd-%d-'%bulk.CACHE_VERSION) for name in os.listdir(cache_dir)))
+        second = bulk.load_cached(filepath, cache)
+        bulk._session_motions.clear()
+        third = bulk.load_cached(filepath, cache)
+        for motion in (first, second, third):
+            self.assertEqual(motion.filepath, filepath)
+            self.assertEqual(self.__dump(motion.to_file()), self.__dump(source_motion))
+        self.assertIs(first.boneAnimation[''], second.boneAnimation[''])
+        self.assertIsNot(first.cameraAnimation, second.cameraAnimation)
+        first.cameraAnimation.sort(key=lambda k: -k.frame_number)
+        self.assertEqual(self.__dump(bulk.load_cached(filepath).to_file()), self.__dump(source_motion))
+
+    def test_vmd_writer(self):
+        from mmd_tools.core.vmd import bulk
+        filepath = os.path.join(TESTS_DIR, 'output', 'interleaved.vmd')
+        output_vmd = os.path.join(TESTS_DIR, 'output', 'writer.vmd')
+        self.__make_interleaved_vmd(filepath)
+        motion = vmd.File()
+        motion.load(filepath=filepath)
+        k = vmd.SelfShadowFrameKey()
+        k.frame_number, k.mode, k.distance = 10, 1, 8875.5
+        motion.selfShadowAnimation.append(k)
+        k = vmd.LampKeyFrameKey()
+        k.frame_number, k.color, k.direction = 10, [0.6, 0.6, 0.6], [-0.5, -1.0, 0.5]
+        motion.lampAnimation.append(k)
+        motion.boneAnimation['not saved']
+        motion.boneAnimation['negative'].append(vmd.BoneFrameKey())
+        motion.boneAnimation['negative'][0].location = [0, 0, 0]
+        motion.boneAnimation['negative'][0].rotation = [0, 0, 0, 1]
+        motion.boneAnimation['negative'][0].interp = [-1]*64
+
+        source_data = io.BytesIO()
+        motion.header.save(source_data)
+        for animation in (motion.boneAnimation, motion.shapeKeyAnimation):
+            source_data.write(struct.pack('<L', sum(len(keys) for keys in animation.values())))
+            for name, keys in animation.items():
+                for k in keys:
+                    source_data.write(struct.pack('<15s', vmd._toShiftJisBytes(name)))
+                    k.save(source_data)
+        for animation in (motion.cameraAnimation, motion.lampAnimation, motion.selfShadowAnimation, motion.propertyAnimation):
+            source_data.write(struct.pack('<L', len(animation)))
+            for k in animation:
+                k.save(source_data)
+        source_data = source_data.getvalue()
+
+        motion.save(filepath=output_vmd)
+        with open(output_vmd, 'rb') as f:
+            self.assertEqual(source_data, f.read())
+        bulk.load(output_vmd).save(filepath=output_vmd)
+        with open(output_vmd, 'rb') as f:
+            self.assertEqual(source_data, f.read())
+
+        motion.boneAnimation['negative'][0].interp = [128]*64
+        with self.assertRaises(struct.error):
+            motion.save(filepath=output_vmd)
+        with open(output_vmd, 'rb') as f:
+            self.assertEqual(source_data, f.read())
+        self.assertEqual([name for name in os.listdir(os.path.dirname(output_vmd)) if name.endswith('.tmp')], [])
+
+    def test_vmd_signed_interp(self):
+        from mmd_tools.core.vmd import bulk
+        rng = random.Random(0)
+        bone_keys, camera_keys = [], []
+        for i in range(10):
+            k = vmd.BoneFrameKey()
+            k.frame_number, k.location, k.rotation = i, [0, 0, i], [0, 0, 0, 1]
+            k.interp = [rng.randint(-128, 127) for j in range(64)]
+            bone_keys.append(k)
+            k = vmd.CameraKeyFrameKey()
+            k.frame_number, k.distance, k.location, k.rotation = i, -45.0, [0, 10, 0], [0, 0, 0]
+            k.interp = [rng.randint(-128, 127) for j in range(24)]
+            k.angle, k.persp = 30, True
+            camera_keys.append(k)
+
+        # packed in bulk, the same bytes as the keys save one by one
+        name_data = struct.pack('<15s', vmd._toShiftJisBytes('bone'))
+        records = bulk._key_records(bone_keys, vmd.BoneFrameKey)
+        records['name'] = name_data
+        self.assertEqual(records.tobytes(), bulk._save_keys(bone_keys, name_data))
+        records = bulk._key_records(camera_keys, vmd.CameraKeyFrameKey)
+        self.assertEqual(records.tobytes(), bulk._save_keys(camera_keys))
+
+        output_vmd = os.path.join(TESTS_DIR, 'output', 'signed_interp.vmd')
+        motion = bulk.ColumnarFile.empty_like(vmd.File())
+        motion.boneAnimation['bone'] = bulk.BoneKeyArrays.from_frame_keys(bone_keys)
+        motion.cameraAnimation.extend(camera_keys)
+        motion.save(filepath=output_vmd)
+        result = vmd.File()
+        result.load(filepath=output_vmd)
+        self.assertEqual(self.__dump(result.boneAnimation['bone']), self.__dump(bone_keys))
+        self.assertEqual(self.__dump(list(result.cameraAnimation)), self.__dump(camera_keys))
+
+        bone_keys[0].interp[0] = 128
+        with self.assertRaises(bulk._UnpackableKeys):
+            bulk._key_records(bone_keys, vmd.BoneFrameKey)
+        bone_keys[0].interp[0] = 1.0
+        with self.assertRaises(bulk._UnpackableKeys):
+            bulk._key_records(bone_keys, vmd.BoneFrameKey)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
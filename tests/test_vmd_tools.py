@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+from mmd_tools.core import vmd
+from mmd_tools.core.vmd import tools
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(TESTS_DIR, 'benchmarks'))
+import synthetic
+
+class TestVmdTools(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+        self.__filepath = os.path.join(TESTS_DIR, 'output', 'tools.vmd')
+        synthetic.make_vmd(self.__filepath, bones=20, morphs=10, motion_keys=30)
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __keys(self, motion):
+        ''' Load ``motion`` as the usual vmd objects: {(kind, name): {frame: key values}}
+        '''
+        filepath = os.path.join(TESTS_DIR, 'output', 'tools_result.vmd')
+        tools.save(motion, filepath)
+        f = vmd.File()
+        f.load(filepath=filepath)
+        ret = {}
+        for name, keys in f.boneAnimation.items():
+            ret[('bone', name)] = {k.frame_number:(k.location, k.rotation, k.interp) for k in keys}
+            self.assertEqual(len(ret[('bone', name)]), len(keys))
+        for name, keys in f.shapeKeyAnimation.items():
+            ret[('morph', name)] = {k.frame_number:k.weight for k in keys}
+            self.assertEqual(len(ret[('morph', name)]), len(keys))
+        ret[('camera', None)] = {k.frame_number:k.distance for k in f.cameraAnimation}
+        ret[('property', None)] = {k.frame_number:k.ik_states for k in f.propertyAnimation}
+        return ret
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_merge(self):
+        motion = tools.load(self.__filepath)
+        source = self.__keys(motion)
+        shifted = self.__keys(tools.shift(motion, 1))
+        result = self.__keys(tools.merge(motion, tools.shift(motion, 1)))
+        self.assertEqual(set(result.keys()), set(source.keys()))
+        for track, keys in result.items():
+            expected = dict(source[track])
+            expected.update(shifted[track])
+            self.assertEqual(keys, expected, track)
+
+        bones, morphs = tools.split_names(motion, list(motion.boneAnimation)[:5], list(motion.shapeKeyAnimation)[:2])
+        self.assertEqual(len(bones.boneAnimation), 5)
+        self.assertEqual(len(bones.cameraAnimation), 0)
+        self.assertEqual(len(morphs.boneAnimation), 15)
+        self.assertEqual(self.__keys(tools.merge(morphs, bones)), source)
+
+    def test_frames(self):
+        motion = tools.load(self.__filepath)
+        source = self.__keys(motion)
+
+        result = self.__keys(tools.trim(motion, (10, 40)))
+        for track, keys in source.items():
+            expected = {frame:value for frame, value in keys.items() if 10 <= frame <= 40}
+            self.assertEqual(result.get(track, {}), expected, track)
+
+        shots = tools.split_frames(motion, [20, 50], rebase=True)
+        self.assertEqual(len(shots), 3)
+        result = self.__keys(tools.merge(shots[0], tools.shift(shots[1], 20), tools.shift(shots[2], 50)))
+        self.assertEqual(result, source)
+
+        result = self.__keys(tools.shift(motion, -10))
+        for track, keys in source.items():
+            expected = {frame - 10:value for frame, value in keys.items() if frame >= 10}
+            self.assertEqual(result.get(track, {}), expected, track)
+
+        result = self.__keys(tools.rescale(motion, 2.0))
+        for track, keys in source.items():
+            self.assertEqual(result[track], {frame*2:value for frame, value in keys.items()}, track)
+        result = self.__keys(tools.rescale(motion, 0.5))
+        for track, keys in source.items():
+            self.assertEqual(set(result[track]), {round(frame*0.5) for frame in keys}, track)
+        with self.assertRaises(ValueError):
+            tools.rescale(motion, 0)
+
+    def test_empty_tracks(self):
+        motion = tools.load(self.__filepath)
+        source = self.__keys(motion)
+        bone_names = list(motion.boneAnimation)[:3]
+        selected = tools.select(motion, bone_names, ())
+        self.assertEqual(len(selected.shapeKeyAnimation), 0)
+        for result in (tools.trim(selected, (10, 40)), tools.shift(selected, 5), tools.rescale(selected, 2.0),
+                       tools.merge(selected, tools.select(motion, (), ())), tools.select(selected)):
+            keys = self.__keys(result)
+            self.assertEqual({kind for kind, name in keys if kind == 'morph'}, set())
+            self.assertEqual({name for kind, name in keys if kind == 'bone'}, set(bone_names))
+        result = self.__keys(tools.trim(selected, (10, 40)))
+        for name in bone_names:
+            expected = {frame:value for frame, value in source[('bone', name)].items() if 10 <= frame <= 40}
+            self.assertEqual(result.get(('bone', name), {}), expected, name)
+
+    def test_header(self):
+        motion = tools.load(self.__filepath)
+        header = (motion.header.signature, motion.header.model_name)
+        self.assertIsNotNone(header[0])
+        results = [tools.trim(motion, (10, 40)), tools.shift(motion, 5), tools.rescale(motion, 2.0),
+                   tools.merge(motion, motion), tools.select(motion, (), ()), tools.rename(motion, {}, {})]
+        results += tools.split_frames(motion, [20]) + list(tools.split_names(motion))
+        for result in results:
+            self.assertEqual((result.header.signature, result.header.model_name), header)
+            self.assertIsNot(result.header, motion.header)
+
+    def test_rename(self):
+        motion = tools.load(self.__filepath)
+        source = self.__keys(motion)
+        bone_names = list(motion.boneAnimation)
+        ik_name, ik_state = motion.propertyAnimation[0].ik_states[0]
+        bone_map = {bone_names[0]:'renamed', bone_names[1]:bone_names[2], ik_name:'IK'}
+        result = self.__keys(tools.rename(motion, bone_map, {list(motion.shapeKeyAnimation)[0]:'表情'}))
+        self.assertNotIn(('bone', bone_names[0]), result)
+        self.assertEqual(result[('bone', 'renamed')], source[('bone', bone_names[0])])
+        expected = dict(source[('bone', bone_names[1])])
+        expected.update(source[('bone', bone_names[2])])
+        self.assertEqual(result[('bone', bone_names[2])], expected)
+        self.assertIn(('morph', '表情'), result)
+        self.assertIn(('IK', ik_state), list(result[('property', None)].values())[0])
+        self.assertEqual(motion.propertyAnimation[0].ik_states[0][0], ik_name)
+
+    def test_sampler(self):
+        import numpy as np
+        from mmd_tools.core.vmd import bezier, bulk, sampler
+        motion = tools.load(self.__filepath)
+        motion.boneAnimation['single'] = list(motion.boneAnimation.values())[0].take([3])
+        frames = np.append(np.random.RandomState(0).uniform(-10, 120, 200), np.arange(100))
+        bone_sampler = sampler.MotionSampler(motion, morph_names=list(motion.shapeKeyAnimation)[::2])
+        locations, rotations = bone_sampler.bones(frames)
+        weights = bone_sampler.morphs(frames)
+        self.assertEqual(locations.shape, (len(frames), len(motion.boneAnimation), 3))
+        self.assertEqual(rotations.shape, (len(frames), len(motion.boneAnimation), 4))
+        self.assertEqual(weights.shape, (len(frames), 5))
+
+        for i, name in enumerate(bone_sampler.bone_names):
+            keys = bulk.unique_frames(motion.boneAnimation[name])
+            key_frames = keys.frame_number.astype(np.float64)
+            for frame, location, rotation in zip(frames, locations[:, i], rotations[:, i]):
+                end = min(max(np.searchsorted(key_frames, frame, side='right'), 1), len(keys) - 1)
+                if len(keys) == 1 or frame >= key_frames[end]:
+                    end, ratio = len(keys) - 1, np.ones(4)
+                elif frame <= key_frames[0]:
+                    end, ratio = max(end, 1), np.zeros(4)
+                else:
+                    x = (frame - key_frames[end - 1]) / (key_frames[end] - key_frames[end - 1])
+                    ratio = bezier.bezier_ratio(keys.interp[end][sampler._CURVE_INDICES], x)
+                start = max(end - 1, 0)
+                loc0, loc1 = keys.location[[start, end]].astype(np.float64)
+                np.testing.assert_allclose(location, loc0 + (loc1 - loc0) * ratio[:3], atol=1e-6)
+                q0, q1 = keys.rotation[[start, end]].astype(np.float64)
+                q0, q1 = q0 / np.linalg.norm(q0), q1 / np.linalg.norm(q1)
+                q1 = -q1 if np.dot(q0, q1) < 0 else q1
+                angle = np.arccos(min(np.dot(q0, q1), 1.0))
+                if angle > 1e-6:
+                    expected = (np.sin((1 - ratio[3])*angle)*q0 + np.sin(ratio[3]*angle)*q1) / np.sin(angle)
+                else:
+                    expected = q1
+                np.testing.assert_allclose(rotation, expected, atol=1e-6)
+
+        for i, name in enumerate(bone_sampler.morph_names):
+            keys = bulk.unique_frames(motion.shapeKeyAnimation[name])
+            np.testing.assert_allclose(weights[:, i], np.interp(frames, keys.frame_number, keys.weight), atol=1e-6)
+
+        x1, x2, x = np.random.RandomState(0).uniform(0, 1, (3, 10000))
+        t = bezier.bezier_t(x1, x2, x)
+        self.assertLessEqual(np.abs(3*(1 - t)**2*t*x1 + 3*(1 - t)*t*t*x2 + t**3 - x).max(), 1e-12)
+
+        points = np.array([[0, 0], [10, 1], [12, -1], [30, 2]], dtype=np.float64)
+        pieces = bezier.split_by_x(points, np.arange(1, 30))
+        np.testing.assert_allclose(pieces[:, 3, 0], np.arange(1, 31), atol=1e-9)
+        np.testing.assert_array_equal(pieces[1:, 0], pieces[:-1, 3])
+        t = bezier.solve_x(points, pieces[:, 3, 0])
+        np.testing.assert_allclose(pieces[:, 3, 1], np.dot(np.stack(bezier.bezier_basis(t), axis=-1), points[1:, 1]), atol=1e-9)
+
+    def test_reduce(self):
+        import numpy as np
+        from mmd_tools.core.vmd import bulk, reduction, sampler
+        motion = tools.load(self.__filepath)
+        dense = tools.select(motion, bone_names=(), morph_names=())
+        linear = bulk.bone_interpolation([[[20, 20], [107, 107]]]*4)
+        for name, keys in motion.boneAnimation.items():
+            frames = np.arange(keys.frame_number.min(), keys.frame_number.max() + 1)
+            locations, rotations = sampler.sample_bone_keys(bulk.unique_frames(keys), frames)
+            dense.boneAnimation[name] = bulk.BoneKeyArrays.from_columns(frames, locations, rotations, np.repeat(linear, len(frames), axis=0))
+        for name, keys in motion.shapeKeyAnimation.items():
+            frames = np.arange(keys.frame_number.min(), keys.frame_number.max() + 1)
+            dense.shapeKeyAnimation[name] = bulk.ShapeKeyArrays.from_columns(frames, sampler.sample_shape_keys(bulk.unique_frames(keys), frames))
+
+        result, report = reduction.reduce_keys(dense, location_tolerance=0.01, rotation_tolerance=0.1, weight_tolerance=0.001)
+        self.assertEqual(report.bone_keys, sum(map(len, dense.boneAnimation.values())))
+        self.assertEqual(report.reduced_bone_keys, sum(map(len, result.boneAnimation.values())))
+        self.assertGreater(report.removed_bone_keys, report.bone_keys // 3)
+        self.assertLessEqual(report.reduced_morph_keys, sum(map(len, motion.shapeKeyAnimation.values())))
+        self.assertEqual(len(result.cameraAnimation), len(motion.cameraAnimation))
+        self.assertLessEqual(report.location_error, 0.01)
+        self.assertLessEqual(report.rotation_error, 0.1)
+        self.assertLessEqual(report.weight_error, 0.001)
+
+        output_vmd = os.path.join(TESTS_DIR, 'output', 'tools_reduced.vmd')
+        tools.save(result, output_vmd)
+        result = tools.load(output_vmd)
+        for name, keys in dense.boneAnimation.items():
+            frames = keys.frame_number.astype(np.int64)
+            locations, rotations = sampler.sample_bone_keys(result.boneAnimation[name], frames)
+            self.assertLessEqual(np.linalg.norm(locations - keys.location, axis=1).max(), report.location_error + 1e-6, name)
+            cos = np.abs(np.sum(rotations * sampler.sample_bone_keys(keys, frames)[1], axis=1))
+            self.assertLessEqual(np.degrees(2*np.arccos(np.minimum(cos, 1))).max(), report.rotation_error + 1e-3, name)
+        for name, keys in dense.shapeKeyAnimation.items():
+            weights = sampler.sample_shape_keys(result.shapeKeyAnimation[name], keys.frame_number)
+            self.assertLessEqual(np.abs(weights - keys.weight).max(), report.weight_error + 1e-6, name)
+
+    def test_command_line(self):
+        output_vmd = os.path.join(TESTS_DIR, 'output', 'tools_command.vmd')
+        tools.main(['trim', self.__filepath, output_vmd, '30-', '--rebase'])
+        expected = self.__keys(tools.shift(tools.trim(tools.load(self.__filepath), (30, None)), -30))
+        self.assertEqual(self.__keys(tools.load(output_vmd)), expected)
+        with self.assertRaises(SystemExit):
+            tools.main(['trim', self.__filepath, output_vmd, '30'])
+
+    def test_script(self):
+        import subprocess
+        if not os.path.basename(sys.executable).lower().startswith('python'):
+            self.skipTest('requires a python executable')
+        # a new interpreter without bpy, mmd_tools/__init__.py must not be imported
+        output_vmd = os.path.join(TESTS_DIR, 'output', 'tools_script.vmd')
+        subprocess.check_call([sys.executable, tools.__file__, 'shift', self.__filepath, output_vmd, '5'])
+        expected = self.__keys(tools.shift(tools.load(self.__filepath), 5))
+        self.assertEqual(self.__keys(tools.load(output_vmd)), expected)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()